@@ -0,0 +1,580 @@
+"""The five sales agents, their prompts and the pipeline that wires them together.
+
+Nothing here touches Streamlit: agents call the model through a ModelClient
+and stages report progress through ``emit``, so the same pipeline runs in the
+app and headless (``benchmarks/replay.py``).
+"""
+
+import threading
+
+from handoff import TABLE_NOTE, company_id, handoff_table, index_by_id, lead_id
+from json_stream import stream_objects
+from llm_gateway import fan_out, fan_out_iter
+from pipeline_engine import Pipeline, Stage
+from rag_index import format_retrieved
+from response_cache import CachedResponse, cache_enabled, make_key, normalize_prompt
+from structured_output import SCHEMAS, json_mode, parse_structured, repair_note, request_object
+
+
+# ---------------------------------------------
+# MODEL CLIENT
+# ---------------------------------------------
+class ModelClient:
+    """``client(prompt, agent=None, on_text=None) -> (response, model_name)`` over a ModelRouter.
+
+    Repeats are served from ``cache`` (a DiskCache, or None for no cache)
+    while the ``cache_enabled`` context flag is on. Only replies that pass
+    ``reply_is_usable`` are stored or served, so a truncated or malformed
+    reply is asked for again rather than replayed. With ``on_text`` the reply
+    is streamed and each piece is passed to it as it arrives; a cached reply is
+    passed in one piece. Agents with a declared output schema get the
+    provider's native JSON mode.
+    """
+
+    def __init__(self, router, cache=None):
+        self.router = router
+        self.cache = cache
+
+    def __call__(self, prompt, agent=None, on_text=None):
+        if not self.router.providers:
+            raise Exception("No valid API Key detected.")
+        use_cache = self.cache is not None and cache_enabled.get()
+        if use_cache:
+            normalized = normalize_prompt(prompt)
+            cache_keys = {
+                make_key(provider, model, normalized): model for provider, model in self.router.cache_labels(agent)
+            }
+            hit = self.cache.get_first(cache_keys, accept=lambda text: reply_is_usable(agent, text))
+            if hit is not None:
+                if on_text:
+                    on_text(hit[1])
+                return CachedResponse(hit[1]), cache_keys[hit[0]]
+        text, provider, model_name = self.router.generate(
+            prompt, agent=agent, on_text=on_text, json_mode=json_mode(agent))
+        if use_cache and reply_is_usable(agent, text):
+            self.cache.set(make_key(provider, model_name, normalized), text)
+        return CachedResponse(text), model_name
+
+
+def reply_is_usable(agent, text):
+    """Whether a reply parses the way its agent needs: every object valid for a schema agent, rows for the Scout."""
+    if agent in SCHEMAS:
+        valid, problems = parse_structured(agent, text)
+        return bool(valid) and not problems
+    if agent == "scout":
+        return bool(parse_leads_table(text))
+    return bool(str(text or "").strip())
+
+
+# ---------------------------------------------
+# PARSING
+# ---------------------------------------------
+def parse_leads_table(raw_text):
+    """Leads from the Scout's pipe table, each with a stable ``id``; a company listed twice is kept once."""
+    leads = []
+    seen = set()
+    for line in str(raw_text or "").split("\n"):
+        if "|" not in line or "Company" in line or "---" in line:
+            continue
+        cols = [c.strip() for c in line.strip().strip("|").split("|")]
+        if len(cols) < 8 or company_id(cols[0]) in seen:
+            continue
+        seen.add(company_id(cols[0]))
+        leads.append({
+            "id": company_id(cols[0]),
+            "company": cols[0],
+            "address": cols[1],
+            "first_name": cols[2],
+            "last_name": cols[3],
+            "email": "",
+            "phone": cols[4],
+            "decision_maker_role": cols[5] if len(cols) > 5 else "",
+            "why_need": cols[6] if len(cols) > 6 else "",
+            "sector": cols[7] if len(cols) > 7 else "",
+            "deal_size": cols[8] if len(cols) > 8 else "",
+            "person_linkedin": cols[9] if len(cols) > 9 else "",
+        })
+    return leads
+
+# ─────────────────────────────────────────────
+# FIX 3: RAG CONTEXT BUILDER
+# ─────────────────────────────────────────────
+def build_rag_context(our_product, our_company, region, target_client, leads_data, strategy_data):
+    """FIX 3: Build RAG knowledge base from all pipeline data"""
+    context = f"""
+=== COMPANY KNOWLEDGE BASE ===
+Company: {our_company}
+Offering: {our_product}
+Target Region: {region}
+Ideal Clients: {target_client}
+
+=== DISCOVERED LEADS ===
+"""
+    for i, lead in enumerate(leads_data[:10]):
+        context += f"""
+Lead {i+1}: {lead.get('company', '')}
+- Contact: {lead.get('first_name', '')} {lead.get('last_name', '')} ({lead.get('decision_maker_role', '')})
+- Address: {lead.get('address', '')}
+- Phone: {lead.get('phone', '')}
+- Sector: {lead.get('sector', '')}
+- Deal Size: {lead.get('deal_size', '')}
+- Why They Need Us: {lead.get('why_need', '')}
+"""
+
+    if strategy_data:
+        context += "\n=== STRATEGIC ANALYSIS ===\n"
+        for s in strategy_data[:5]:
+            context += f"""
+{s.get('company', '')}: Priority={s.get('priority', '')} Score={s.get('deal_score', '')}
+Value Prop: {s.get('our_value_prop', '')}
+Pain Points: {', '.join(s.get('pain_points', []))}
+"""
+    return context
+
+def search_documents(kb, question, owner, k=4):
+    """Chunks from the owner's uploaded brochures / rate cards, formatted for a prompt."""
+    if kb is None or not owner:
+        return ""
+    return format_retrieved(kb.search(question, owner, k=k, kinds=("document",)))
+
+def rag_query(llm, question, context, our_company, our_product, kb=None, owner=None, run_id=None, all_runs=False,
+              k=6, on_text=None):
+    """Answer questions using RAG — retrieves the top-k chunks then generates
+
+    Pipeline chunks come from run ``run_id``, or from every run of ``owner``
+    when ``all_runs`` is set; with neither there is no saved run to search.
+    """
+    searchable = all_runs or run_id is not None
+    if not context and (kb is None or not searchable):
+        return "No pipeline data available yet. Run the pipeline first."
+
+    if kb is not None and owner:
+        try:
+            docs = kb.search(question, owner, k=k, run_id=None if all_runs else run_id) if searchable else []
+            if docs:
+                context = (
+                    f"Company: {our_company}\nOffering: {our_product}\n\n"
+                    "=== RETRIEVED PIPELINE DATA ===\n" + format_retrieved(docs)
+                )
+        except Exception:
+            pass  # fall back to the full context string
+        try:
+            reference = search_documents(kb, question, owner)
+            if reference:
+                context += "\n\n=== REFERENCE DOCUMENTS ===\n" + reference
+        except Exception:
+            pass
+
+    prompt = f"""You are an intelligent B2B sales assistant for {our_company}.
+
+KNOWLEDGE BASE (Retrieved Context):
+{context}
+
+OUR OFFERING: {our_product}
+
+USER QUESTION: {question}
+
+Instructions:
+- Answer ONLY using the information in the knowledge base above
+- Be specific with company names, contact details, and deal sizes
+- If the information is not in the knowledge base, say so clearly
+- Give actionable recommendations
+- Format your response clearly with bullet points where appropriate
+
+Answer:"""
+    
+    try:
+        response, _ = llm(prompt, agent="rag_qa", on_text=on_text)
+        return response.text
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# ---------------------------------------------
+# AGENTS
+# ---------------------------------------------
+# A phrase only each agent's prompt contains, for code that sees nothing but
+# the prompt text (the replay backend). Checked in this order.
+PROMPT_MARKERS = [
+    ("scout", "B2B Lead Intelligence Scout"),
+    ("strategist", "senior B2B growth strategist"),
+    ("communicator", "expert B2B sales communicator"),
+    ("autoresponder", "Simulate client reply"),
+    ("rag_insights", "B2B market intelligence analyst"),
+    ("rag_qa", "intelligent B2B sales assistant"),
+    ("manual_reply", "CLIENT SAID:"),
+]
+
+def classify_prompt(prompt):
+    """The agent that wrote ``prompt``, or None."""
+    for agent, marker in PROMPT_MARKERS:
+        if marker in prompt:
+            return agent
+    return None
+
+def agent_gemini_scout(llm, region, target_client, my_product, our_product, num_leads):
+    prompt = (
+        "You are a B2B Lead Intelligence Scout. Find " + str(num_leads) + " REAL corporate businesses in " + region + ".\n\n"
+        "TARGET CLIENT TYPE: " + target_client + "\n"
+        "WHAT WE SELL: " + my_product + "\n"
+        "OUR FULL OFFERING: " + our_product + "\n\n"
+        "Return ONLY a pipe-separated table:\n"
+        "Company Name | Full Address | Manager First Name | Manager Last Name | Phone | Decision Maker Role | Why They Need Us | Industry Sector | Estimated Deal Size | Person LinkedIn URL\n\n"
+        "RULES:\n"
+        "- Use REAL company names that exist in " + region + "\n"
+        "- Find actual First Name and Last Name of regional executives\n"
+        "- For LinkedIn URL: provide the actual linkedin.com/in/username if known, otherwise write SEARCH\n"
+        "- Phone: Indian format with +91\n"
+        "- NO invented emails\n"
+        "- NO markdown, ONLY table rows\n"
+    )
+    response, model_name = llm(prompt, agent="scout")
+    return response.text, model_name
+
+def agent_gemini_strategist(llm, leads_text, our_product, our_company, my_product, reply_tone, on_item=None, note=""):
+    prompt = (
+        "You are a senior B2B growth strategist.\n\n"
+        "Leads (" + TABLE_NOTE + "):\n" + leads_text + "\n\n"
+        "Our Company: " + our_company + "\n"
+        "Our Offering: " + our_product + "\n"
+        "Product: " + my_product + "\n"
+        "Tone: " + reply_tone + "\n\n"
+        "Return ONLY valid JSON array. No markdown.\n"
+        "Each object MUST have:\n"
+        "- id (copied from the lead's row), company, first_name, last_name, person_linkedin\n"
+        "- deal_score (1-100), priority (HOT/WARM/COLD)\n"
+        "- our_value_prop, pain_points (array), opening_hook\n"
+        "- linkedin_connection_note, objection_handling\n"
+        "- estimated_value, urgency_signal, recommended_approach\n"
+        + (note + "\n" if note else "") +
+        "Start with [ end with ]"
+    )
+    response, _ = llm(prompt, agent="strategist", on_text=stream_objects(on_item))
+    return response.text
+
+def agent_gemini_communicator(llm, strategy_data, leads_data, our_product, our_company, our_contact, our_website, our_email,
+                              reply_tone, on_item=None, note=""):
+    prompt = (
+        "You are an expert B2B sales communicator for " + our_company + ".\n\n"
+        "OUR OFFERING: " + our_product + "\n"
+        "CONTACT: " + our_contact + "\n"
+        "EMAIL: " + our_email + "\n"
+        "WEBSITE: " + our_website + "\n"
+        "TONE: " + reply_tone + "\n\n"
+        "LEADS WITH STRATEGY (" + TABLE_NOTE + "):\n" + handoff_table("communicator", leads_data, strategy_data) + "\n\n"
+        "For each lead write:\n"
+        "1. WhatsApp message (max 200 words)\n"
+        "2. Email (Subject + Body, include website " + our_website + ")\n"
+        "3. LinkedIn note (under 300 chars)\n\n"
+        "Return ONLY valid JSON array. No markdown.\n"
+        "Each object: id (copied from the lead's row), company, first_name, last_name,\n"
+        "phone, email, person_linkedin, whatsapp_message, email_subject, email_body, linkedin_note,\n"
+        "best_time_to_contact, follow_up_day\n"
+        + (note + "\n" if note else "") +
+        "Start with [ end with ]"
+    )
+    response, _ = llm(prompt, agent="communicator", on_text=stream_objects(on_item))
+    return response.text
+
+def agent_gemini_autoresponder(llm, lead_data, strategy, messages, our_product, our_company, reply_tone, note=""):
+    prompt = (
+        "You are a sales AI for " + our_company + ".\n\n"
+        "OUR OFFERING: " + our_product + "\n"
+        "TONE: " + reply_tone + "\n\n"
+        "LEAD: " + str(lead_data.get("company", "")) + " - " + str(lead_data.get("first_name", "")) + "\n"
+        "PRIORITY: " + str(strategy.get("priority", "WARM")) + "\n"
+        "PAIN POINTS: " + str(strategy.get("pain_points", [])) + "\n\n"
+        "TASK: Simulate client reply + our automated response.\n"
+        "Return ONLY valid JSON object. No markdown.\n"
+        "Keys: simulated_client_reply, reply_scenario, auto_response_whatsapp,\n"
+        "auto_response_email, next_action, escalate_to_human (bool), escalation_reason\n"
+        + (note + "\n" if note else "") +
+        "Start with { end with }"
+    )
+    response, _ = llm(prompt, agent="autoresponder")
+    return response.text
+
+def agent_gemini_rag_insights(llm, leads_data, strategy_data, our_product, our_company, region, history="", documents="",
+                              on_text=None):
+    """FIX 3: RAG Agent — generates deep insights from all pipeline data"""
+    history_block = ("PAST RUNS (retrieved from knowledge base):\n" + history + "\n\n") if history else ""
+    if documents:
+        history_block += "OUR DOCUMENTS (brochures, rate cards, empanelment):\n" + documents + "\n\n"
+    prompt = (
+        "You are a B2B market intelligence analyst using RAG (Retrieval Augmented Generation).\n\n"
+        "RETRIEVED DATA:\n"
+        "Company: " + our_company + "\n"
+        "Offering: " + our_product + "\n"
+        "Region: " + region + "\n"
+        "Total Leads: " + str(len(leads_data)) + "\n\n"
+        "TOP LEADS WITH STRATEGY (" + TABLE_NOTE + "):\n"
+        + handoff_table("rag_insights", leads_data[:5], strategy_data[:5]) + "\n\n"
+        + history_block +
+        "Generate a comprehensive intelligence report with:\n"
+        "1. TOP 3 highest-priority targets and why\n"
+        "2. Market opportunity size in this region\n"
+        "3. Common pain points across all leads\n"
+        "4. Best outreach strategy for this market\n"
+        "5. Risk factors to be aware of\n"
+        "6. Revenue forecast if 20% conversion rate\n"
+        "7. Recommended follow-up sequence (Day 1, Day 3, Day 7, Day 14)\n\n"
+        "Be specific with company names and numbers. Format with clear sections."
+    )
+    response, _ = llm(prompt, agent="rag_insights", on_text=on_text)
+    return response.text
+
+def agent_gemini_manual_reply(llm, client_reply, reply_company, our_product, our_company, reply_tone, note=""):
+    prompt = (
+        "You are the sales AI for " + our_company + ".\n"
+        "OUR OFFERING: " + our_product + "\n"
+        "TONE: " + reply_tone + "\n"
+        "COMPANY: " + reply_company + "\n"
+        "CLIENT SAID: " + client_reply + "\n\n"
+        "Write a response that addresses their message, provides relevant info, and moves toward a meeting.\n"
+        "Return ONLY valid JSON: {whatsapp_reply, email_reply, next_step}\n"
+        + (note + "\n" if note else "") +
+        "Start with { end with }"
+    )
+    response, _ = llm(prompt, agent="manual_reply")
+    return response.text
+
+# ---------------------------------------------
+# SHARDED AGENTS
+# ---------------------------------------------
+def chunk_list(items, size):
+    size = max(1, int(size))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _lead_key(item, wanted):
+    """The ID in ``wanted`` an item answers for, by its echoed ID and then its company name; None if neither."""
+    key = item.get("id") if item.get("id") in wanted else company_id(item.get("company"))
+    return key if key in wanted else None
+
+def _collect(agent, shard, raw, found, extras, streamed=()):
+    """File the valid items of one reply under their leads; returns ``(missing leads, problems)``.
+
+    Items are matched on the ID the model echoed, then on the company name,
+    and carry their lead's ID from then on. An item that matches neither (a
+    reworded name, no ID) is never guessed onto a lead: it goes to ``extras``
+    and its lead stays missing, so the re-ask names it by ID. When the call
+    failed, the items it had already ``streamed`` are filed instead.
+    """
+    wanted = {lead_id(lead) for lead in shard}
+    if isinstance(raw, Exception):
+        valid, problems = list(streamed), ["the call failed"]
+    else:
+        valid, problems = parse_structured(agent, raw)
+    for item in valid:
+        key = _lead_key(item, wanted)
+        if key:
+            found.setdefault(key, dict(item, id=key))
+        else:
+            extras.append(item)
+    missing = [lead for lead in shard if lead_id(lead) not in found]
+    problems += [f"no valid object for {lead.get('company')}" for lead in missing]
+    return missing, problems
+
+def _valid_only(agent, on_item):
+    """``on_item`` for streamed objects that pass ``agent``'s schema, coerced as ``parse_structured`` returns them."""
+    def relay(obj):
+        item, problems = SCHEMAS[agent].check(obj)
+        if not problems:
+            on_item(item)
+    return relay
+
+def _stream_filter(agent, shard, on_item, drawn, lock, streamed):
+    """``on_item`` for one call that passes on only what ``_collect`` will file.
+
+    A streamed object is drawn once it is valid for ``agent``'s schema and
+    matched to a lead of ``shard`` not drawn yet, so nothing is shown that
+    the re-ask would replace. Drawn items are kept in ``streamed``.
+    """
+    if on_item is None:
+        return None
+    wanted = {lead_id(lead) for lead in shard}
+
+    def relay(obj):
+        item, problems = SCHEMAS[agent].check(obj)
+        key = None if problems else _lead_key(item, wanted)
+        if key is None:
+            return
+        with lock:
+            if key in drawn:
+                return
+            drawn.add(key)
+        streamed.append(dict(item, id=key))
+        on_item(streamed[-1])
+
+    return relay
+
+def run_sharded_agent(agent, agent_call, shards, max_workers, on_item=None):
+    """Run ``agent_call(shard, note, on_item)`` for every shard in parallel, validating each reply against ``agent``'s schema.
+
+    Every valid item is kept, even from a reply that is cut short or a stream
+    that broke part-way. The leads a reply left out or answered with an item
+    that matched no lead are asked about once more, in one call per shard
+    with a note on what went wrong. Items that matched no lead are kept at the
+    end, except those the re-ask superseded. ``on_item`` sees each lead's
+    item once, as soon as it streams in valid. Items follow lead order.
+    Returns (items, companies still without a valid item).
+    """
+    found, extras, retries = {}, [], []
+    drawn, lock = set(), threading.Lock()
+
+    def run(jobs):
+        streams = [[] for _ in jobs]
+        relays = [_stream_filter(agent, shard, on_item, drawn, lock, streams[i]) for i, (shard, _) in enumerate(jobs)]
+        for idx, raw in fan_out_iter(lambda i: agent_call(jobs[i][0], jobs[i][1], relays[i]), range(len(jobs)),
+                                     max_workers):
+            yield idx, raw, streams[idx]
+
+    for idx, raw, streamed in run([(shard, "") for shard in shards]):
+        unmatched = []
+        missing, problems = _collect(agent, shards[idx], raw, found, unmatched, streamed)
+        if missing:
+            retries.append((missing, repair_note(agent, problems), unmatched))
+        else:
+            extras += unmatched
+    failed = []
+    for idx, raw, streamed in run([job[:2] for job in retries]):
+        unmatched = []
+        missing, _ = _collect(agent, retries[idx][0], raw, found, unmatched, streamed)
+        extras += unmatched or (retries[idx][2] if missing else [])
+        failed += [str(lead.get("company", "")) for lead in missing]
+    keys = dict.fromkeys(lead_id(lead) for shard in shards for lead in shard)
+    return [found[key] for key in keys if key in found] + extras, failed
+
+def agent_gemini_strategist_sharded(llm, leads_data, our_product, our_company, my_product, reply_tone,
+                                    shard_size, max_workers, on_item=None):
+    return run_sharded_agent(
+        "strategist",
+        lambda shard, note, on_valid: agent_gemini_strategist(
+            llm, handoff_table("strategist", shard), our_product, our_company, my_product, reply_tone,
+            on_item=on_valid, note=note),
+        chunk_list(leads_data, shard_size), max_workers, on_item=on_item)
+
+def agent_gemini_communicator_sharded(llm, strategy_data, leads_data, our_product, our_company, our_contact, our_website,
+                                      our_email, reply_tone, shard_size, max_workers, on_item=None):
+    strategy_by_id = index_by_id(strategy_data)
+
+    def call(shard, note, on_valid):
+        shard_strategy = [strategy_by_id[lead_id(l)] for l in shard if lead_id(l) in strategy_by_id]
+        return agent_gemini_communicator(llm, shard_strategy, shard, our_product, our_company, our_contact,
+                                         our_website, our_email, reply_tone, on_item=on_valid, note=note)
+
+    return run_sharded_agent("communicator", call, chunk_list(leads_data, shard_size), max_workers,
+                             on_item=on_item)
+
+# ---------------------------------------------
+# PIPELINE STAGES
+# ---------------------------------------------
+def stage_scout(inputs, emit):
+    cfg = inputs["settings"]
+    raw_leads, _ = agent_gemini_scout(inputs["llm"], cfg["region"], cfg["target_client"], cfg["my_product"], cfg["our_product"], cfg["num_leads"])
+    leads = parse_leads_table(raw_leads)
+    emit("leads", leads)  # lets streamed cards find their lead's position and email
+    return {"gemini_raw": raw_leads, "leads": leads}
+
+def stage_strategist(inputs, emit):
+    cfg = inputs["settings"]
+    leads = inputs["leads"]
+    if not leads:
+        # Nothing parsed from the Scout's table: let the Strategist read it as written.
+        strategy_raw = agent_gemini_strategist(
+            inputs["llm"], inputs["gemini_raw"], cfg["our_product"], cfg["our_company"], cfg["my_product"],
+            cfg["reply_tone"], on_item=_valid_only("strategist", lambda item: emit("strategy_item", item)))
+        return {"strategy": parse_structured("strategist", strategy_raw)[0]}
+    strategy, failed = agent_gemini_strategist_sharded(
+        inputs["llm"], leads, cfg["our_product"], cfg["our_company"], cfg["my_product"], cfg["reply_tone"],
+        cfg["shard_size"] if cfg["shard_agents"] else len(leads), cfg["max_parallel_calls"],
+        on_item=lambda item: emit("strategy_item", item))
+    if failed:
+        emit("warning", "Strategist could not analyse: " + ", ".join(failed))
+    return {"strategy": strategy}
+
+def stage_communicator(inputs, emit):
+    cfg = inputs["settings"]
+    leads = inputs["leads"] or inputs["strategy"]
+    messages, failed = agent_gemini_communicator_sharded(
+        inputs["llm"], inputs["strategy"], leads, cfg["our_product"], cfg["our_company"], cfg["our_contact"],
+        cfg["our_website"], cfg["our_email"], cfg["reply_tone"], cfg["shard_size"] if cfg["shard_agents"] else len(leads),
+        cfg["max_parallel_calls"], on_item=lambda item: emit("message_item", item))
+    if failed:
+        emit("warning", "Communicator could not draft messages for: " + ", ".join(failed))
+    return {"messages": messages}
+
+def stage_auto_responder(inputs, emit):
+    cfg = inputs["settings"]
+    strategy_list = inputs["strategy"]
+    messages_by_id = index_by_id(inputs["messages"])
+    hot_leads = [s for s in strategy_list if s.get("priority") in ["HOT", "WARM"]]
+
+    def simulate_reply_for(lead_strategy):
+        matching_msg = messages_by_id.get(lead_id(lead_strategy), {})
+        return request_object("autoresponder", lambda note: agent_gemini_autoresponder(
+            inputs["llm"], lead_strategy, lead_strategy, matching_msg, cfg["our_product"], cfg["our_company"],
+            cfg["reply_tone"], note=note))
+
+    auto_results = fan_out(simulate_reply_for, hot_leads, cfg["max_parallel_calls"])
+    auto_replies = []
+    failed = []
+    for i, (lead_strategy, auto_data) in enumerate(zip(hot_leads, auto_results)):
+        if isinstance(auto_data, Exception) or not auto_data:
+            failed.append(str(lead_strategy.get("company", "Lead " + str(i + 1))))
+            continue
+        auto_data["id"] = lead_id(lead_strategy)
+        auto_data["company"] = lead_strategy.get("company", "Lead " + str(i + 1))
+        auto_replies.append(auto_data)
+    if failed:
+        emit("warning", "Auto-Responder skipped: " + ", ".join(failed))
+    return {"auto_replies": auto_replies}
+
+def stage_rag(inputs, emit):
+    cfg = inputs["settings"]
+    history = documents = ""
+    kb = inputs.get("kb")
+    if kb is not None and cfg.get("owner"):
+        query = cfg["target_client"] + " " + cfg["my_product"] + " in " + cfg["region"]
+        try:
+            history = format_retrieved(kb.search(query, cfg["owner"], k=8))
+            documents = search_documents(kb, query, cfg["owner"])
+        except Exception as e:
+            emit("warning", "Knowledge base search failed: " + str(e))
+    rag_insights = agent_gemini_rag_insights(
+        inputs["llm"], inputs["leads"], inputs["strategy"], cfg["our_product"], cfg["our_company"], cfg["region"], history, documents,
+        on_text=lambda piece: emit("rag_text", piece))
+    rag_context = build_rag_context(
+        cfg["our_product"], cfg["our_company"], cfg["region"], cfg["target_client"], inputs["leads"], inputs["strategy"])
+    return {"rag_insights": rag_insights, "rag_context": rag_context}
+
+def stage_archive(inputs, emit):
+    """Persist the run and append its chunks to the knowledge-base index."""
+    cfg = inputs["settings"]
+    kb = inputs.get("kb")
+    if kb is None or not cfg.get("owner"):
+        return {"run_id": None}
+    run_id = kb.save_run(
+        cfg["owner"], cfg, inputs["leads"], inputs["strategy"], inputs["messages"],
+        inputs.get("auto_replies", []), inputs.get("rag_insights", ""))
+    try:
+        kb.index_run(run_id)
+    except Exception as e:
+        emit("warning", "Run saved; indexing will retry on restart: " + str(e))
+    return {"run_id": run_id}
+
+def build_agent_pipeline(auto_reply_enabled):
+    """Scout -> Strategist, then Communicator -> Auto-Responder alongside RAG, then archive.
+
+    Run it with ``{"settings": ..., "llm": ModelClient}`` and, to search past
+    runs and archive this one, ``"kb": KnowledgeBase``.
+    """
+    return Pipeline([
+        Stage("scout", stage_scout, inputs=["settings", "llm"], outputs=["gemini_raw", "leads"]),
+        Stage("strategist", stage_strategist, inputs=["settings", "llm", "gemini_raw", "leads"], outputs=["strategy"]),
+        Stage("communicator", stage_communicator, inputs=["settings", "llm", "strategy", "leads"], outputs=["messages"]),
+        Stage("auto", stage_auto_responder, inputs=["settings", "llm", "strategy", "messages"], outputs=["auto_replies"],
+              enabled=auto_reply_enabled),
+        Stage("rag", stage_rag, inputs=["settings", "llm", "leads", "strategy"], outputs=["rag_insights", "rag_context"],
+              optional=["kb"]),
+        Stage("archive", stage_archive, inputs=["settings", "leads", "strategy", "messages"], outputs=["run_id"],
+              optional=["kb", "auto_replies", "rag_insights"]),
+    ])
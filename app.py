@@ -1,14 +1,28 @@
-import html
 import json
 import random
-import time
-import urllib.parse
 from datetime import datetime
 
-import google.generativeai as genai
-import pandas as pd
 import streamlit as st
-import requests
+
+from agents import (
+    ModelClient, agent_gemini_manual_reply, build_agent_pipeline, build_rag_context, rag_query,
+)
+from cards import PENDING_EMAIL, auto_reply_card_html, esc, message_card_html, rag_box_html, strategy_card_html
+from handoff import index_by_id, lead_id
+from hunter_client import has_real_email
+from pipeline_engine import FAILED
+from mail_queue import FAILED as MAIL_FAILED, SENT as MAIL_SENT, build_message, is_email_address
+from lazy_imports import lazy_module
+from response_cache import cache_enabled
+from services import (
+    get_document_ingestor, get_hunter_client, get_knowledge_base, get_model_router,
+    get_outbound_queue, get_response_cache, get_streamlit_secret, init_telemetry, load_settings,
+)
+from static_assets import style_tag
+from structured_output import request_object
+from telemetry import REGISTRY, SPAN_METRIC, span, trace
+
+pd = lazy_module("pandas")
 
 try:
     import extra_streamlit_components as stx
@@ -43,6 +57,7 @@ st.set_page_config(
     page_icon="S",
     layout="wide",
 )
+init_telemetry()
 
 # ---------------------------------------------
 # AUTHENTICATION
@@ -59,267 +74,39 @@ if not auth.login_screen():
 # ---------------------------------------------
 # GLOBAL CSS
 # ---------------------------------------------
-st.markdown("""
-<style>
-    .stApp { background-color: #0a0d14; }
-    section[data-testid="stSidebar"] { background-color: #0f1219 !important; }
-    .header-banner {
-        background: linear-gradient(135deg, #0d1117 0%, #0a1929 50%, #0d1117 100%);
-        border: 1px solid #1e3a5f; border-radius: 16px;
-        padding: 28px 36px; margin-bottom: 20px;
-        display: flex; align-items: center; justify-content: space-between;
-    }
-    .header-title { font-size: 2rem; font-weight: 800; color: #fff; margin: 0; }
-    .header-sub { font-size: 0.92rem; color: #7a8ba0; margin-top: 6px; }
-    .header-badge {
-        background: linear-gradient(135deg, #7b2ff7, #f107a3);
-        color: white; padding: 8px 20px; border-radius: 20px;
-        font-size: 0.78rem; font-weight: 700; letter-spacing: 1.5px;
-    }
-    .promo-bar {
-        background: linear-gradient(90deg,#1a0a00,#2d1500);
-        border: 1px solid #FF8C00; border-radius: 8px;
-        padding: 10px 16px; margin-bottom: 20px;
-        font-size: 14px; color: #FFB347; font-weight: 600;
-    }
-    .promo-bar a { color: #FFD700; text-decoration: none; font-weight: 700; }
-    .agent-card {
-        flex: 1; min-width: 200px; background: #0f1219;
-        border: 1px solid #1e2a3e; border-radius: 14px;
-        padding: 18px 20px; text-align: center; transition: all 0.3s ease;
-    }
-    .agent-card.active { border-color: #7b2ff7; box-shadow: 0 0 20px rgba(123,47,247,0.3); }
-    .agent-card.done { border-color: #00c851; box-shadow: 0 0 15px rgba(0,200,81,0.2); }
-    .agent-icon { font-size: 2rem; margin-bottom: 8px; }
-    .agent-name { font-size: 0.9rem; font-weight: 700; color: #e0e6f0; }
-    .agent-role { font-size: 0.75rem; color: #7a8ba0; margin-top: 4px; }
-    .agent-status { font-size: 0.72rem; margin-top: 8px; padding: 3px 10px; border-radius: 10px; display: inline-block; }
-    .status-idle { background: #1a1d27; color: #4a5568; }
-    .status-running { background: #1a0d2e; color: #a855f7; }
-    .status-done { background: #0a1a0a; color: #00c851; }
-    .input-card {
-        background: #0f1219; border: 1px solid #1e2a3e;
-        border-radius: 14px; padding: 24px; margin-bottom: 20px;
-    }
-    .stTextInput > div > div > input,
-    .stTextArea > div > div > textarea {
-        background-color: #0a0d14 !important;
-        border: 1px solid #1e2a3e !important;
-        color: #e0e6f0 !important; border-radius: 8px !important;
-    }
-    .phase-header {
-        background: linear-gradient(90deg, #0a1929, #0d1117);
-        border: 1px solid #1e3a5f; border-left: 4px solid #4285f4;
-        border-radius: 10px; padding: 14px 20px;
-        margin: 20px 0 14px 0; display: flex; align-items: center; gap: 12px;
-    }
-    .phase-claude { border-left-color: #a855f7 !important; }
-    .phase-gpt { border-left-color: #00c851 !important; }
-    .phase-auto { border-left-color: #f59e0b !important; }
-    .phase-rag { border-left-color: #00bcd4 !important; }
-    .phase-title { font-size: 1rem; font-weight: 700; color: #fff; margin: 0; }
-    .phase-sub { font-size: 0.8rem; color: #7a8ba0; margin-top: 2px; }
-    .lead-card {
-        background: #0f1219; border: 1px solid #1e2a3e;
-        border-radius: 14px; padding: 20px 24px; margin-bottom: 14px;
-    }
-    .lead-card:hover { border-color: #4285f4; box-shadow: 0 4px 24px rgba(66,133,244,0.15); }
-    .lead-name { font-size: 1.05rem; font-weight: 700; color: #fff; margin: 0; }
-    .lead-address { font-size: 0.8rem; color: #7a8ba0; margin-top: 4px; }
-    .badge-hot { background:#1a0a0a; color:#ff4444; border:1px solid #ff4444; padding:4px 12px; border-radius:20px; font-size:0.72rem; font-weight:700; }
-    .badge-warm { background:#1a1200; color:#ffaa00; border:1px solid #ffaa00; padding:4px 12px; border-radius:20px; font-size:0.72rem; font-weight:700; }
-    .badge-cold { background:#001a2a; color:#0099ff; border:1px solid #0099ff; padding:4px 12px; border-radius:20px; font-size:0.72rem; font-weight:700; }
-    .strategy-box {
-        background: #0a0d14; border: 1px solid #2d1657;
-        border-left: 3px solid #a855f7; border-radius: 10px; padding: 16px 20px; margin: 10px 0;
-    }
-    .strategy-title { color: #a855f7; font-weight: 700; font-size: 0.85rem; margin-bottom: 8px; }
-    .strategy-text { color: #b0bec5; font-size: 0.84rem; line-height: 1.6; }
-    .msg-box { background: #0a0d14; border: 1px solid #1e2a3e; border-radius: 10px; padding: 16px; margin: 10px 0; }
-    .msg-whatsapp { border-left: 3px solid #25D366; }
-    .msg-email { border-left: 3px solid #4285f4; }
-    .msg-label { font-size: 0.72rem; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 8px; }
-    .msg-label-wa { color: #25D366; }
-    .msg-label-mail { color: #4285f4; }
-    .msg-content { color: #b0bec5; font-size: 0.84rem; line-height: 1.6; white-space: pre-wrap; }
-    .autoreply-box {
-        background: #0f1a0f; border: 1px solid #1a3a1a;
-        border-left: 3px solid #00c851; border-radius: 10px; padding: 16px; margin: 10px 0;
-    }
-    .autoreply-label { color: #00c851; font-size: 0.72rem; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 8px; }
-    .autoreply-text { color: #b0bec5; font-size: 0.84rem; line-height: 1.6; white-space: pre-wrap; }
-    .rag-box {
-        background: #0a1a1f; border: 1px solid #1a3a4a;
-        border-left: 3px solid #00bcd4; border-radius: 10px; padding: 16px; margin: 10px 0;
-    }
-    .rag-label { color: #00bcd4; font-size: 0.72rem; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 8px; }
-    .rag-text { color: #b0bec5; font-size: 0.84rem; line-height: 1.6; white-space: pre-wrap; }
-    .action-row { display: flex; gap: 10px; flex-wrap: wrap; margin-top: 14px; }
-    .btn-wa { background:#0d2a1a; color:#25D366; border:1px solid #25D366; padding:8px 16px; border-radius:8px; font-size:0.82rem; font-weight:700; text-decoration:none; display:inline-block; }
-    .btn-mail { background:#0d1a2a; color:#64b5f6; border:1px solid #64b5f6; padding:8px 16px; border-radius:8px; font-size:0.82rem; font-weight:700; text-decoration:none; display:inline-block; }
-    .btn-linkedin { background:#081826; color:#0A66C2; border:1px solid #0A66C2; padding:8px 16px; border-radius:8px; font-size:0.82rem; font-weight:700; text-decoration:none; display:inline-block; }
-    .stButton > button {
-        background: linear-gradient(135deg,#7b2ff7,#f107a3) !important;
-        color: white !important; border: none !important;
-        border-radius: 10px !important; font-weight: 700 !important;
-        font-size: 1rem !important; padding: 14px 32px !important; width: 100% !important;
-    }
-    .logout-btn > button {
-        background: linear-gradient(135deg,#c0392b,#e74c3c) !important;
-    }
-    .conversation-entry {
-        background: #0a0d14; border: 1px solid #1e2a3e;
-        border-radius: 10px; padding: 14px 18px; margin-bottom: 10px;
-    }
-    .conv-from { font-size: 0.75rem; color: #7a8ba0; margin-bottom: 6px; }
-    .conv-msg { color: #b0bec5; font-size: 0.84rem; line-height: 1.6; }
-    .user-chip {
-        background: #0a0d14; border: 1px solid #1e2a3e;
-        border-radius: 8px; padding: 10px 14px; color: #e0e6f0; font-size: 0.88rem; margin-bottom: 12px;
-    }
-    .hunter-success {
-        background: #0a1a0a; border: 1px solid #00c851;
-        border-radius: 8px; padding: 10px 14px; color: #00c851;
-        font-size: 0.88rem; margin: 8px 0; font-weight: 600;
-    }
-    .hunter-fail {
-        background: #1a0a0a; border: 1px solid #ff8800;
-        border-radius: 8px; padding: 10px 14px; color: #ff8800;
-        font-size: 0.88rem; margin: 8px 0;
-    }
-    #MainMenu { visibility: hidden; }
-    footer { visibility: hidden; }
-    header { visibility: hidden; }
-    [data-testid="stToolbar"] { display: none !important; }
-    [data-testid="stDecoration"] { display: none !important; }
-    [data-testid="stStatusWidget"] { display: none !important; }
-    [data-testid="baseButton-header"] { display: none !important; }
-    .st-emotion-cache-zq5wmm { display: none !important; }
-    .st-emotion-cache-1dp5vir { display: none !important; }
-    .st-emotion-cache-h5rgaw { display: none !important; }
-    .viewerBadge_container__1QSob { display: none !important; }
-    .viewerBadge_link__1S137 { display: none !important; }
-    #stDecoration { display: none !important; }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(style_tag("app.css"), unsafe_allow_html=True)
 
 # ---------------------------------------------
 # API KEYS
 # ---------------------------------------------
-def get_streamlit_secret(key, default=""):
-    try:
-        return st.secrets.get(key, default)
-    except Exception:
-        return default
-
-_all_keys = [
-    get_streamlit_secret("GOOGLE_API_KEY", ""),
-    get_streamlit_secret("GOOGLE_API_KEY2", ""),
-    get_streamlit_secret("GOOGLE_API_KEY3", ""),
-]
-_valid_keys = [k for k in _all_keys if k and k.strip()]
+_settings = load_settings()
+_valid_keys = list(_settings["gemini_keys"])
 gemini_key = _valid_keys[0] if _valid_keys else ""
-HUNTER_API_KEY = get_streamlit_secret("HUNTER_API_KEY", "")
+HUNTER_API_KEY = _settings["hunter_key"]
 
 # ---------------------------------------------
 # SESSION STATE INIT
 # ---------------------------------------------
 if "pipeline_results" not in st.session_state or st.session_state.pipeline_results is None:
     st.session_state.pipeline_results = {}
-for state_key in ["conversation_log", "leads_data", "rag_context"]:
+for state_key in ["conversation_log", "leads_data", "rag_context", "pipeline_notices"]:
     if state_key not in st.session_state or st.session_state[state_key] is None:
         st.session_state[state_key] = [] if state_key != "rag_context" else ""
+if not st.session_state.get("stage_states"):
+    st.session_state.stage_states = {}
 
 # ---------------------------------------------
 # CORE HELPERS
 # ---------------------------------------------
-def esc(value):
-    return html.escape(str(value or ""), quote=True)
+def model_router():
+    keys = tuple(_valid_keys) if _valid_keys else tuple(k for k in (gemini_key,) if k and k.strip())
+    return get_model_router(keys)
 
-_MODEL_PRIORITY = [
-    "gemini-2.5-flash-lite",
-    "gemini-2.0-flash-lite",
-    "gemini-2.5-flash"
-]
+def model_client():
+    return ModelClient(model_router(), get_response_cache())
 
-def _get_model_for_key(api_key, index=0):
-    genai.configure(api_key=api_key.strip())
-    selected_model = _MODEL_PRIORITY[index % len(_MODEL_PRIORITY)]
-    return genai.GenerativeModel(selected_model), selected_model
-
-def call_gemini_with_retry(prompt):
-    keys_to_try = list(_valid_keys) if _valid_keys else [gemini_key]
-    if not keys_to_try or not keys_to_try[0]:
-        raise Exception("No valid API Key detected.")
-    errors = []
-    for idx, api_key in enumerate(keys_to_try):
-        try:
-            model, model_name = _get_model_for_key(api_key, idx)
-            response = model.generate_content(prompt)
-            return response, model_name
-        except Exception as exc:
-            errors.append(f"Key_{idx}: {str(exc)}")
-            continue
-    st.warning(f"All API keys strained. Retrying in 30 seconds...")
-    time.sleep(30)
-    for idx, api_key in enumerate(keys_to_try):
-        try:
-            model, model_name = _get_model_for_key(api_key, idx + 1)
-            response = model.generate_content(prompt)
-            return response, model_name
-        except Exception as exc:
-            errors.append(f"Retry_{idx}: {str(exc)}")
-            continue
-    raise Exception(f"All keys exhausted. Errors: {errors}")
-
-def safe_json_parse(text, default=None):
-    try:
-        clean = str(text or "").strip()
-        if clean.startswith("```"):
-            parts = clean.split("```")
-            clean = parts[1] if len(parts) > 1 else clean
-            if clean.lstrip().startswith("json"):
-                clean = clean.lstrip()[4:]
-        start_arr = clean.find("[")
-        start_obj = clean.find("{")
-        if start_arr != -1 and (start_obj == -1 or start_arr < start_obj):
-            end = clean.rfind("]") + 1
-            clean = clean[start_arr:end]
-        elif start_obj != -1:
-            end = clean.rfind("}") + 1
-            clean = clean[start_obj:end]
-        return json.loads(clean)
-    except Exception:
-        return default if default is not None else []
-
-def parse_leads_table(raw_text):
-    leads = []
-    for line in str(raw_text or "").split("\n"):
-        if "|" not in line or "Company" in line or "---" in line:
-            continue
-        cols = [c.strip() for c in line.strip().strip("|").split("|")]
-        if len(cols) < 8:
-            continue
-        leads.append({
-            "company": cols[0],
-            "address": cols[1],
-            "first_name": cols[2],
-            "last_name": cols[3],
-            "email": "Pending extraction",
-            "phone": cols[4],
-            "decision_maker_role": cols[5] if len(cols) > 5 else "",
-            "why_need": cols[6] if len(cols) > 6 else "",
-            "sector": cols[7] if len(cols) > 7 else "",
-            "deal_size": cols[8] if len(cols) > 8 else "",
-            "person_linkedin": cols[9] if len(cols) > 9 else "",
-        })
-    return leads
-
-def clean_phone_number(phone):
-    digits = "".join(filter(str.isdigit, str(phone or "")))
-    if len(digits) == 10:
-        digits = "91" + digits
-    return digits
+def agent_concurrency_limit():
+    return model_router().concurrency
 
 def show_phase_header(css_class, icon_html, title, subtitle):
     st.markdown(
@@ -330,20 +117,26 @@ def show_phase_header(css_class, icon_html, title, subtitle):
         unsafe_allow_html=True,
     )
 
-def show_agent_pipeline(statuses):
-    agents = [
-        {"icon": "&#128269;", "name": "Gemini Scout", "role": "Lead Discovery", "key": "gemini"},
-        {"icon": "&#129504;", "name": "Gemini Strategist", "role": "Strategy & Profiling", "key": "claude"},
-        {"icon": "&#9993;", "name": "Gemini Communicator", "role": "Message Drafting", "key": "gpt"},
-        {"icon": "&#128260;", "name": "Gemini Auto-Reply", "role": "Conversation AI", "key": "auto"},
-        {"icon": "&#129302;", "name": "Gemini RAG", "role": "Deep Intelligence", "key": "rag"},
-    ]
+PIPELINE_AGENTS = [
+    {"icon": "&#128269;", "name": "Gemini Scout", "role": "Lead Discovery", "key": "scout"},
+    {"icon": "&#129504;", "name": "Gemini Strategist", "role": "Strategy & Profiling", "key": "strategist"},
+    {"icon": "&#9993;", "name": "Gemini Communicator", "role": "Message Drafting", "key": "communicator"},
+    {"icon": "&#128260;", "name": "Gemini Auto-Reply", "role": "Conversation AI", "key": "auto"},
+    {"icon": "&#129302;", "name": "Gemini RAG", "role": "Deep Intelligence", "key": "rag"},
+]
+
+def show_agent_pipeline(stage_states):
+    """Draw the agent cards from the pipeline engine's stage states."""
+    agents = PIPELINE_AGENTS
     cols = st.columns(9)
     for i, agent in enumerate(agents):
-        status = statuses.get(agent["key"], "idle")
-        card_class = "agent-card active" if status == "running" else ("agent-card done" if status == "done" else "agent-card")
+        state = stage_states.get(agent["key"]) or {}
+        status = state.get("status", "idle")
+        card_class = {"running": "agent-card active", "done": "agent-card done", "failed": "agent-card failed"}.get(status, "agent-card")
         status_class = "agent-status status-" + status
-        status_label = {"idle": "Idle", "running": "Running...", "done": "Done"}.get(status, "Idle")
+        status_label = {"idle": "Idle", "running": "Running...", "done": "Done", "failed": "Failed", "skipped": "Skipped"}.get(status, "Idle")
+        if state.get("elapsed") is not None and status in ("done", "failed"):
+            status_label += f" · {state['elapsed']:.1f}s"
         with cols[i * 2]:
             st.markdown(
                 '<div class="' + card_class + '">'
@@ -392,269 +185,105 @@ def get_hunter_email(first_name, last_name, company_name, api_key=None):
     key = api_key or HUNTER_API_KEY
     if not key or not key.strip():
         return None, "No Hunter API key configured in secrets"
-    
     domain = extract_domain_from_company(company_name)
-    
-    # Try email finder first
-    try:
-        url = f"https://api.hunter.io/v2/email-finder"
-        params = {
-            "domain": domain,
-            "first_name": first_name,
-            "last_name": last_name,
-            "api_key": key.strip()
-        }
-        resp = requests.get(url, params=params, timeout=15)
-        data = resp.json()
-        
-        if data.get("data", {}).get("email"):
-            confidence = data["data"].get("score", 0)
-            email = data["data"]["email"]
-            return email, f"Found (confidence: {confidence}%)"
-        
-        # If finder fails, try domain search for any email
-        url2 = f"https://api.hunter.io/v2/domain-search"
-        params2 = {"domain": domain, "api_key": key.strip(), "limit": 5}
-        resp2 = requests.get(url2, params=params2, timeout=15)
-        data2 = resp2.json()
-        
-        emails = data2.get("data", {}).get("emails", [])
-        if emails:
-            # Return first email found on domain
-            return emails[0].get("value"), f"Domain match found on {domain}"
-            
-        return None, f"No email found for {first_name} {last_name} at {domain}"
-        
-    except requests.exceptions.Timeout:
-        return None, "Hunter API timeout — try again"
-    except Exception as e:
-        return None, f"Hunter API error: {str(e)}"
+    return get_hunter_client(key.strip()).find_email(first_name, last_name, domain)
 
-# ─────────────────────────────────────────────
-# FIX 2: LINKEDIN DIRECT PROFILE SEARCH
-# ─────────────────────────────────────────────
-def build_linkedin_url(first_name, last_name, company, existing_url=""):
-    # Use direct profile if available
-    if existing_url and "linkedin.com/in/" in str(existing_url):
-        return existing_url.strip()
-    
-    # Search name + company together — finds the RIGHT person
-    full_query = f"{first_name} {last_name} {company}"
-    url = (
-        "https://www.linkedin.com/search/results/people/"
-        f"?keywords={urllib.parse.quote(full_query)}"
-        "&origin=GLOBAL_SEARCH_HEADER"
-    )
-    return url
-
-# ─────────────────────────────────────────────
-# FIX 3: RAG CONTEXT BUILDER
-# ─────────────────────────────────────────────
-def build_rag_context(our_product, our_company, region, target_client, leads_data, strategy_data):
-    """FIX 3: Build RAG knowledge base from all pipeline data"""
-    context = f"""
-=== COMPANY KNOWLEDGE BASE ===
-Company: {our_company}
-Offering: {our_product}
-Target Region: {region}
-Ideal Clients: {target_client}
-
-=== DISCOVERED LEADS ===
-"""
-    for i, lead in enumerate(leads_data[:10]):
-        context += f"""
-Lead {i+1}: {lead.get('company', '')}
-- Contact: {lead.get('first_name', '')} {lead.get('last_name', '')} ({lead.get('decision_maker_role', '')})
-- Address: {lead.get('address', '')}
-- Phone: {lead.get('phone', '')}
-- Sector: {lead.get('sector', '')}
-- Deal Size: {lead.get('deal_size', '')}
-- Why They Need Us: {lead.get('why_need', '')}
-"""
-
-    if strategy_data:
-        context += "\n=== STRATEGIC ANALYSIS ===\n"
-        for s in strategy_data[:5]:
-            context += f"""
-{s.get('company', '')}: Priority={s.get('priority', '')} Score={s.get('deal_score', '')}
-Value Prop: {s.get('our_value_prop', '')}
-Pain Points: {', '.join(s.get('pain_points', []))}
-"""
-    return context
-
-def rag_query(question, context, our_company, our_product):
-    """Answer questions using RAG — retrieves from context then generates"""
-    if not context:
-        return "No pipeline data available yet. Run the pipeline first."
-    
-    prompt = f"""You are an intelligent B2B sales assistant for {our_company}.
-
-KNOWLEDGE BASE (Retrieved Context):
-{context}
-
-OUR OFFERING: {our_product}
-
-USER QUESTION: {question}
+def enrich_leads_with_hunter(leads, max_workers=5, api_key=None):
+    """Bulk email lookup for every lead without an email; returns {lead ID: (email, status)}."""
+    key = api_key or HUNTER_API_KEY
+    if not key or not key.strip():
+        return {}
+    return get_hunter_client(key.strip()).enrich_leads(leads, extract_domain_from_company, max_workers)
 
-Instructions:
-- Answer ONLY using the information in the knowledge base above
-- Be specific with company names, contact details, and deal sizes
-- If the information is not in the knowledge base, say so clearly
-- Give actionable recommendations
-- Format your response clearly with bullet points where appropriate
+def knowledge_base():
+    """Shared cross-run store, or None when no Gemini key is available for embeddings."""
+    api_key = _valid_keys[0] if _valid_keys else gemini_key
+    return get_knowledge_base(api_key.strip()) if api_key and api_key.strip() else None
 
-Answer:"""
-    
-    try:
-        response, _ = call_gemini_with_retry(prompt)
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
+def document_ingestor():
+    api_key = _valid_keys[0] if _valid_keys else gemini_key
+    return get_document_ingestor(api_key.strip()) if api_key and api_key.strip() else None
 
 # ---------------------------------------------
 # EMAIL DISPATCH
 # ---------------------------------------------
-def send_live_hostinger_email(lead_email, subject, body_text):
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    import os
-
-    smtp_server = "smtp.hostinger.com"
-    port = 465
+SENDER_NAME = "Bhoodevi Warehouse"
+
+def outbound_queue():
     sender_email = get_streamlit_secret("EMAIL_USER", "sanjayhg@bhoodeviwarehouse.com")
     sender_password = get_streamlit_secret("EMAIL_PASSWORD", "")
-
     if not sender_password:
-        return "Missing EMAIL_PASSWORD in secrets"
-
-    message = MIMEMultipart()
-    message["From"] = f"Bhoodevi Warehouse <{sender_email}>"
-    message["To"] = lead_email
-    message["Bcc"] = sender_email
-    message["Subject"] = subject
-    message.attach(MIMEText(body_text, "plain"))
-
-    try:
-        with smtplib.SMTP_SSL(smtp_server, port) as server:
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, [lead_email, sender_email], message.as_string())
-        return "Success"
-    except Exception as e:
-        return str(e)
+        return None, sender_email
+    return get_outbound_queue(sender_email, sender_password), sender_email
+
+def queue_lead_emails(outgoing):
+    """Queue ``(lead_email, subject, body_text, company_name)`` tuples; returns (job_ids, error)."""
+    mailer, sender_email = outbound_queue()
+    if mailer is None:
+        return [], "Missing EMAIL_PASSWORD in secrets"
+    batch = [
+        (build_message(sender_email, lead_email, subject, body_text, SENDER_NAME, bcc=sender_email), company_name)
+        for lead_email, subject, body_text, company_name in outgoing
+    ]
+    job_ids = mailer.submit_batch(batch)
+    st.session_state.setdefault("mail_jobs", []).extend(job_ids)
+    return job_ids, None
 
 def handle_email_dispatch(lead_email, subject, body_text, company_name):
-    status = send_live_hostinger_email(lead_email, subject, body_text)
-    if status == "Success":
-        st.toast(f"✅ Email sent to {company_name}!", icon="🚀")
-    else:
-        st.error(f"❌ Failed to send to {company_name}: {status}")
-
-# ---------------------------------------------
-# AGENTS
-# ---------------------------------------------
-def agent_gemini_scout(region, target_client, my_product, our_product, num_leads):
-    prompt = (
-        "You are a B2B Lead Intelligence Scout. Find " + str(num_leads) + " REAL corporate businesses in " + region + ".\n\n"
-        "TARGET CLIENT TYPE: " + target_client + "\n"
-        "WHAT WE SELL: " + my_product + "\n"
-        "OUR FULL OFFERING: " + our_product + "\n\n"
-        "Return ONLY a pipe-separated table:\n"
-        "Company Name | Full Address | Manager First Name | Manager Last Name | Phone | Decision Maker Role | Why They Need Us | Industry Sector | Estimated Deal Size | Person LinkedIn URL\n\n"
-        "RULES:\n"
-        "- Use REAL company names that exist in " + region + "\n"
-        "- Find actual First Name and Last Name of regional executives\n"
-        "- For LinkedIn URL: provide the actual linkedin.com/in/username if known, otherwise write SEARCH\n"
-        "- Phone: Indian format with +91\n"
-        "- NO invented emails\n"
-        "- NO markdown, ONLY table rows\n"
-    )
-    response, model_name = call_gemini_with_retry(prompt)
-    return response.text, model_name
-
-def agent_gemini_strategist(raw_leads_data, our_product, our_company, my_product, reply_tone):
-    prompt = (
-        "You are a senior B2B growth strategist.\n\n"
-        "Raw Leads:\n" + raw_leads_data + "\n\n"
-        "Our Company: " + our_company + "\n"
-        "Our Offering: " + our_product + "\n"
-        "Product: " + my_product + "\n"
-        "Tone: " + reply_tone + "\n\n"
-        "Return ONLY valid JSON array. No markdown.\n"
-        "Each object MUST have:\n"
-        "- company, first_name, last_name, person_linkedin\n"
-        "- deal_score (1-100), priority (HOT/WARM/COLD)\n"
-        "- our_value_prop, pain_points (array), opening_hook\n"
-        "- linkedin_connection_note, objection_handling\n"
-        "- estimated_value, urgency_signal, recommended_approach\n"
-        "Start with [ end with ]"
-    )
-    response, _ = call_gemini_with_retry(prompt)
-    return response.text
-
-def agent_gemini_communicator(strategy_data, leads_data, our_product, our_company, our_contact, our_website, our_email, reply_tone):
-    prompt = (
-        "You are an expert B2B sales communicator for " + our_company + ".\n\n"
-        "OUR OFFERING: " + our_product + "\n"
-        "CONTACT: " + our_contact + "\n"
-        "EMAIL: " + our_email + "\n"
-        "WEBSITE: " + our_website + "\n"
-        "TONE: " + reply_tone + "\n\n"
-        "LEADS:\n" + json.dumps(leads_data, indent=2) + "\n\n"
-        "STRATEGY:\n" + json.dumps(strategy_data, indent=2) + "\n\n"
-        "For each lead write:\n"
-        "1. WhatsApp message (max 200 words)\n"
-        "2. Email (Subject + Body, include website " + our_website + ")\n"
-        "3. LinkedIn note (under 300 chars)\n\n"
-        "Return ONLY valid JSON array. No markdown.\n"
-        "Each object: company, first_name, last_name, phone, email, person_linkedin,\n"
-        "whatsapp_message, email_subject, email_body, linkedin_note,\n"
-        "best_time_to_contact, follow_up_day\n"
-        "Start with [ end with ]"
-    )
-    response, _ = call_gemini_with_retry(prompt)
-    return response.text
-
-def agent_gemini_autoresponder(lead_data, strategy, messages, our_product, our_company, reply_tone):
-    prompt = (
-        "You are a sales AI for " + our_company + ".\n\n"
-        "OUR OFFERING: " + our_product + "\n"
-        "TONE: " + reply_tone + "\n\n"
-        "LEAD: " + str(lead_data.get("company", "")) + " - " + str(lead_data.get("first_name", "")) + "\n"
-        "PRIORITY: " + str(strategy.get("priority", "WARM")) + "\n"
-        "PAIN POINTS: " + str(strategy.get("pain_points", [])) + "\n\n"
-        "TASK: Simulate client reply + our automated response.\n"
-        "Return ONLY valid JSON object. No markdown.\n"
-        "Keys: simulated_client_reply, reply_scenario, auto_response_whatsapp,\n"
-        "auto_response_email, next_action, escalate_to_human (bool), escalation_reason\n"
-        "Start with { end with }"
-    )
-    response, _ = call_gemini_with_retry(prompt)
-    return response.text
-
-def agent_gemini_rag_insights(leads_data, strategy_data, our_product, our_company, region):
-    """FIX 3: RAG Agent — generates deep insights from all pipeline data"""
-    prompt = (
-        "You are a B2B market intelligence analyst using RAG (Retrieval Augmented Generation).\n\n"
-        "RETRIEVED DATA:\n"
-        "Company: " + our_company + "\n"
-        "Offering: " + our_product + "\n"
-        "Region: " + region + "\n"
-        "Total Leads: " + str(len(leads_data)) + "\n\n"
-        "LEADS SUMMARY:\n" + json.dumps(leads_data[:5], indent=2) + "\n\n"
-        "STRATEGY SUMMARY:\n" + json.dumps(strategy_data[:5], indent=2) + "\n\n"
-        "Generate a comprehensive intelligence report with:\n"
-        "1. TOP 3 highest-priority targets and why\n"
-        "2. Market opportunity size in this region\n"
-        "3. Common pain points across all leads\n"
-        "4. Best outreach strategy for this market\n"
-        "5. Risk factors to be aware of\n"
-        "6. Revenue forecast if 20% conversion rate\n"
-        "7. Recommended follow-up sequence (Day 1, Day 3, Day 7, Day 14)\n\n"
-        "Be specific with company names and numbers. Format with clear sections."
-    )
-    response, _ = call_gemini_with_retry(prompt)
-    return response.text
+    if not is_email_address(lead_email):
+        st.error(f"❌ No email address for {company_name} yet — try Find Real Email.")
+        return False
+    _, error = queue_lead_emails([(lead_email, subject, body_text, company_name)])
+    if error:
+        st.error(f"❌ Failed to send to {company_name}: {error}")
+        return False
+    st.toast(f"📨 Email to {company_name} queued", icon="🚀")
+    return True
+
+def session_mail_jobs():
+    mailer, _ = outbound_queue()
+    return mailer.status(st.session_state.get("mail_jobs", [])) if mailer else []
+
+def show_mail_status(was_pending):
+    jobs = session_mail_jobs()
+    if not jobs:
+        return
+    sent = sum(1 for job in jobs if job["status"] == MAIL_SENT)
+    failed = [job for job in jobs if job["status"] == MAIL_FAILED]
+    pending = len(jobs) - sent - len(failed)
+    st.caption(f"Outbox: {sent} sent · {len(failed)} failed · {pending} pending")
+    for job in failed:
+        st.caption(f"❌ {job['label']} <{job['to']}>: {job['error']}")
+    if was_pending and not pending:
+        st.rerun()  # everything settled: stop polling
+
+def show_telemetry():
+    """Rolling p50/p95 of every external call and stage in this process, plus the last run's trace ID."""
+    spans = REGISTRY.summary(SPAN_METRIC, by="span")
+    if not spans:
+        st.caption("No calls recorded yet.")
+    for name, stats in spans.items():
+        errors = f" · {stats['errors']} errors" if stats["errors"] else ""
+        st.caption(f"`{name}` ×{stats['count']} · p50 {stats['p50']:.2f}s · p95 {stats['p95']:.2f}s{errors}")
+    for metric, label in (("gemini_call_retries", "Gemini retries"), ("gemini_call_key_failovers", "Key failovers")):
+        per_call = REGISTRY.summary(metric, by="").get("")
+        if per_call:
+            st.caption(f"{label} per call: p50 {per_call['p50']:.0f} · p95 {per_call['p95']:.0f}")
+    if st.session_state.get("last_trace_id"):
+        st.caption(f"Last run trace: `{st.session_state.last_trace_id}`")
+
+def stream_cards(container, card_html):
+    def render(item):
+        container.markdown(card_html(item), unsafe_allow_html=True)
+    return render
+
+def stream_text(placeholder, render_html):
+    """Accumulate streamed pieces and redraw them into one ``st.empty`` placeholder."""
+    parts = []
+    def render(piece):
+        parts.append(piece)
+        placeholder.markdown(render_html("".join(parts)), unsafe_allow_html=True)
+    return render
 
 # ---------------------------------------------
 # HEADER
@@ -701,6 +330,13 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### 🔑 API Status")
     st.caption(f"Gemini keys active: {len(_valid_keys)}")
+    for provider_name, provider_stats in model_router().stats().items():
+        latency = (
+            f"p50 {provider_stats['p50']:.1f}s · p95 {provider_stats['p95']:.1f}s"
+            if provider_stats["p50"] is not None else "no calls yet"
+        )
+        cooling = f" · cooling {provider_stats['cooling']:.0f}s" if provider_stats["cooling"] else ""
+        st.caption(f"{provider_name} ({provider_stats['model']}): {latency}{cooling}")
     if HUNTER_API_KEY:
         st.success("✅ Hunter API connected")
     else:
@@ -727,8 +363,95 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### ⚙️ Settings")
     auto_reply_enabled = st.toggle("Enable Auto-Reply Simulation", value=True)
+    pool_limit = agent_concurrency_limit()
+    max_parallel_calls = st.number_input(
+        "Max parallel agent calls", min_value=1, max_value=max(pool_limit, 1), value=pool_limit,
+        help="Capped by the configured model providers (Gemini keys x per-key concurrency, plus Claude/OpenAI).",
+    )
+    shard_agents = st.toggle(
+        "Shard Strategist & Communicator per lead", value=True,
+        help="Run one call per shard of leads in parallel; a bad shard only loses its own leads.",
+    )
+    shard_size = st.number_input("Leads per shard", min_value=1, max_value=5, value=1, disabled=not shard_agents)
+    use_response_cache = st.toggle(
+        "Use response cache", value=True,
+        help="Reuse stored Gemini answers for identical prompts (shared by all sessions on this host).",
+    )
+    cache_enabled.set(use_response_cache)
+    with st.expander("📈 Live latency (p50 / p95)"):
+        telemetry_live = st.toggle("Refresh every 5s", key="telemetry_live")
+        st.fragment(show_telemetry, run_every=5 if telemetry_live else None)()
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses · "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1e6:.1f} MB)"
+    )
+    if st.button("Clear response cache", key="clear_cache_btn", type="secondary"):
+        get_response_cache().clear()
+        st.rerun()
     reply_tone = st.selectbox("Reply Tone", ["Professional & Warm", "Formal", "Friendly & Casual", "Urgent & Direct"])
 
+    st.markdown("---")
+    st.markdown("### 🗂️ Lead History")
+    kb = knowledge_base()
+    past_runs = kb.list_runs(st.session_state.get("current_user", ""), limit=5) if kb else []
+    if not past_runs:
+        st.caption("Runs are saved here after each pipeline.")
+    for run in past_runs:
+        label = datetime.fromtimestamp(run["created_at"]).strftime("%d %b %H:%M") + f" · {run['region']} · {run['leads']} leads"
+        if st.button(label, key=f"restore_run_{run['id']}", type="secondary", use_container_width=True):
+            saved = kb.load_run(run["id"])
+            st.session_state.leads_data = saved["lead"]
+            st.session_state.pipeline_results = {
+                "gemini_raw": "", "strategy": saved["strategy"], "messages": saved["message"],
+                "auto_replies": saved["auto_reply"], "rag_insights": saved["rag_insights"],
+            }
+            st.session_state.rag_context = build_rag_context(
+                our_product, our_company, run["region"], run["target_client"], saved["lead"], saved["strategy"])
+            st.session_state.kb_run_id = run["id"]
+            st.session_state.stage_states = {}
+            st.session_state.pipeline_notices = []
+            st.rerun()
+
+    st.markdown("---")
+    st.markdown("### 📄 Sales Documents")
+    ingestor = document_ingestor()
+    if ingestor is None:
+        st.caption("Add a Gemini key to upload brochures and rate cards.")
+    else:
+        uploads = st.file_uploader(
+            "Brochures, rate cards, empanelment PDFs", type=["pdf"], accept_multiple_files=True,
+            help="Indexed in the background; the same file is only embedded once.",
+        )
+        seen_uploads = st.session_state.setdefault("seen_uploads", set())
+        for upload in uploads or []:
+            if upload.file_id in seen_uploads:
+                continue
+            seen_uploads.add(upload.file_id)
+            try:
+                _, queued = ingestor.submit(st.session_state.get("current_user", ""), upload.name, upload)
+            except OSError as e:
+                st.error(f"Could not store {upload.name}: {e}")
+                continue
+            if not queued:
+                st.caption(f"{upload.name} is already in the knowledge base.")
+
+        def show_documents():
+            docs = ingestor.kb.list_documents(st.session_state.get("current_user", ""))
+            if docs_pending and not any(doc["status"] in ("queued", "ingesting") for doc in docs):
+                st.rerun()  # all done: stop polling
+            for doc in docs[:8]:
+                if doc["status"] == "done":
+                    st.caption(f"✅ {doc['filename']} · {doc['pages']} pages · {doc['chunks']} chunks")
+                elif doc["status"] == "failed":
+                    st.caption(f"❌ {doc['filename']} · {doc['error']}")
+                else:
+                    st.caption(f"⏳ {doc['filename']} · page {doc['pages_done']}/{doc['pages'] or '?'}")
+
+        docs_pending = ingestor.kb.list_documents(
+            st.session_state.get("current_user", ""), statuses=("queued", "ingesting"))
+        st.fragment(show_documents, run_every=2 if docs_pending else None)()
+
     st.markdown("---")
     with st.expander("ℹ️ How 5-Agent Pipeline Works"):
         st.markdown("""
@@ -762,10 +485,7 @@ st.markdown("---")
 # ---------------------------------------------
 pipeline_status_placeholder = st.empty()
 with pipeline_status_placeholder.container():
-    if "gemini_raw" in st.session_state.pipeline_results:
-        show_agent_pipeline({"gemini": "done", "claude": "done", "gpt": "done", "auto": "done", "rag": "done"})
-    else:
-        show_agent_pipeline({"gemini": "idle", "claude": "idle", "gpt": "idle", "auto": "idle", "rag": "idle"})
+    show_agent_pipeline(st.session_state.stage_states)
 
 run_col1, run_col2 = st.columns([3, 1])
 with run_col1:
@@ -779,8 +499,8 @@ st.markdown("---")
 # PIPELINE EXECUTION
 # ---------------------------------------------
 if run_pipeline:
-    if not _valid_keys and not gemini_key:
-        st.error("Missing GOOGLE_API_KEY.")
+    if not model_router().providers:
+        st.error("Missing GOOGLE_API_KEY (or ANTHROPIC_API_KEY / OPENAI_API_KEY).")
     elif not my_product or not region or not target_client:
         st.warning("Fill in Product, Region, and Client Type.")
     else:
@@ -788,277 +508,224 @@ if run_pipeline:
         st.session_state.conversation_log = []
         st.session_state.leads_data = []
         st.session_state.rag_context = ""
-
-        # PHASE 1
-        with pipeline_status_placeholder.container():
-            show_agent_pipeline({"gemini": "running", "claude": "idle", "gpt": "idle", "auto": "idle", "rag": "idle"})
-        with st.spinner("Scout finding leads..."):
-            try:
-                raw_leads, model_used = agent_gemini_scout(region, target_client, my_product, our_product, num_leads)
-                st.session_state.pipeline_results["gemini_raw"] = raw_leads
-                st.session_state.leads_data = parse_leads_table(raw_leads)
-            except Exception as e:
-                st.error("Scout Error: " + str(e))
-                st.stop()
-
-        # PHASE 2
-        with pipeline_status_placeholder.container():
-            show_agent_pipeline({"gemini": "done", "claude": "running", "gpt": "idle", "auto": "idle", "rag": "idle"})
-        with st.spinner("Strategist analysing leads..."):
-            try:
-                strategy_raw = agent_gemini_strategist(
-                    st.session_state.pipeline_results.get("gemini_raw", ""),
-                    our_product, our_company, my_product, reply_tone)
-                st.session_state.pipeline_results["strategy"] = safe_json_parse(strategy_raw, [])
-            except Exception as e:
-                st.error("Strategist Error: " + str(e))
-                st.stop()
-
-        # PHASE 3
-        with pipeline_status_placeholder.container():
-            show_agent_pipeline({"gemini": "done", "claude": "done", "gpt": "running", "auto": "idle", "rag": "idle"})
-        with st.spinner("Communicator crafting messages..."):
-            try:
-                messages_raw = agent_gemini_communicator(
-                    st.session_state.pipeline_results.get("strategy", []),
-                    st.session_state.leads_data or [],
-                    our_product, our_company, our_contact, our_website, our_email, reply_tone)
-                st.session_state.pipeline_results["messages"] = safe_json_parse(messages_raw, [])
-            except Exception as e:
-                st.error("Communicator Error: " + str(e))
-                st.stop()
-
-        # PHASE 4
-        if auto_reply_enabled:
-            with pipeline_status_placeholder.container():
-                show_agent_pipeline({"gemini": "done", "claude": "done", "gpt": "done", "auto": "running", "rag": "idle"})
-            with st.spinner("Auto-Responder simulating conversations..."):
-                try:
-                    strategy_list = st.session_state.pipeline_results.get("strategy", [])
-                    messages_list = st.session_state.pipeline_results.get("messages", [])
-                    hot_leads = [s for s in strategy_list if s.get("priority") in ["HOT", "WARM"]][:3]
-                    auto_replies = []
-                    for i, lead_strategy in enumerate(hot_leads):
-                        matching_msg = next(
-                            (m for m in messages_list if m.get("company") == lead_strategy.get("company")),
-                            messages_list[i] if i < len(messages_list) else {},
-                        )
-                        auto_raw = agent_gemini_autoresponder(
-                            lead_strategy, lead_strategy, matching_msg, our_product, our_company, reply_tone)
-                        auto_data = safe_json_parse(auto_raw, {})
-                        if auto_data:
-                            auto_data["company"] = lead_strategy.get("company", "Lead " + str(i + 1))
-                            auto_replies.append(auto_data)
-                    st.session_state.pipeline_results["auto_replies"] = auto_replies
-                except Exception as e:
-                    st.error("Auto-Responder Error: " + str(e))
-
-        # PHASE 5 — RAG
-        with pipeline_status_placeholder.container():
-            show_agent_pipeline({"gemini": "done", "claude": "done", "gpt": "done", "auto": "done", "rag": "running"})
-        with st.spinner("RAG Intelligence generating market insights..."):
-            try:
-                rag_insights = agent_gemini_rag_insights(
-                    st.session_state.leads_data or [],
-                    st.session_state.pipeline_results.get("strategy", []),
-                    our_product, our_company, region
-                )
-                st.session_state.pipeline_results["rag_insights"] = rag_insights
-                # Build RAG context for Q&A
-                st.session_state.rag_context = build_rag_context(
-                    our_product, our_company, region, target_client,
-                    st.session_state.leads_data or [],
-                    st.session_state.pipeline_results.get("strategy", [])
-                )
-            except Exception as e:
-                st.error("RAG Error: " + str(e))
-
-        st.balloons()
-        st.rerun()
+        st.session_state.kb_run_id = None
+        st.session_state.stage_states = {}
+
+        settings = {
+            "region": region, "target_client": target_client, "my_product": my_product, "num_leads": num_leads,
+            "our_product": our_product, "our_company": our_company, "our_contact": our_contact,
+            "our_website": our_website, "our_email": our_email, "reply_tone": reply_tone,
+            "shard_agents": shard_agents, "shard_size": shard_size, "max_parallel_calls": max_parallel_calls,
+            "owner": st.session_state.get("current_user", ""),
+        }
+        live_states = {}
+        notices = []
+        render_strategy = stream_cards(st.container(), strategy_card_html)
+        streamed_leads = {}  # lead ID -> (position, lead), from the Scout's "leads" event
+
+        def streamed_message_html(msg):
+            idx, lead = streamed_leads.get(lead_id(msg), (len(streamed_leads), {}))
+            email = str(lead.get("email", "")).strip()
+            return message_card_html(msg, email if is_email_address(email) else "", idx)
+
+        render_messages = stream_cards(st.container(), streamed_message_html)
+        render_rag = stream_text(st.empty(), lambda text: rag_box_html("📊 AI Market Intelligence Report", text))
+
+        def on_pipeline_event(kind, stage_name, payload):
+            if kind == "status":
+                live_states[stage_name] = payload.as_dict()
+                with pipeline_status_placeholder.container():
+                    show_agent_pipeline(live_states)
+            elif kind == "leads":
+                streamed_leads.update((lead_id(lead), (idx, lead)) for idx, lead in enumerate(payload))
+            elif kind == "strategy_item":
+                render_strategy(payload)
+            elif kind == "message_item":
+                render_messages(payload)
+            elif kind == "rag_text":
+                render_rag(payload)
+            elif kind == "warning":
+                notices.append(payload)
+                st.warning(payload)
+
+        with st.spinner("Agents running — independent stages overlap..."), trace() as trace_id:
+            st.session_state.last_trace_id = trace_id
+            with span("pipeline.run", leads=num_leads):
+                data, states = build_agent_pipeline(auto_reply_enabled).run(
+                    {"settings": settings, "llm": model_client(), "kb": knowledge_base()}, max_workers=3,
+                    on_event=on_pipeline_event)
+
+        st.session_state.stage_states = {name: state.as_dict() for name, state in states.items()}
+        agent_names = {agent["key"]: agent["name"] for agent in PIPELINE_AGENTS}
+        for name, state in states.items():
+            if state.status == FAILED:
+                notices.append(agent_names.get(name, name.title()) + " Error: " + str(state.error))
+        st.session_state.pipeline_notices = notices
+        results = {key: data[key] for key in ("gemini_raw", "strategy", "messages", "auto_replies", "rag_insights") if key in data}
+        results["stage_timings"] = {name: state.elapsed for name, state in states.items() if state.elapsed is not None}
+        st.session_state.pipeline_results = results
+        st.session_state.leads_data = data.get("leads", [])
+        st.session_state.rag_context = data.get("rag_context", "")
+        st.session_state.kb_run_id = data.get("run_id")
+
+        if "gemini_raw" in results:
+            st.balloons()
+            st.rerun()
+        for notice in notices:
+            st.error(notice)
 
 # ─────────────────────────────────────────────
 # RESULTS DISPLAY
 # ─────────────────────────────────────────────
+def lead_for(record):
+    """The Scout lead a strategy, message or reply belongs to, by lead ID; None if it has none."""
+    leads = st.session_state.leads_data
+    cached = st.session_state.get("lead_index")
+    if cached is None or cached[0] is not leads:
+        cached = st.session_state.lead_index = (leads, index_by_id(leads))
+    return cached[1].get(lead_id(record))
+
+def lead_email_for(msg):
+    """The address to send a message to, or "" while its lead has no real one (blank or a placeholder)."""
+    lead = lead_for(msg)
+    email = str(lead.get("email", msg.get("email", ""))).strip() if lead else ""
+    return email if is_email_address(email) else ""
+
+def show_lead_card(idx):
+    """One outreach card and its buttons; runs as a fragment, so a click redraws only this lead."""
+    msg = st.session_state.pipeline_results.get("messages", [])[idx]
+    email_sub = str(msg.get("email_subject", ""))
+    email_body = str(msg.get("email_body", ""))
+    company = str(msg.get("company", "Lead " + str(idx + 1)))
+    f_name = str(msg.get("first_name", ""))
+    l_name = str(msg.get("last_name", ""))
+    card_slot = st.empty()  # drawn after the buttons, so a found email shows in this same run
+
+    # FIX 1: IMPROVED HUNTER API EMAIL EXTRACTION
+    btn_col1, btn_col2 = st.columns(2)
+    with btn_col1:
+        enrich_key = f"hunter_{company.replace(' ', '_')}_{idx}"
+        if st.button(f"🔍 Find Real Email — {company}", key=enrich_key):
+            lead_data = lead_for(msg) or {}
+            fn = lead_data.get("first_name", f_name)
+            ln = lead_data.get("last_name", l_name)
+            with st.spinner(f"Searching Hunter.io for {fn} {ln} at {company}..."):
+                found_email, status_msg = get_hunter_email(fn, ln, company)
+                if found_email:
+                    st.markdown(f'<div class="hunter-success">✅ Email found: {esc(found_email)}<br><small>{esc(status_msg)}</small></div>', unsafe_allow_html=True)
+                    if lead_data:
+                        lead_data["email"] = found_email
+                else:
+                    st.markdown(f'<div class="hunter-fail">⚠️ {status_msg}<br>Try LinkedIn to connect directly.</div>', unsafe_allow_html=True)
+
+    email_to = lead_email_for(msg)
+    with btn_col2:
+        button_key = f"send_email_{company.replace(' ', '_')}_{idx}"
+        if st.button(f"🚀 Send Email to {company}", key=button_key):
+            if handle_email_dispatch(email_to, email_sub, email_body, company):
+                st.rerun()  # full run, so the outbox starts polling the new job
+    card_slot.markdown(message_card_html(msg, email_to, idx), unsafe_allow_html=True)
+    st.markdown("<br>", unsafe_allow_html=True)
+
+def show_rag_qa(our_company, our_product):
+    """The Ask-AI panel; runs as a fragment, so asking a question leaves the cards above alone."""
+    st.markdown("#### 💬 Ask AI About Your Leads")
+    st.caption("Ask anything about the discovered leads, strategies, or market — AI answers from pipeline data")
+
+    rag_question = st.text_input(
+        "Your question:",
+        placeholder="e.g. Which lead has the highest revenue potential? What are the common objections?",
+        key="rag_question"
+    )
+    rag_scope = st.radio("Search", ["This run", "All my past runs"], horizontal=True, key="rag_scope")
+    if st.button("🧠 Get AI Answer", key="rag_ask"):
+        if rag_question:
+            answer_placeholder = st.empty()
+            with st.spinner("Searching pipeline data..."):
+                answer = rag_query(
+                    model_client(),
+                    rag_question,
+                    st.session_state.rag_context,
+                    our_company, our_product,
+                    kb=knowledge_base(),
+                    owner=st.session_state.get("current_user"),
+                    run_id=st.session_state.get("kb_run_id"),
+                    all_runs=rag_scope == "All my past runs",
+                    on_text=stream_text(answer_placeholder, lambda text: rag_box_html("🧠 AI Answer", text)),
+                )
+            answer_placeholder.markdown(rag_box_html("🧠 AI Answer", answer), unsafe_allow_html=True)
+
 if "gemini_raw" in st.session_state.pipeline_results:
 
+    for notice in st.session_state.pipeline_notices:
+        st.warning(notice)
+
     # PHASE 1 — LEADS TABLE
     show_phase_header("", "&#128269;", "Phase 1: Scout — Lead Discovery", "Real businesses matching your target profile")
     leads_list = st.session_state.leads_data
     if leads_list:
         df_display = pd.DataFrame(leads_list)
+        if "email" in df_display.columns:
+            df_display["email"] = [lead.get("email") if has_real_email(lead) else PENDING_EMAIL for lead in leads_list]
         display_cols = ["company", "first_name", "last_name", "decision_maker_role", "phone", "email", "why_need", "deal_size"]
         df_display = df_display[[c for c in display_cols if c in df_display.columns]]
         df_display.columns = ["Company", "First Name", "Last Name", "Role", "Phone", "Email", "Why They Need Us", "Est. Deal"][:len(df_display.columns)]
         st.dataframe(df_display, use_container_width=True, hide_index=True)
+        missing_emails = sum(1 for lead in leads_list if not has_real_email(lead))
+        if HUNTER_API_KEY and missing_emails:
+            if st.button(f"🔍 Enrich all leads — find {missing_emails} emails", key="hunter_enrich_all"):
+                with st.spinner(f"Searching Hunter.io for {missing_emails} leads..."):
+                    found = enrich_leads_with_hunter(leads_list)
+                hits = 0
+                leads_by_id = index_by_id(leads_list)
+                for key, (found_email, _) in found.items():
+                    if found_email and key in leads_by_id:
+                        leads_by_id[key]["email"] = found_email
+                        hits += 1
+                st.session_state.hunter_summary = f"Hunter.io found {hits} of {missing_emails} emails."
+                st.rerun()
+        if st.session_state.get("hunter_summary"):
+            st.caption(st.session_state.pop("hunter_summary"))
 
     # PHASE 2 — STRATEGY
     show_phase_header("phase-claude", "&#129504;", "Phase 2: Strategist — Deep Analysis", "Personalised strategy for each lead")
     strategy_list = st.session_state.pipeline_results.get("strategy", [])
     for s in strategy_list:
-        priority = s.get("priority", "WARM")
-        badge_class = "badge-hot" if priority == "HOT" else ("badge-cold" if priority == "COLD" else "badge-warm")
-        pain_items = "".join(["<li>" + esc(p) + "</li>" for p in s.get("pain_points", [])])
-        st.markdown(
-            '<div class="lead-card">'
-            '<div style="display:flex;justify-content:space-between;align-items:flex-start;margin-bottom:12px;">'
-            '<div><p class="lead-name">' + esc(s.get("company", "")) + "</p>"
-            '<p class="lead-address">' + esc(s.get("first_name", "")) + ' ' + esc(s.get("last_name", "")) + " | Score: " + esc(s.get("deal_score", 0)) + "/100</p></div>"
-            '<span class="' + badge_class + '">' + esc(priority) + "</span></div>"
-            '<div class="strategy-box"><div class="strategy-title">Value Proposition</div>'
-            '<div class="strategy-text">' + esc(s.get("our_value_prop", "")) + "</div></div>"
-            '<div style="display:flex;gap:16px;flex-wrap:wrap;margin-top:12px;">'
-            '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Pain Points</p>'
-            '<ul style="color:#b0bec5;font-size:0.82rem;margin:4px 0;padding-left:16px;">' + pain_items + "</ul></div>"
-            '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Opening Hook</p>'
-            '<p style="color:#e0e6f0;font-size:0.84rem;font-style:italic;">' + esc(s.get("opening_hook", "")) + "</p></div>"
-            '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Recommended Approach</p>'
-            '<p style="color:#b0bec5;font-size:0.82rem;">' + esc(s.get("recommended_approach", "")) + "</p></div></div>"
-            '<div style="margin-top:10px;padding-top:10px;border-top:1px solid #1e2a3e;display:flex;gap:20px;flex-wrap:wrap;">'
-            '<span style="font-size:0.8rem;color:#7a8ba0;">Value: ' + esc(s.get("estimated_value", "")) + "</span>"
-            '<span style="font-size:0.8rem;color:#7a8ba0;">Urgency: ' + esc(s.get("urgency_signal", "")) + "</span>"
-            "</div></div>",
-            unsafe_allow_html=True,
-        )
+        st.markdown(strategy_card_html(s), unsafe_allow_html=True)
 
     # PHASE 3 — MESSAGES WITH FIXED LINKEDIN
     show_phase_header("phase-gpt", "&#9993;", "Phase 3: Communicator — Outreach Messages", "WhatsApp, Email and LinkedIn for each lead")
     messages_list = st.session_state.pipeline_results.get("messages", [])
-    for idx, msg in enumerate(messages_list):
-        phone = str(msg.get("phone", ""))
-        email_to = str(st.session_state.leads_data[idx].get("email", msg.get("email", ""))) if idx < len(st.session_state.leads_data) else ""
-        wa_text = str(msg.get("whatsapp_message", ""))
-        email_sub = str(msg.get("email_subject", ""))
-        email_body = str(msg.get("email_body", ""))
-        linkedin_note = str(msg.get("linkedin_note", ""))
-        company = str(msg.get("company", "Lead " + str(idx + 1)))
-        f_name = str(msg.get("first_name", ""))
-        l_name = str(msg.get("last_name", ""))
-        existing_li = str(msg.get("person_linkedin", ""))
-        best_time = str(msg.get("best_time_to_contact", "Weekday morning"))
-        follow_up = str(msg.get("follow_up_day", "3 days"))
-
-        clean_ph = clean_phone_number(phone)
-        wa_link = "https://wa.me/" + clean_ph + "?text=" + urllib.parse.quote(wa_text)
-        mail_link = "mailto:" + email_to + "?subject=" + urllib.parse.quote(email_sub) + "&body=" + urllib.parse.quote(email_body)
-        
-        # FIX 2: Proper LinkedIn URL
-        li_link = build_linkedin_url(f_name, l_name, company, existing_li)
-
-        st.markdown(
-            '<div class="lead-card" style="border-color:#1a4a1a;">'
-            '<div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:14px;">'
-            '<p class="lead-name">' + esc(company) + " — " + esc(f_name) + " " + esc(l_name) + "</p>"
-            '<span style="font-size:0.78rem;color:#7a8ba0;">Best Time: ' + esc(best_time) + " | Follow-up: " + esc(follow_up) + "</span></div>"
-            '<p style="font-size:0.85rem;color:#64b5f6;"><b>Email:</b> ' + esc(email_to) + '</p>'
-            '<div class="msg-box msg-whatsapp"><div class="msg-label msg-label-wa">📱 WhatsApp Message</div>'
-            '<div class="msg-content">' + esc(wa_text) + "</div></div>"
-            '<div class="msg-box msg-email"><div class="msg-label msg-label-mail">📧 Email — ' + esc(email_sub) + "</div>"
-            '<div class="msg-content">' + esc(email_body) + "</div></div>"
-            '<div class="msg-box"><div class="msg-label" style="color:#0A66C2;">💼 LinkedIn Note</div>'
-            '<div class="msg-content">' + esc(linkedin_note) + "</div></div>"
-            '<div class="action-row">'
-            '<a class="btn-wa" href="' + esc(wa_link) + '" target="_blank">📱 WhatsApp</a>'
-            '<a class="btn-mail" href="' + esc(mail_link) + '" target="_blank">📧 Email Draft</a>'
-            '<a class="btn-linkedin" href="' + esc(li_link) + '" target="_blank">💼 LinkedIn Profile</a>'
-            "</div></div>",
-            unsafe_allow_html=True,
-        )
-
-        # FIX 1: IMPROVED HUNTER API EMAIL EXTRACTION
-        btn_col1, btn_col2 = st.columns(2)
-        with btn_col1:
-            enrich_key = f"hunter_{company.replace(' ', '_')}_{idx}"
-            if st.button(f"🔍 Find Real Email — {company}", key=enrich_key):
-                lead_data = st.session_state.leads_data[idx] if idx < len(st.session_state.leads_data) else {}
-                fn = lead_data.get("first_name", f_name)
-                ln = lead_data.get("last_name", l_name)
-                with st.spinner(f"Searching Hunter.io for {fn} {ln} at {company}..."):
-                    found_email, status_msg = get_hunter_email(fn, ln, company)
-                    if found_email:
-                        st.markdown(f'<div class="hunter-success">✅ Email found: {found_email}<br><small>{status_msg}</small></div>', unsafe_allow_html=True)
-                        if idx < len(st.session_state.leads_data):
-                            st.session_state.leads_data[idx]["email"] = found_email
-                        st.rerun()
-                    else:
-                        st.markdown(f'<div class="hunter-fail">⚠️ {status_msg}<br>Try LinkedIn to connect directly.</div>', unsafe_allow_html=True)
-
-        with btn_col2:
-            button_key = f"send_email_{company.replace(' ', '_')}_{idx}"
-            st.button(
-                f"🚀 Send Email to {company}",
-                key=button_key,
-                on_click=handle_email_dispatch,
-                args=(email_to, email_sub, email_body, company)
-            )
-        st.markdown("<br>", unsafe_allow_html=True)
+    lead_emails = [lead_email_for(msg) for msg in messages_list]
+    outgoing = [
+        (email_to, str(msg.get("email_subject", "")), str(msg.get("email_body", "")),
+         str(msg.get("company", "Lead " + str(idx + 1))))
+        for idx, (msg, email_to) in enumerate(zip(messages_list, lead_emails)) if is_email_address(email_to)
+    ]
+    if outgoing and st.button(f"📨 Send all {len(outgoing)} emails", key="send_all_emails"):
+        _, mail_error = queue_lead_emails(outgoing)
+        if mail_error:
+            st.error(f"❌ {mail_error}")
+    mail_pending = any(job["status"] not in (MAIL_SENT, MAIL_FAILED) for job in session_mail_jobs())
+    st.fragment(show_mail_status, run_every=2 if mail_pending else None)(mail_pending)
+    for idx in range(len(messages_list)):
+        st.fragment(show_lead_card)(idx)
 
     # PHASE 4 — AUTO REPLY
     if auto_reply_enabled and "auto_replies" in st.session_state.pipeline_results:
         show_phase_header("phase-auto", "&#128260;", "Phase 4: Auto-Responder — Conversation Simulation", "AI simulates client reply and generates follow-up")
         auto_replies = st.session_state.pipeline_results["auto_replies"]
-        scenario_colors = {
-            "interested": "#00c851", "needs_more_info": "#ffaa00",
-            "price_sensitive": "#ff8800", "requesting_visit": "#4285f4",
-            "not_interested": "#ff4444",
-        }
         for reply in auto_replies:
-            scenario = str(reply.get("reply_scenario", ""))
-            scenario_col = scenario_colors.get(scenario, "#7a8ba0")
-            escalate = reply.get("escalate_to_human", False)
-            escalate_html = (
-                '<span style="background:#1a0a0a;color:#ff4444;border:1px solid #ff4444;padding:3px 10px;border-radius:10px;font-size:0.72rem;font-weight:700;">ESCALATE TO HUMAN</span>'
-                if escalate else
-                '<span style="background:#0a1a0a;color:#00c851;border:1px solid #00c851;padding:3px 10px;border-radius:10px;font-size:0.72rem;font-weight:700;">AUTO-HANDLED</span>'
-            )
-            st.markdown(
-                '<div class="lead-card" style="border-color:#1a3a0a;">'
-                '<div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:14px;">'
-                '<p class="lead-name">' + esc(reply.get("company", "")) + "</p>"
-                '<div style="display:flex;gap:10px;align-items:center;">'
-                '<span style="color:' + scenario_col + ';font-size:0.8rem;font-weight:700;text-transform:uppercase;">' + esc(scenario.replace("_", " ")) + "</span>" + escalate_html + "</div></div>"
-                '<div class="conversation-entry"><div class="conv-from">Simulated Client Reply:</div>'
-                '<div class="conv-msg" style="color:#e0e6f0;font-style:italic;">' + esc(reply.get("simulated_client_reply", "")) + "</div></div>"
-                '<div class="autoreply-box"><div class="autoreply-label">Our Auto WhatsApp Reply</div>'
-                '<div class="autoreply-text">' + esc(reply.get("auto_response_whatsapp", "")) + "</div></div>"
-                '<div style="margin-top:10px;padding:10px;background:#0a0d14;border:1px solid #1e2a3e;border-radius:8px;">'
-                '<p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;margin-bottom:4px;">Next Action</p>'
-                '<p style="color:#b0bec5;font-size:0.84rem;">' + esc(reply.get("next_action", "")) + "</p></div></div>",
-                unsafe_allow_html=True,
-            )
+            st.markdown(auto_reply_card_html(reply), unsafe_allow_html=True)
 
     # PHASE 5 — RAG INTELLIGENCE
     if "rag_insights" in st.session_state.pipeline_results:
         show_phase_header("phase-rag", "&#129302;", "Phase 5: RAG Intelligence — Market Insights", "Deep analysis using all pipeline data")
         
         rag_insights = st.session_state.pipeline_results.get("rag_insights", "")
-        st.markdown(
-            '<div class="rag-box"><div class="rag-label">📊 AI Market Intelligence Report</div>'
-            '<div class="rag-text">' + esc(rag_insights) + "</div></div>",
-            unsafe_allow_html=True,
-        )
+        st.markdown(rag_box_html("📊 AI Market Intelligence Report", rag_insights), unsafe_allow_html=True)
 
-        # RAG Q&A
-        st.markdown("#### 💬 Ask AI About Your Leads")
-        st.caption("Ask anything about the discovered leads, strategies, or market — AI answers from pipeline data")
-        
-        rag_question = st.text_input(
-            "Your question:",
-            placeholder="e.g. Which lead has the highest revenue potential? What are the common objections?",
-            key="rag_question"
-        )
-        if st.button("🧠 Get AI Answer", key="rag_ask"):
-            if rag_question:
-                with st.spinner("Searching pipeline data..."):
-                    answer = rag_query(
-                        rag_question,
-                        st.session_state.rag_context,
-                        our_company, our_product
-                    )
-                st.markdown(
-                    '<div class="rag-box"><div class="rag-label">🧠 AI Answer</div>'
-                    '<div class="rag-text">' + esc(answer) + "</div></div>",
-                    unsafe_allow_html=True,
-                )
+        st.fragment(show_rag_qa)(our_company, our_product)
 
     # EXPORTS
     st.success("✅ Full 5-Agent Pipeline Complete!")
@@ -1097,18 +764,8 @@ if simulate_reply and st.session_state.pipeline_results:
     if st.button("Generate Smart Auto-Reply") and client_reply_input:
         with st.spinner("Generating response..."):
             try:
-                manual_prompt = (
-                    "You are the sales AI for " + our_company + ".\n"
-                    "OUR OFFERING: " + our_product + "\n"
-                    "TONE: " + reply_tone + "\n"
-                    "COMPANY: " + reply_company + "\n"
-                    "CLIENT SAID: " + client_reply_input + "\n\n"
-                    "Write a response that addresses their message, provides relevant info, and moves toward a meeting.\n"
-                    "Return ONLY valid JSON: {whatsapp_reply, email_reply, next_step}\n"
-                    "Start with { end with }"
-                )
-                manual_res, _ = call_gemini_with_retry(manual_prompt)
-                manual_data = safe_json_parse(manual_res.text, {})
+                manual_data = request_object("manual_reply", lambda note: agent_gemini_manual_reply(
+                    model_client(), client_reply_input, reply_company, our_product, our_company, reply_tone, note=note))
                 if manual_data:
                     st.markdown(
                         '<div class="autoreply-box"><div class="autoreply-label">WhatsApp Reply</div>'
@@ -0,0 +1,148 @@
+"""Fire-and-forget audit log shipped to the Google Sheet in the background.
+
+``AuditLog.log`` only puts the event on a bounded in-memory queue, so a login
+never waits on the network. A daemon worker appends queued events to a JSONL
+spool file (durable across restarts), then posts them to the Apps Script
+endpoint in batches over the shared keep-alive session, advancing a byte offset as
+each event is accepted. When the endpoint is slow or down the worker backs
+off exponentially and the events simply wait in the spool.
+"""
+
+import contextlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from http_client import shared_session
+from lazy_imports import lazy_module
+from telemetry import span
+
+requests = lazy_module("requests")
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX hosts fall back to the in-process lock only
+    fcntl = None
+
+
+class AuditLog:
+    def __init__(self, url, spool_path, max_queue=1000, batch_size=20, flush_interval=2.0, timeout=5.0,
+                 base_delay=2.0, max_delay=300.0, session=None):
+        self.url = url
+        self.spool_path = spool_path
+        self.offset_path = spool_path + ".offset"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = session or shared_session()
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(spool_path)), exist_ok=True)
+        self._worker = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._worker.start()
+
+    def log(self, event):
+        """Queue one event without blocking; drops it if the queue is full."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    # ----- worker -----
+    def _run(self):
+        while True:
+            events = []
+            try:
+                events.append(self._queue.get(timeout=self.flush_interval))
+                while True:
+                    events.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                if events:
+                    self._spool(events)
+                while time.monotonic() >= self._retry_at and self._flush():
+                    pass
+            except Exception:
+                pass  # never let a bad disk or payload kill the worker
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Serialise spool access across Streamlit processes on the same host."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.spool_path + ".lock", "w") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _spool(self, events):
+        with self._lock, self._file_lock():
+            with open(self.spool_path, "a", encoding="utf-8") as spool:
+                for event in events:
+                    spool.write(json.dumps(event, default=str) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path, encoding="utf-8") as handle:
+                return int(handle.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as handle:
+            handle.write(str(offset))
+        os.replace(tmp, self.offset_path)
+
+    def _read_batch(self, limit):
+        """Return ``([(line, end_offset)], file_size)`` starting at the saved offset."""
+        if not os.path.exists(self.spool_path):
+            return [], 0
+        batch = []
+        with open(self.spool_path, "rb") as spool:
+            spool.seek(self._read_offset())
+            while len(batch) < limit:
+                line = spool.readline()
+                if not line.endswith(b"\n"):
+                    break  # absent or half-written: wait for the next pass
+                batch.append((line, spool.tell()))
+            spool.seek(0, os.SEEK_END)
+            return batch, spool.tell()
+
+    def _flush(self):
+        """Ship one batch; returns True when a full batch went out and more may be waiting."""
+        with self._lock, self._file_lock():
+            batch, size = self._read_batch(self.batch_size)
+            for line, end in batch:
+                try:
+                    # The Apps Script takes one event per POST; the session keeps the connection warm.
+                    with span("apps_script.post"):
+                        resp = self._session.post(self.url, data=line.decode("utf-8").strip(), timeout=self.timeout)
+                        if resp.status_code >= 500 or resp.status_code == 429:
+                            raise requests.HTTPError(f"HTTP {resp.status_code}")
+                except Exception:
+                    self._failures += 1
+                    delay = min(self.max_delay, self.base_delay * (2 ** (self._failures - 1)))
+                    self._retry_at = time.monotonic() + random.uniform(delay / 2.0, delay)
+                    return False
+                self._failures = 0
+                self._write_offset(end)
+            if batch and batch[-1][1] == size:
+                # Everything shipped: start the spool afresh so it never grows unbounded.
+                open(self.spool_path, "w").close()
+                self._write_offset(0)
+            return len(batch) == self.batch_size
@@ -1,14 +1,16 @@
 import streamlit as st
-import requests
-import smtplib
-import random
 from datetime import datetime
-import json
-import base64
-from pathlib import Path
-from email.mime.text import MIMEText
+import os
 from urllib.parse import urlencode
 
+from audit_log import AuditLog
+from google_oauth import TOKEN_URL, USERINFO_URL, verify_id_token
+from http_client import shared_session
+from mail_queue import FAILED, SENT, OutboundQueue, SMTPConnection, build_message
+from otp_store import OTPStore
+from static_assets import file_base64, style_tag
+from telemetry import span
+
 # --- CONFIGURATION ---
 SCRIPT_URL = "https://script.google.com/macros/s/AKfycbxxkHAi7kn24BChb4zQktRE-u4kPY-sn9L96FLIqw4-czxzms03iCP1eNnPUGrAB_5HxA/exec"
 GMAIL_USER = "shgarampalli@gmail.com"
@@ -19,16 +21,21 @@ REDIRECT_URI = st.secrets["google_oauth"]["redirect_uri"]
 
 # --- LOAD LOGO ---
 def get_logo_base64():
-    logo_path = Path("logo_samketan.png")
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    return None
+    return file_base64("logo_samketan.png")
 
 # --- EMAIL OTP ---
+@st.cache_resource(show_spinner=False)
+def get_otp_mailer():
+    """Two logged-in Gmail sessions shared by every login on this process."""
+    return OutboundQueue(
+        [SMTPConnection('smtp.gmail.com', 465, GMAIL_USER, GMAIL_PASS) for _ in range(2)],
+        rate_per_minute=60, max_retries=2, base_delay=1.0,
+    )
+
 def send_otp_email(receiver_email, otp_code):
+    """Queue the code email and return its job id right away (None if it could not be queued)."""
     try:
-        msg = MIMEText(f"""
+        body = f"""
 Dear User,
 
 Your Samketan AI verification code is:
@@ -38,44 +45,109 @@ Your Samketan AI verification code is:
 This code is valid for 10 minutes. Do not share it with anyone.
 
 — Samketan AI | B2B Lead Generation Platform
-        """.strip())
-        msg['Subject'] = '🔐 Samketan AI — Your Access Code'
-        msg['From'] = f"Samketan AI <{GMAIL_USER}>"
-        msg['To'] = receiver_email
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_USER, GMAIL_PASS)
-            server.send_message(msg)
-        return True
+        """.strip()
+        msg = build_message(GMAIL_USER, receiver_email, '🔐 Samketan AI — Your Access Code', body, "Samketan AI")
+        return get_otp_mailer().submit(msg, label="otp")
     except Exception as e:
         st.error(f"Email Error: {e}")
-        return False
+        return None
+
+@st.cache_resource(show_spinner=False)
+def get_otp_store():
+    """Codes shared by every session; set OTP_STORE = "sqlite" to share them across processes too."""
+    db_path = None
+    if st.secrets.get("OTP_STORE", "memory") == "sqlite":
+        db_path = os.path.join(st.secrets.get("SAMKETAN_DATA_DIR", ".samketan_data"), "otp.sqlite3")
+    return OTPStore(ttl=600, db_path=db_path)
+
+def forwarded_client(forwarded, trusted_proxies):
+    """The X-Forwarded-For hop our ``trusted_proxies`` proxies saw the request come from.
+
+    Each proxy appends the address it was connected from, so only the
+    right-most hops are trustworthy; anything further left is whatever the
+    client chose to send.
+    """
+    hops = [hop.strip() for hop in str(forwarded or "").split(",") if hop.strip()]
+    if not hops:
+        return None
+    return hops[-min(trusted_proxies, len(hops))]
+
+def client_ip():
+    """Best-effort client address for throttling.
+
+    Behind ``TRUSTED_PROXIES`` reverse proxies (a secret, 0 by default) the
+    address comes from X-Forwarded-For; otherwise it is the socket peer, since
+    a header set by the client itself would let it dodge the per-IP limit.
+    """
+    try:
+        trusted_proxies = int(st.secrets.get("TRUSTED_PROXIES", 0) or 0)
+        if trusted_proxies > 0:
+            client = forwarded_client(st.context.headers.get("X-Forwarded-For", ""), trusted_proxies)
+            if client:
+                return client
+        return getattr(st.context, "ip_address", None)
+    except Exception:
+        return None
+
+def otp_delivery_status(was_pending):
+    """Pending / sent / failed line for the queued code email, polled from a fragment."""
+    job = get_otp_mailer().job(st.session_state.get("otp_job_id"))
+    if job is None:
+        return
+    if job["status"] == SENT:
+        st.success(f"✓ Code sent to {job['to']}")
+    elif job["status"] == FAILED:
+        st.error(f"Email Error: {job['error']}")
+        if st.button("← Re-enter email", key="otp_retry"):
+            st.session_state.otp_sent = False
+            st.rerun()
+    else:
+        st.info("Sending your code…")
+        return
+    if was_pending:
+        st.rerun()  # delivery settled: stop polling
 
 # --- GOOGLE SHEET LOG ---
+@st.cache_resource(show_spinner=False)
+def get_audit_log():
+    """One spool + background shipper per process; logins only enqueue."""
+    data_dir = st.secrets.get("SAMKETAN_DATA_DIR", ".samketan_data")
+    return AuditLog(SCRIPT_URL, os.path.join(data_dir, "login_audit.jsonl"))
+
 def log_to_google_sheet(user_info, method):
     try:
-        data = {
+        get_audit_log().log({
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "contact": user_info,
             "method": method
-        }
-        requests.post(SCRIPT_URL, data=json.dumps(data))
-    except:
+        })
+    except Exception:
         pass
 
 # --- GOOGLE OAUTH HANDLERS ---
-def get_google_auth_url():
-    """Build Google OAuth URL — opens Google login popup with strict path cleaning"""
+@st.cache_resource(show_spinner=False)
+def get_oauth_config():
+    """Client id/secret and the cleaned redirect URI, read from secrets once per process."""
     try:
-        client_id = st.secrets["google_oauth"]["client_id"]
+        return {
+            "client_id": st.secrets["google_oauth"]["client_id"],
+            "client_secret": st.secrets["google_oauth"]["client_secret"],
+            # Removes any accidental background trailing slashes to guarantee exact console match
+            "redirect_uri": REDIRECT_URI.rstrip('/'),
+        }
     except Exception:
         return None
-    
-    # Removes any accidental background trailing slashes to guarantee exact console match
-    clean_redirect_uri = REDIRECT_URI.rstrip('/')
-    
+
+
+def get_google_auth_url():
+    """Build Google OAuth URL — opens Google login popup with strict path cleaning"""
+    config = get_oauth_config()
+    if not config:
+        return None
+
     params = {
-        "client_id": client_id,
-        "redirect_uri": clean_redirect_uri,
+        "client_id": config["client_id"],
+        "redirect_uri": config["redirect_uri"],
         "response_type": "code",
         "scope": "openid email profile",
         "access_type": "offline",
@@ -85,40 +157,50 @@ def get_google_auth_url():
 
 
 def exchange_code_for_user(code):
-    """Exchange authorization code for user profile properties natively via requests"""
-    try:
-        client_id     = st.secrets["google_oauth"]["client_id"]
-        client_secret = st.secrets["google_oauth"]["client_secret"]
-    except Exception as e:
-        return None, f"Secrets error: {e}"
+    """Exchange the authorization code and read the profile from the verified ID token.
 
-    clean_redirect_uri = REDIRECT_URI.rstrip('/')
+    One pooled HTTPS call in the common case; /userinfo is only asked when the
+    ID token is missing or cannot be verified.
+    """
+    config = get_oauth_config()
+    if not config:
+        return None, "Secrets error: google_oauth client_id / client_secret missing"
 
+    session = shared_session()
     try:
-        token_resp = requests.post("https://oauth2.googleapis.com/token", data={
-            "code": code,
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "redirect_uri": clean_redirect_uri,
-            "grant_type": "authorization_code",
-        }, timeout=10)
-        token_data = token_resp.json()
+        with span("google_oauth.token"):
+            token_resp = session.post(TOKEN_URL, data={
+                "code": code,
+                "client_id": config["client_id"],
+                "client_secret": config["client_secret"],
+                "redirect_uri": config["redirect_uri"],
+                "grant_type": "authorization_code",
+            }, timeout=10)
+            token_data = token_resp.json()
     except Exception as network_err:
         return None, f"Handshake network failure: {network_err}"
 
     if "error" in token_data:
         return None, f"Token validation crash: {token_data.get('error_description', token_data['error'])}"
 
-    access_token = token_data.get("access_token")
-    if not access_token:
-        return None, "No active access token block delivered."
-
-    try:
-        user_resp = requests.get("https://www.googleapis.com/oauth2/v2/userinfo",
-                                 headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
-        user_data = user_resp.json()
-    except Exception as info_err:
-        return None, f"User parsing target missing: {info_err}"
+    user_data = {}
+    if token_data.get("id_token"):
+        try:
+            user_data = verify_id_token(token_data["id_token"], config["client_id"])
+        except Exception:
+            user_data = {}
+
+    if not user_data.get("email"):
+        access_token = token_data.get("access_token")
+        if not access_token:
+            return None, "No active access token block delivered."
+        try:
+            with span("google_oauth.userinfo"):
+                user_resp = session.get(
+                    USERINFO_URL, headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
+                user_data = user_resp.json()
+        except Exception as info_err:
+            return None, f"User parsing target missing: {info_err}"
 
     email = user_data.get("email")
     name  = user_data.get("name", email)
@@ -163,40 +245,7 @@ def inject_css(logo_b64=None):
     st.markdown('<meta name="google-site-verification" content="NToh75b655cIVA891yX1QYqoLhvDFPi_lKZCmkfXYyM" />', unsafe_allow_html=True)
     st.markdown('<meta name="google-site-verification" content="1l1acsuRs_JTla17cgZxDFR8fkYF46y1fBxfGin7lNw" />', unsafe_allow_html=True)
 
-    st.markdown(f"""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@600;700&family=DM+Sans:wght@300;400;500&display=swap');
-    #MainMenu, footer, header {{ visibility: hidden; }}
-    .block-container {{ padding: 0 !important; max-width: 100% !important; }}
-    section[data-testid="stSidebar"] {{ display: none; }}
-    [data-testid="manage-app-button"], .stDeployButton, div[class*="StatusWidget"] {{ display: none !important; }}
-    .stApp {{ background: #f0f2f7 !important; font-family: 'DM Sans', sans-serif; }}
-    div[data-testid="stTextInput"] > div > div > input {{
-        font-family: 'DM Sans', sans-serif !important; border-radius: 9px !important;
-        border: 1px solid #d0d7e8 !important; padding: 10px 14px !important;
-        font-size: 14px !important; background: #f8f9fc !important; color: #0D1B3E !important;
-    }}
-    div[data-testid="stTextInput"] > div > div > input:focus {{
-        border-color: #378ADD !important; background: #fff !important;
-        box-shadow: 0 0 0 3px rgba(55,138,221,0.12) !important;
-    }}
-    div[data-testid="stTextInput"] label {{
-        font-family: 'DM Sans', sans-serif !important; font-size: 12px !important;
-        font-weight: 500 !important; color: #4a5a8a !important;
-        letter-spacing: 0.04em !important; text-transform: uppercase !important;
-    }}
-    div[data-testid="stButton"] > button {{
-        font-family: 'DM Sans', sans-serif !important; background: #0D1B3E !important;
-        color: #fff !important; border: none !important; border-radius: 9px !important;
-        padding: 0.6rem 1.5rem !important; font-size: 14px !important;
-        font-weight: 500 !important; letter-spacing: 0.04em !important;
-        width: 100% !important; transition: background 0.2s !important;
-    }}
-    div[data-testid="stButton"] > button:hover {{ background: #1a3160 !important; }}
-    div[data-testid="stSuccess"] {{ border-radius: 9px !important; font-size: 13px !important; }}
-    div[data-testid="stError"] {{ border-radius: 9px !important; font-size: 13px !important; }}
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(style_tag("login.css"), unsafe_allow_html=True)
 
     st.markdown(f"""
     <div style="background:#0D1B3E;border-radius:20px 0 0 20px;padding:2.5rem 2rem;
@@ -353,12 +402,14 @@ def login_screen():
 
             if st.button("Send Verification Code →"):
                 if user_email and "@" in user_email:
-                    generated_otp = str(random.randint(100000, 999999))
-                    st.session_state.correct_otp = generated_otp
-                    if send_otp_email(user_email, generated_otp):
+                    generated_otp, throttled = get_otp_store().issue(user_email, client_ip())
+                    job_id = send_otp_email(user_email, generated_otp) if generated_otp else None
+                    if throttled:
+                        st.error(throttled)
+                    elif job_id:
+                        st.session_state.otp_job_id = job_id
                         st.session_state.otp_sent = True
                         st.session_state.current_user = user_email
-                        st.success(f"✓ Code sent to {user_email}")
                         st.rerun()
                 else:
                     st.error("Please enter a valid business email address.")
@@ -376,16 +427,20 @@ def login_screen():
 
             email_display = st.session_state.get("current_user", "your email")
             st.markdown(f'<p style="font-family:\'DM Sans\',sans-serif;font-size:13px;color:#7b8aab;margin-bottom:0.5rem;">Code sent to <strong style="color:#0D1B3E;">{email_display}</strong></p>', unsafe_allow_html=True)
+            otp_job = get_otp_mailer().job(st.session_state.get("otp_job_id"))
+            otp_pending = otp_job is not None and otp_job["status"] not in (SENT, FAILED)
+            st.fragment(otp_delivery_status, run_every=1 if otp_pending else None)(otp_pending)
 
             otp_input = st.text_input("6-Digit Verification Code", type="password", placeholder="••••••", key="otp_input", max_chars=6)
             if st.button("Verify & Enter Platform →"):
-                if otp_input == st.session_state.get("correct_otp"):
+                verified, reason = get_otp_store().verify(st.session_state.get("current_user"), otp_input)
+                if verified:
                     log_to_google_sheet(st.session_state.current_user, "Email OTP")
                     st.session_state.authenticated = True
                     st.success("✓ Access granted. Loading platform...")
                     st.rerun()
                 else:
-                    st.error("Incorrect code. Please check your inbox and try again.")
+                    st.error(reason)
 
             st.markdown('<p style="font-family:\'DM Sans\',sans-serif;font-size:12px;color:#7b8aab;text-align:center;margin-top:0.5rem;">Didn\'t receive it? Check your spam folder, or go back and re-enter your email.</p>', unsafe_allow_html=True)
 
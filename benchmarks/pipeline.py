@@ -0,0 +1,241 @@
+"""Per-stage pipeline benchmark across lead counts, written out as JSON.
+
+Runs the headless pipeline (see ``replay.py``) on the offline replay backend
+for each lead count and records, per stage: wall time, model calls, prompt
+and reply size (characters and estimated tokens), time to parse each reply
+the way the pipeline does, and how often that parse came back empty.
+``--malformed-rate`` makes the replay backend break some replies so the
+parse failure rate means something; ``--recordings`` replays captured live
+replies instead of synthetic ones.
+
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --leads 3 5 10 --runs 5 --output results.json
+    python benchmarks/pipeline.py --baseline benchmarks/results/previous.json --max-regression 0.15
+
+``--baseline`` compares wall time and prompt tokens with an earlier results
+file and exits 1 when a stage grew by more than ``--max-regression``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from replay import ROOT, SETTINGS, make_knowledge_base, percentile, run_once  # puts the app on sys.path
+
+from agents import ModelClient, parse_leads_table
+from model_router import ModelRouter, estimate_tokens
+from replay_llm import ReplayProvider, Recordings
+from structured_output import parse_structured
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Changes below these sizes are noise, not regressions (an archive write, a tiny prompt).
+NOISE_FLOOR = {"wall_p50": 0.05, "prompt_tokens": 50}
+
+# Which pipeline stage each agent's calls belong to.
+AGENT_STAGES = {
+    "scout": "scout", "strategist": "strategist", "communicator": "communicator", "autoresponder": "auto",
+    "rag_insights": "rag",
+}
+
+
+def _structured(agent):
+    return lambda text: parse_structured(agent, text)[0]
+
+
+# How the pipeline parses each agent's reply; no valid item is a failed parse.
+PARSERS = {
+    "scout": parse_leads_table,
+    "strategist": _structured("strategist"),
+    "communicator": _structured("communicator"),
+    "autoresponder": _structured("autoresponder"),
+}
+
+
+class MeteredClient:
+    """Wraps a ModelClient and keeps every successful call's agent, sizes, time and reply."""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, agent=None, on_text=None):
+        started = time.perf_counter()
+        response, model_name = self.llm(prompt, agent=agent, on_text=on_text)
+        record = {"agent": agent, "prompt": prompt, "reply": response.text, "seconds": time.perf_counter() - started}
+        with self._lock:
+            self.calls.append(record)
+        return response, model_name
+
+    def take(self):
+        with self._lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+
+def parse_cost(agent, text, repeat):
+    """``(milliseconds per parse, parsed something)`` for one reply."""
+    parser = PARSERS[agent]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parsed = parser(text)
+    return (time.perf_counter() - started) * 1000 / repeat, bool(parsed)
+
+
+def stage_metrics(calls, states, repeat):
+    """Per-stage figures for one run."""
+    stages = {name: {"wall": state.elapsed, "status": state.status} for name, state in states.items()}
+    for call in calls:
+        stage = stages.setdefault(AGENT_STAGES.get(call["agent"], call["agent"]), {"wall": None, "status": None})
+        stage["calls"] = stage.get("calls", 0) + 1
+        stage["prompt_chars"] = stage.get("prompt_chars", 0) + len(call["prompt"])
+        stage["prompt_tokens"] = stage.get("prompt_tokens", 0) + estimate_tokens(call["prompt"])
+        stage["output_chars"] = stage.get("output_chars", 0) + len(call["reply"])
+        stage["output_tokens"] = stage.get("output_tokens", 0) + estimate_tokens(call["reply"])
+        stage["model_seconds"] = stage.get("model_seconds", 0.0) + call["seconds"]
+        if call["agent"] in PARSERS:
+            ms, ok = parse_cost(call["agent"], call["reply"], repeat)
+            stage["parse_ms"] = stage.get("parse_ms", 0.0) + ms
+            stage["parses"] = stage.get("parses", 0) + 1
+            stage["parse_failures"] = stage.get("parse_failures", 0) + (not ok)
+    return stages
+
+
+def summarise(runs):
+    """p50/p95 wall time per stage plus mean sizes and the overall parse failure rate."""
+    summary = {"wall": {"p50": percentile([r["seconds"] for r in runs], 0.5),
+                        "p95": percentile([r["seconds"] for r in runs], 0.95)}, "stages": {}}
+    for name in runs[0]["stages"]:
+        per_run = [r["stages"].get(name, {}) for r in runs]
+        walls = [s["wall"] for s in per_run if s.get("wall") is not None]
+        entry = {"wall_p50": percentile(walls, 0.5), "wall_p95": percentile(walls, 0.95)}
+        for key in ("calls", "prompt_chars", "prompt_tokens", "output_chars", "output_tokens"):
+            entry[key] = sum(s.get(key, 0) for s in per_run) / len(per_run)
+        parses = sum(s.get("parses", 0) for s in per_run)
+        if parses:
+            entry["parse_ms"] = sum(s.get("parse_ms", 0.0) for s in per_run) / parses
+            entry["parse_failure_rate"] = sum(s.get("parse_failures", 0) for s in per_run) / parses
+        summary["stages"][name] = entry
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """Print stage-by-stage changes against ``baseline``; returns the regressions found."""
+    previous = {entry["leads"]: entry["summary"] for entry in baseline.get("results", [])}
+    regressions = []
+    print(f"\nagainst {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')}):")
+    for entry in results:
+        old = previous.get(entry["leads"])
+        if old is None:
+            continue
+        for name, stage in entry["summary"]["stages"].items():
+            before = old["stages"].get(name)
+            if not before:
+                continue
+            for key in ("wall_p50", "prompt_tokens"):
+                if not before.get(key) or max(before[key], stage[key]) < NOISE_FLOOR[key]:
+                    continue
+                change = stage[key] / before[key] - 1
+                flag = ""
+                if change > max_regression:
+                    flag = "  REGRESSION"
+                    regressions.append((entry["leads"], name, key, change))
+                print(f"  {entry['leads']:2d} leads {name:13s} {key:14s} {before[key]:10.2f} -> {stage[key]:10.2f}"
+                      f"  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leads", type=int, nargs="+", default=[3, 5, 8, 10], help="lead counts to benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="runs per lead count")
+    parser.add_argument("--warmup", type=int, default=1, help="unrecorded runs first (index build, imports)")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per model call before generation")
+    parser.add_argument("--tokens-per-second", type=float, default=250.0, help="simulated generation speed")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--malformed-rate", type=float, default=0.1, help="share of replies with broken JSON")
+    parser.add_argument("--recordings", help="JSONL (LLM_RECORD_PATH) or JSON file of recorded replies")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel model calls")
+    parser.add_argument("--shard-size", type=int, default=1, help="leads per Strategist/Communicator call")
+    parser.add_argument("--no-shard", action="store_true", help="one Strategist/Communicator call for all leads")
+    parser.add_argument("--no-kb", action="store_true", help="skip the knowledge base (RAG search and archive)")
+    parser.add_argument("--parse-repeat", type=int, default=20, help="parses per reply when timing parsing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed growth against --baseline")
+    args = parser.parse_args(argv)
+
+    provider = ReplayProvider(
+        recordings=Recordings.load(args.recordings) if args.recordings else None, latency=args.latency,
+        jitter=args.jitter, tokens_per_second=args.tokens_per_second, malformed_rate=args.malformed_rate,
+        seed=args.seed, concurrency=args.concurrency,
+    )
+    llm = MeteredClient(ModelClient(ModelRouter([provider])))
+    results = []
+    with tempfile.TemporaryDirectory(prefix="samketan-bench-") as workdir:
+        kb = None if args.no_kb else make_knowledge_base(workdir)
+        for _ in range(args.warmup):
+            run_once(llm, dict(SETTINGS, num_leads=args.leads[0]), kb)
+            llm.take()
+        for leads in args.leads:
+            settings = dict(SETTINGS, num_leads=leads, shard_agents=not args.no_shard, shard_size=args.shard_size,
+                            max_parallel_calls=args.concurrency)
+            runs = []
+            for _ in range(args.runs):
+                seconds, data, states = run_once(llm, settings, kb)
+                runs.append({"seconds": seconds, "leads_found": len(data.get("leads", [])),
+                             "stages": stage_metrics(llm.take(), states, args.parse_repeat)})
+            results.append({"leads": leads, "runs": runs, "summary": summarise(runs)})
+
+    print(f"{'leads':>5s} {'stage':13s} {'p50 s':>7s} {'p95 s':>7s} {'calls':>6s} {'prompt tok':>10s} "
+          f"{'output tok':>10s} {'parse ms':>9s} {'parse fail':>10s}")
+    for entry in results:
+        print(f"{entry['leads']:5d} {'(total)':13s} {entry['summary']['wall']['p50']:7.2f} "
+              f"{entry['summary']['wall']['p95']:7.2f}")
+        for name, stage in entry["summary"]["stages"].items():
+            parse = (f"{stage['parse_ms']:9.3f} {stage['parse_failure_rate']:10.1%}"
+                     if "parse_ms" in stage else f"{'':9s} {'':10s}")
+            print(f"{'':5s} {name:13s} {stage['wall_p50']:7.2f} {stage['wall_p95']:7.2f} {stage['calls']:6.1f} "
+                  f"{stage['prompt_tokens']:10.0f} {stage['output_tokens']:10.0f} {parse}")
+
+    report = {
+        "benchmark": "pipeline",
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, "pipeline-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.max_regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Prompt size of each agent hand-off: compact tables against the old JSON payloads.
+
+Builds replay leads and strategy for each lead count, renders the prompts the
+Strategist, Communicator and RAG agents are sent (sharded and in one call) and
+compares their estimated tokens with what the same prompts cost when the
+data went in as indented JSON and the Scout's raw table.
+
+    python benchmarks/prompts.py
+    python benchmarks/prompts.py --leads 3 10 25 --shard-size 2
+"""
+
+import argparse
+import json
+import sys
+from types import SimpleNamespace
+
+from replay import SETTINGS  # puts the app on sys.path
+
+from agents import (
+    agent_gemini_communicator, agent_gemini_rag_insights, agent_gemini_strategist, chunk_list, parse_leads_table,
+)
+from handoff import handoff_table
+from model_router import estimate_tokens
+from replay_llm import synth_scout, synth_strategist
+
+_OLD_LEAD_FIELDS = [
+    "company", "address", "first_name", "last_name", "phone",
+    "decision_maker_role", "why_need", "sector", "deal_size", "person_linkedin",
+]
+
+
+def old_leads_table(leads):
+    """The Scout's pipe table, as the Strategist used to receive it."""
+    return "\n".join(" | ".join(str(lead.get(f, "")) for f in _OLD_LEAD_FIELDS) for lead in leads)
+
+
+class PromptRecorder:
+    """Stands in for a ModelClient: keeps each prompt and replies with nothing."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt, agent=None, on_text=None):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text="[]"), "recorder"
+
+
+def prompt_for(call):
+    recorder = PromptRecorder()
+    call(recorder)
+    return recorder.prompts[0]
+
+
+def hand_offs(leads, strategy, shard_size):
+    """``{agent: [(prompt, compact payload, old payload), ...]}`` for one set of leads."""
+    cfg = SETTINGS
+    strategist = lambda llm, text: agent_gemini_strategist(  # noqa: E731
+        llm, text, cfg["our_product"], cfg["our_company"], cfg["my_product"], cfg["reply_tone"])
+    communicator = lambda llm, s, l: agent_gemini_communicator(  # noqa: E731
+        llm, s, l, cfg["our_product"], cfg["our_company"], cfg["our_contact"], cfg["our_website"], cfg["our_email"],
+        cfg["reply_tone"])
+    by_company = {s["company"]: s for s in strategy}
+    calls = {"strategist": [], "communicator": [], "rag_insights": []}
+    for shard in [leads] + (chunk_list(leads, shard_size) if shard_size else []):
+        shard_strategy = [by_company[lead["company"]] for lead in shard if lead["company"] in by_company]
+        table = handoff_table("strategist", shard)
+        calls["strategist"].append((prompt_for(lambda llm: strategist(llm, table)), table, old_leads_table(shard)))
+        calls["communicator"].append((
+            prompt_for(lambda llm: communicator(llm, shard_strategy, shard)),
+            handoff_table("communicator", shard, shard_strategy),
+            json.dumps(shard, indent=2) + json.dumps(shard_strategy, indent=2),
+        ))
+    calls["rag_insights"].append((
+        prompt_for(lambda llm: agent_gemini_rag_insights(
+            llm, leads, strategy, cfg["our_product"], cfg["our_company"], cfg["region"])),
+        handoff_table("rag_insights", leads[:5], strategy[:5]),
+        json.dumps(leads[:5], indent=2) + json.dumps(strategy[:5], indent=2),
+    ))
+    return calls
+
+
+def measure(calls, sharded):
+    """Old and new payload and prompt tokens, summed over the calls one run makes."""
+    picked = calls[1:] if sharded and len(calls) > 1 else calls[:1]
+    payload_new = sum(estimate_tokens(compact) for _, compact, _ in picked)
+    payload_old = sum(estimate_tokens(old) for _, _, old in picked)
+    prompt_new = sum(estimate_tokens(prompt) for prompt, _, _ in picked)
+    return {"payload_old": payload_old, "payload_new": payload_new,
+            "prompt_old": prompt_new - payload_new + payload_old, "prompt_new": prompt_new}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leads", type=int, nargs="+", default=[3, 5, 10, 25], help="lead counts to measure")
+    parser.add_argument("--shard-size", type=int, default=1, help="leads per sharded Strategist/Communicator call")
+    args = parser.parse_args(argv)
+
+    print(f"{'leads':>5s} {'agent':13s} {'mode':8s} {'payload old':>11s} {'new':>6s} {'prompt old':>10s} {'new':>6s} "
+          f"{'saved':>6s}")
+    for count in args.leads:
+        scout_prompt = f"Find {count} REAL corporate businesses in {SETTINGS['region']}.\n"
+        leads = parse_leads_table(synth_scout(scout_prompt))
+        strategy = json.loads(synth_strategist(handoff_table("strategist", leads)))
+        for agent, calls in hand_offs(leads, strategy, args.shard_size).items():
+            for sharded in ((False, True) if agent != "rag_insights" else (False,)):
+                m = measure(calls, sharded)
+                saved = 1 - m["prompt_new"] / m["prompt_old"] if m["prompt_old"] else 0.0
+                print(f"{count:5d} {agent:13s} {'sharded' if sharded else 'single':8s} {m['payload_old']:11d} "
+                      f"{m['payload_new']:6d} {m['prompt_old']:10d} {m['prompt_new']:6d} {saved:6.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
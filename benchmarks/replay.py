@@ -0,0 +1,144 @@
+"""Drive the full agent pipeline headlessly against the offline replay backend.
+
+No API keys, no network and no Streamlit: the same ``build_agent_pipeline``
+the app runs is fed by ReplayProvider, behind the real ModelRouter, with a
+throwaway knowledge base on hash embeddings. Each run is timed end to end
+and per stage; injected faults show how retries and failover hold up.
+
+    python benchmarks/replay.py
+    python benchmarks/replay.py --runs 10 --leads 8 --latency 0.8 --jitter 0.5
+    python benchmarks/replay.py --error-rate 0.1 --rate-limit-rate 0.1 --providers 2
+    python benchmarks/replay.py --recordings .samketan_data/recorded.jsonl
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agents import ModelClient, build_agent_pipeline  # noqa: E402
+from model_router import ModelRouter  # noqa: E402
+from pipeline_engine import DONE, SKIPPED  # noqa: E402
+from replay_llm import HashEmbeddings, ReplayProvider, Recordings  # noqa: E402
+from response_cache import DiskCache  # noqa: E402
+
+SETTINGS = {
+    "region": "Gulbarga, Karnataka", "target_client": "FMCG distributors", "my_product": "Warehouse space",
+    "our_product": (
+        "Premium 21,000 sq ft RCC warehouse in Nandur Area, Gulbarga. "
+        "Features: 24/7 security, loading docks, fire safety, power backup. "
+        "Ideal for FMCG, pharma, agri storage processing."
+    ),
+    "our_company": "Bhoodevi Warehouse", "our_contact": "+91-9880888056",
+    "our_email": "sanjayhg@bhoodeviwarehouse.com", "our_website": "www.bhoodeviwarehouse.com",
+    "reply_tone": "Professional", "shard_agents": True, "shard_size": 1, "max_parallel_calls": 8,
+    "owner": "replay@example.com",
+}
+
+
+def make_router(args):
+    recordings = Recordings.load(args.recordings) if args.recordings else None
+    providers = [
+        ReplayProvider(
+            name="replay" if args.providers == 1 else f"replay-{i + 1}", recordings=recordings,
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed + i,
+            concurrency=args.concurrency,
+        )
+        for i in range(args.providers)
+    ]
+    return ModelRouter(providers, rate_limit_cooldown=args.retry_after, error_cooldown=0.2, max_wait=args.max_wait)
+
+
+def make_knowledge_base(folder):
+    """A knowledge base in ``folder``, or None when the vector-store packages are missing."""
+    if importlib.util.find_spec("langchain_community") is None or importlib.util.find_spec("faiss") is None:
+        return None
+    from knowledge_base import KnowledgeBase
+    from rag_index import CachedEmbeddings
+    return KnowledgeBase(folder, CachedEmbeddings(HashEmbeddings(), None, "replay-hash"))
+
+
+def run_once(llm, settings, kb=None, auto_reply=True, max_workers=3):
+    """One headless pipeline run: ``(seconds, data, states)``."""
+    started = time.perf_counter()
+    initial = {"settings": settings, "llm": llm}
+    if kb is not None:
+        initial["kb"] = kb
+    data, states = build_agent_pipeline(auto_reply).run(initial, max_workers=max_workers)
+    return time.perf_counter() - started, data, states
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--leads", type=int, default=5, help="leads the Scout is asked for")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.5, help="extra latency, as a fraction of --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance an attempt fails with a 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="chance an attempt is rate-limited")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="seconds a rate limit asks callers to wait")
+    parser.add_argument("--providers", type=int, default=1, help="replay providers behind the router")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel calls per provider")
+    parser.add_argument("--max-wait", type=float, default=30.0, help="router's longest wait for a healthy provider")
+    parser.add_argument("--recordings", help="JSONL (LLM_RECORD_PATH) or JSON file of recorded replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-shard", action="store_true", help="one Strategist/Communicator call for all leads")
+    parser.add_argument("--no-auto-reply", action="store_true")
+    parser.add_argument("--no-kb", action="store_true", help="skip the knowledge base (RAG search and archive)")
+    parser.add_argument("--cache", action="store_true", help="serve repeats from a response cache")
+    args = parser.parse_args(argv)
+
+    settings = dict(SETTINGS, num_leads=args.leads, shard_agents=not args.no_shard,
+                    max_parallel_calls=args.providers * args.concurrency)
+    router = make_router(args)
+    workdir = tempfile.mkdtemp(prefix="samketan-replay-")
+    try:
+        cache = DiskCache(os.path.join(workdir, "response_cache.sqlite3")) if args.cache else None
+        llm = ModelClient(router, cache)
+        kb = None if args.no_kb else make_knowledge_base(workdir)
+        totals, stage_times, failures = [], {}, 0
+        for run in range(args.runs):
+            seconds, data, states = run_once(llm, settings, kb, auto_reply=not args.no_auto_reply)
+            totals.append(seconds)
+            failed = [name for name, state in states.items() if state.status not in (DONE, SKIPPED)]
+            failures += bool(failed)
+            for name, state in states.items():
+                if state.elapsed is not None:
+                    stage_times.setdefault(name, []).append(state.elapsed)
+            print(f"run {run + 1:2d}: {seconds:6.2f}s  leads={len(data.get('leads', []))} "
+                  f"messages={len(data.get('messages', []))} replies={len(data.get('auto_replies', []))}"
+                  + (f"  FAILED: {', '.join(failed)}" if failed else ""))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(f"end to end   p50 {percentile(totals, 0.5):6.2f}s  p95 {percentile(totals, 0.95):6.2f}s  "
+          f"mean {statistics.mean(totals):6.2f}s  ({args.runs} runs, {failures} with failed stages)")
+    if kb is None and not args.no_kb:
+        print("knowledge base skipped: vector-store packages are not installed")
+    for name, values in stage_times.items():
+        print(f"  {name:14s} p50 {percentile(values, 0.5):6.2f}s  p95 {percentile(values, 0.95):6.2f}s")
+    print()
+    for name, provider in router.providers.items():
+        stats = router.stats()[name]
+        calls = ", ".join(f"{agent}={count}" for agent, count in sorted(provider.calls.items()))
+        injected = ", ".join(f"{kind}={count}" for kind, count in sorted(provider.injected.items())) or "none"
+        print(f"{name}: {stats['calls']} attempts ({calls}); injected faults: {injected}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
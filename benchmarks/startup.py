@@ -0,0 +1,138 @@
+"""Cold-start benchmark: import time per module, and what the login page loads.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` after
+Streamlit itself (secrets loaded), so the figure is what that module adds on
+top of a running Streamlit server.
+The login check renders app.py unauthenticated (Streamlit's AppTest) in
+another fresh interpreter and lists which heavy SDKs ended up loaded.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 5 auth services
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_MODULES = [
+    "auth", "services", "agents", "handoff", "model_router", "replay_llm", "llm_gateway", "pipeline_engine", "rag_index",
+    "knowledge_base", "document_ingest", "hunter_client", "telemetry", "mail_queue", "audit_log", "google_oauth", "otp_store", "response_cache", "json_stream",
+    "structured_output",
+]
+SDK_MODULES = [
+    "pandas", "requests", "langchain_core", "langchain_community.vectorstores", "langchain_google_genai",
+    "langchain_text_splitters", "google.generativeai", "faiss", "pypdf", "authlib.jose", "openai", "anthropic",
+]
+HEAVY = ["requests", "langchain_core", "langchain_community", "langchain_google_genai",
+         "langchain_text_splitters", "google.generativeai", "faiss", "pypdf", "authlib", "openai", "anthropic"]
+# Streamlit's custom-component runtime (the cookie manager) imports these itself.
+STREAMLIT_DEPS = ["pandas", "numpy", "pyarrow"]
+
+# What a running Streamlit server has already paid for before the first script run.
+BASELINE = "import streamlit; streamlit.secrets.load_if_toml_exists()"
+
+PLACEHOLDER_SECRETS = """
+[google_oauth]
+redirect_uri = "http://localhost:8501/"
+client_id = "benchmark"
+client_secret = "benchmark"
+"""
+
+LOGIN_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+heavy, streamlit_deps = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+started = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=120)
+at.secrets["google_oauth"] = {"redirect_uri": "http://localhost:8501/", "client_id": "x", "client_secret": "y"}
+at.run()
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "errors": [e.message for e in at.exception],
+    "loaded": [name for name in heavy if name in sys.modules],
+    "streamlit_loaded": [name for name in streamlit_deps if name in sys.modules],
+}))
+"""
+
+
+def import_time(module, workdir):
+    """Microseconds ``import module`` adds after Streamlit, or None when it fails to import."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{BASELINE}; import {module}"],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return None
+    total = 0
+    seen_streamlit = False
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _self_us, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # the header line
+        if not name.startswith("  "):
+            # Top-level entries: everything after streamlit's own entry is ours.
+            if name.strip() == "streamlit":
+                seen_streamlit = True
+            elif seen_streamlit:
+                total += cumulative
+    return total
+
+
+def login_probe():
+    proc = subprocess.run(
+        [sys.executable, "-c", LOGIN_PROBE, json.dumps(HEAVY), json.dumps(STREAMLIT_DEPS)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "login probe failed")
+    return json.loads(lines[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="modules to time (default: app modules and SDKs)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module (median reported)")
+    parser.add_argument("--skip-login", action="store_true", help="skip the login-page render check")
+    args = parser.parse_args(argv)
+
+    print(f"{'module':36s} {'ms over streamlit':>18s}")
+    with tempfile.TemporaryDirectory() as workdir:
+        # auth.py reads st.secrets at import; give it placeholders from the working directory.
+        os.makedirs(os.path.join(workdir, ".streamlit"))
+        with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as handle:
+            handle.write(PLACEHOLDER_SECRETS)
+        for module in args.modules or APP_MODULES + SDK_MODULES:
+            samples = [import_time(module, workdir) for _ in range(args.repeat)]
+            if None in samples:
+                print(f"{module:36s} {'not importable':>18s}")
+                continue
+            print(f"{module:36s} {statistics.median(samples) / 1000:18.1f}")
+
+    if not args.skip_login:
+        result = login_probe()
+        print()
+        print(f"login page rendered in {result['seconds']:.2f}s (fresh interpreter, includes Streamlit)")
+        if result["errors"]:
+            print("  errors: " + "; ".join(result["errors"]))
+        print("  heavy SDKs loaded by the app: " + (", ".join(result["loaded"]) or "none"))
+        if result["streamlit_loaded"]:
+            print("  loaded by Streamlit's component runtime: " + ", ".join(result["streamlit_loaded"]))
+        return 1 if result["loaded"] or result["errors"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
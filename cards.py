@@ -0,0 +1,172 @@
+"""HTML for the result cards: strategy, outreach message, auto-reply and RAG boxes.
+
+Card builders are memoised on a hash of their inputs. They live outside
+``app.py`` so the memo survives Streamlit reruns: redrawing a page of
+unchanged leads reuses the markup built the first time.
+"""
+
+import functools
+import hashlib
+import html
+import json
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+MEMO_SIZE = 1024
+PENDING_EMAIL = "Pending extraction"  # shown for a lead with no address yet; never stored
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def memoized(render):
+    """Cache ``render``'s HTML by a content hash of its (JSON-serialisable) arguments."""
+    @functools.wraps(render)
+    def wrapper(*args):
+        digest = hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        key = (render.__name__, digest)
+        with _memo_lock:
+            if key in _memo:
+                _memo.move_to_end(key)
+                return _memo[key]
+        markup = render(*args)
+        with _memo_lock:
+            _memo[key] = markup
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+        return markup
+    return wrapper
+
+
+def esc(value):
+    return html.escape(str(value or ""), quote=True)
+
+
+def clean_phone_number(phone):
+    digits = "".join(filter(str.isdigit, str(phone or "")))
+    if len(digits) == 10:
+        digits = "91" + digits
+    return digits
+
+
+def build_linkedin_url(first_name, last_name, company, existing_url=""):
+    # Use direct profile if available
+    if existing_url and "linkedin.com/in/" in str(existing_url):
+        return existing_url.strip()
+
+    # Search name + company together — finds the RIGHT person
+    full_query = f"{first_name} {last_name} {company}"
+    url = (
+        "https://www.linkedin.com/search/results/people/"
+        f"?keywords={urllib.parse.quote(full_query)}"
+        "&origin=GLOBAL_SEARCH_HEADER"
+    )
+    return url
+
+
+@memoized
+def strategy_card_html(s):
+    priority = s.get("priority", "WARM")
+    badge_class = "badge-hot" if priority == "HOT" else ("badge-cold" if priority == "COLD" else "badge-warm")
+    pain_items = "".join(["<li>" + esc(p) + "</li>" for p in s.get("pain_points", [])])
+    return (
+        '<div class="lead-card">'
+        '<div style="display:flex;justify-content:space-between;align-items:flex-start;margin-bottom:12px;">'
+        '<div><p class="lead-name">' + esc(s.get("company", "")) + "</p>"
+        '<p class="lead-address">' + esc(s.get("first_name", "")) + ' ' + esc(s.get("last_name", "")) + " | Score: " + esc(s.get("deal_score", 0)) + "/100</p></div>"
+        '<span class="' + badge_class + '">' + esc(priority) + "</span></div>"
+        '<div class="strategy-box"><div class="strategy-title">Value Proposition</div>'
+        '<div class="strategy-text">' + esc(s.get("our_value_prop", "")) + "</div></div>"
+        '<div style="display:flex;gap:16px;flex-wrap:wrap;margin-top:12px;">'
+        '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Pain Points</p>'
+        '<ul style="color:#b0bec5;font-size:0.82rem;margin:4px 0;padding-left:16px;">' + pain_items + "</ul></div>"
+        '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Opening Hook</p>'
+        '<p style="color:#e0e6f0;font-size:0.84rem;font-style:italic;">' + esc(s.get("opening_hook", "")) + "</p></div>"
+        '<div style="flex:1;min-width:160px;"><p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;">Recommended Approach</p>'
+        '<p style="color:#b0bec5;font-size:0.82rem;">' + esc(s.get("recommended_approach", "")) + "</p></div></div>"
+        '<div style="margin-top:10px;padding-top:10px;border-top:1px solid #1e2a3e;display:flex;gap:20px;flex-wrap:wrap;">'
+        '<span style="font-size:0.8rem;color:#7a8ba0;">Value: ' + esc(s.get("estimated_value", "")) + "</span>"
+        '<span style="font-size:0.8rem;color:#7a8ba0;">Urgency: ' + esc(s.get("urgency_signal", "")) + "</span>"
+        "</div></div>"
+    )
+
+
+@memoized
+def message_card_html(msg, email_to, idx):
+    phone = str(msg.get("phone", ""))
+    email_to = str(email_to or "")
+    wa_text = str(msg.get("whatsapp_message", ""))
+    email_sub = str(msg.get("email_subject", ""))
+    email_body = str(msg.get("email_body", ""))
+    linkedin_note = str(msg.get("linkedin_note", ""))
+    company = str(msg.get("company", "Lead " + str(idx + 1)))
+    f_name = str(msg.get("first_name", ""))
+    l_name = str(msg.get("last_name", ""))
+    existing_li = str(msg.get("person_linkedin", ""))
+    best_time = str(msg.get("best_time_to_contact", "Weekday morning"))
+    follow_up = str(msg.get("follow_up_day", "3 days"))
+
+    clean_ph = clean_phone_number(phone)
+    wa_link = "https://wa.me/" + clean_ph + "?text=" + urllib.parse.quote(wa_text)
+    mail_link = "mailto:" + email_to + "?subject=" + urllib.parse.quote(email_sub) + "&body=" + urllib.parse.quote(email_body)
+
+    # FIX 2: Proper LinkedIn URL
+    li_link = build_linkedin_url(f_name, l_name, company, existing_li)
+
+    return (
+        '<div class="lead-card" style="border-color:#1a4a1a;">'
+        '<div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:14px;">'
+        '<p class="lead-name">' + esc(company) + " — " + esc(f_name) + " " + esc(l_name) + "</p>"
+        '<span style="font-size:0.78rem;color:#7a8ba0;">Best Time: ' + esc(best_time) + " | Follow-up: " + esc(follow_up) + "</span></div>"
+        '<p style="font-size:0.85rem;color:#64b5f6;"><b>Email:</b> ' + esc(email_to or PENDING_EMAIL) + '</p>'
+        '<div class="msg-box msg-whatsapp"><div class="msg-label msg-label-wa">📱 WhatsApp Message</div>'
+        '<div class="msg-content">' + esc(wa_text) + "</div></div>"
+        '<div class="msg-box msg-email"><div class="msg-label msg-label-mail">📧 Email — ' + esc(email_sub) + "</div>"
+        '<div class="msg-content">' + esc(email_body) + "</div></div>"
+        '<div class="msg-box"><div class="msg-label" style="color:#0A66C2;">💼 LinkedIn Note</div>'
+        '<div class="msg-content">' + esc(linkedin_note) + "</div></div>"
+        '<div class="action-row">'
+        '<a class="btn-wa" href="' + esc(wa_link) + '" target="_blank">📱 WhatsApp</a>'
+        '<a class="btn-mail" href="' + esc(mail_link) + '" target="_blank">📧 Email Draft</a>'
+        '<a class="btn-linkedin" href="' + esc(li_link) + '" target="_blank">💼 LinkedIn Profile</a>'
+        "</div></div>"
+    )
+
+
+_SCENARIO_COLORS = {
+    "interested": "#00c851", "needs_more_info": "#ffaa00",
+    "price_sensitive": "#ff8800", "requesting_visit": "#4285f4",
+    "not_interested": "#ff4444",
+}
+
+
+@memoized
+def auto_reply_card_html(reply):
+    scenario = str(reply.get("reply_scenario", ""))
+    scenario_col = _SCENARIO_COLORS.get(scenario, "#7a8ba0")
+    escalate = reply.get("escalate_to_human", False)
+    escalate_html = (
+        '<span style="background:#1a0a0a;color:#ff4444;border:1px solid #ff4444;padding:3px 10px;border-radius:10px;font-size:0.72rem;font-weight:700;">ESCALATE TO HUMAN</span>'
+        if escalate else
+        '<span style="background:#0a1a0a;color:#00c851;border:1px solid #00c851;padding:3px 10px;border-radius:10px;font-size:0.72rem;font-weight:700;">AUTO-HANDLED</span>'
+    )
+    return (
+        '<div class="lead-card" style="border-color:#1a3a0a;">'
+        '<div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:14px;">'
+        '<p class="lead-name">' + esc(reply.get("company", "")) + "</p>"
+        '<div style="display:flex;gap:10px;align-items:center;">'
+        '<span style="color:' + scenario_col + ';font-size:0.8rem;font-weight:700;text-transform:uppercase;">' + esc(scenario.replace("_", " ")) + "</span>" + escalate_html + "</div></div>"
+        '<div class="conversation-entry"><div class="conv-from">Simulated Client Reply:</div>'
+        '<div class="conv-msg" style="color:#e0e6f0;font-style:italic;">' + esc(reply.get("simulated_client_reply", "")) + "</div></div>"
+        '<div class="autoreply-box"><div class="autoreply-label">Our Auto WhatsApp Reply</div>'
+        '<div class="autoreply-text">' + esc(reply.get("auto_response_whatsapp", "")) + "</div></div>"
+        '<div style="margin-top:10px;padding:10px;background:#0a0d14;border:1px solid #1e2a3e;border-radius:8px;">'
+        '<p style="font-size:0.72rem;color:#4a5568;text-transform:uppercase;letter-spacing:1px;margin-bottom:4px;">Next Action</p>'
+        '<p style="color:#b0bec5;font-size:0.84rem;">' + esc(reply.get("next_action", "")) + "</p></div></div>"
+    )
+
+
+def rag_box_html(label, text):
+    return ('<div class="rag-box"><div class="rag-label">' + label + '</div>'
+            '<div class="rag-text">' + esc(text) + "</div></div>")
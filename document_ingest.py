@@ -0,0 +1,153 @@
+"""Background ingestion of uploaded PDFs into the knowledge base.
+
+Uploads are spooled to disk while their SHA-256 is computed, so the same file
+is only embedded once per owner. A single worker thread then reads the PDF one
+page at a time, splits each page and appends the chunks to the shared FAISS
+index in small batches. Progress is written to the ``documents`` table after
+every batch, which lets the UI poll it and lets an interrupted ingest resume
+from the last committed page instead of starting over. Chunk IDs are derived
+from the document, page and position (``chunk_ids``), so pages that reached
+the index before a crash but after the last progress write are skipped, not
+indexed twice.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_index import document_chunks
+
+SPOOL_BLOCK = 1024 * 1024
+PENDING_STATUSES = ("queued", "ingesting")
+
+
+def spool_upload(fileobj, folder):
+    """Copy an upload to ``folder`` in blocks; returns ``(sha256, path)``."""
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(folder, f".upload-{uuid.uuid4().hex}")
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+    with open(tmp_path, "wb") as out:
+        while True:
+            block = fileobj.read(SPOOL_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    sha256 = digest.hexdigest()
+    path = os.path.join(folder, sha256 + ".pdf")
+    os.replace(tmp_path, path)
+    return sha256, path
+
+
+def count_pdf_pages(path):
+    from pypdf import PdfReader
+    with open(path, "rb") as handle:
+        return len(PdfReader(handle).pages)
+
+
+def iter_pdf_pages(path, start=0):
+    """Yield ``(page_number, text)`` from ``start`` on, one page at a time.
+
+    The reader is given an open file handle so pypdf parses objects from disk
+    as pages are requested rather than loading the whole file into memory.
+    """
+    from pypdf import PdfReader
+    with open(path, "rb") as handle:
+        reader = PdfReader(handle)
+        if reader.is_encrypted:
+            reader.decrypt("")
+        for number in range(start, len(reader.pages)):
+            try:
+                text = reader.pages[number].extract_text() or ""
+            except Exception:
+                text = ""  # one unreadable page should not sink the document
+            yield number + 1, text
+
+
+def chunk_ids(doc_id, page, count):
+    """Stable index IDs for the ``count`` chunks of one document page."""
+    return [f"doc-{doc_id}-{page}-{n}" for n in range(count)]
+
+
+class DocumentIngestor:
+    """Runs document ingests for one KnowledgeBase on a background thread."""
+
+    def __init__(self, kb, upload_dir, batch_chunks=64, max_workers=1):
+        self.kb = kb
+        self.upload_dir = upload_dir
+        self.batch_chunks = max(1, int(batch_chunks))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def submit(self, owner, filename, fileobj):
+        """Spool and queue one upload; returns ``(doc_id, queued)``.
+
+        ``queued`` is False when the same bytes were already ingested (or are
+        being ingested) for this owner.
+        """
+        sha256, path = spool_upload(fileobj, self.upload_dir)
+        doc_id, is_new = self.kb.register_document(owner, sha256, filename, path)
+        if is_new:
+            self._schedule(doc_id)
+        elif self.kb.get_document(doc_id)["path"] != path:
+            os.remove(path)  # already embedded; the spooled copy is not needed
+        return doc_id, is_new
+
+    def resume_pending(self):
+        """Re-queue documents an earlier process left unfinished."""
+        resumed = 0
+        for doc in self.kb.list_documents(statuses=PENDING_STATUSES):
+            if doc["path"] and os.path.exists(doc["path"]):
+                resumed += self._schedule(doc["id"])
+            else:
+                self.kb.update_document(doc["id"], status="failed", error="Upload file is missing; upload it again.")
+        return resumed
+
+    def _schedule(self, doc_id):
+        with self._lock:
+            if doc_id in self._active:
+                return 0
+            self._active.add(doc_id)
+        self._pool.submit(self._run, doc_id)
+        return 1
+
+    def _run(self, doc_id):
+        try:
+            self._ingest(doc_id)
+        except Exception as exc:
+            self.kb.update_document(doc_id, status="failed", error=str(exc))
+        finally:
+            with self._lock:
+                self._active.discard(doc_id)
+
+    def _ingest(self, doc_id):
+        doc = self.kb.get_document(doc_id)
+        if doc is None or doc["status"] == "done":
+            return
+        pages = doc["pages"] or count_pdf_pages(doc["path"])
+        self.kb.update_document(doc_id, status="ingesting", pages=pages)
+        base = {"owner": doc["owner"], "doc_id": doc_id}
+        chunks = doc["chunks"]
+        texts, metadatas, ids = [], [], []
+        page = doc["pages_done"]
+        for page, text in iter_pdf_pages(doc["path"], start=doc["pages_done"]):
+            page_texts, page_metadatas = document_chunks(text, doc["filename"], page, base)
+            texts.extend(page_texts)
+            metadatas.extend(page_metadatas)
+            ids.extend(chunk_ids(doc_id, page, len(page_texts)))
+            # Commit on page boundaries so pages_done is always a safe resume point.
+            if len(texts) >= self.batch_chunks:
+                chunks += self.kb.add_chunks(texts, metadatas, ids=ids)
+                texts, metadatas, ids = [], [], []
+                self.kb.update_document(doc_id, pages_done=page, chunks=chunks)
+        chunks += self.kb.add_chunks(texts, metadatas, ids=ids)
+        self.kb.update_document(doc_id, status="done", pages_done=max(page, pages), chunks=chunks, path=None)
+        try:
+            os.remove(doc["path"])
+        except OSError:
+            pass
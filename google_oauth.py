@@ -0,0 +1,75 @@
+"""Google sign-in helpers: local ID-token verification against cached JWKS.
+
+The token endpoint already returns a signed ``id_token`` carrying the user's
+email and name, so checking it locally replaces the separate ``/userinfo``
+round-trip. Google's signing keys are fetched once and kept for as long as the
+response's ``Cache-Control: max-age`` allows; an unknown ``kid`` (key
+rotation) triggers one refresh.
+"""
+
+import re
+import threading
+import time
+
+from http_client import shared_session
+from telemetry import span
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleKeys:
+    def __init__(self, url=CERTS_URL, default_ttl=3600.0, session=None):
+        self.url = url
+        self.default_ttl = default_ttl
+        self._session = session
+        self._jwks = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Resolved on first fetch, so importing this module does not load requests.
+        if self._session is None:
+            self._session = shared_session()
+        return self._session
+
+    def get(self, refresh=False):
+        with self._lock:
+            if refresh or self._jwks is None or time.monotonic() >= self._expires_at:
+                with span("google_oauth.jwks"):
+                    resp = self.session.get(self.url, timeout=10)
+                    resp.raise_for_status()
+                match = _MAX_AGE_RE.search(resp.headers.get("Cache-Control", ""))
+                ttl = float(match.group(1)) if match else self.default_ttl
+                self._jwks = resp.json()
+                self._expires_at = time.monotonic() + ttl
+            return self._jwks
+
+
+_google_keys = GoogleKeys()
+
+
+def verify_id_token(id_token, client_id, keys=None, leeway=60):
+    """Return the verified claims of a Google ID token; raises on any mismatch."""
+    from authlib.jose import JsonWebKey, jwt
+    from authlib.jose.errors import JoseError
+
+    keys = keys or _google_keys
+    claims_options = {
+        "iss": {"essential": True, "values": list(ISSUERS)},
+        "aud": {"essential": True, "value": client_id},
+        "exp": {"essential": True},
+    }
+    try:
+        claims = jwt.decode(id_token, JsonWebKey.import_key_set(keys.get()), claims_options=claims_options)
+    except (JoseError, ValueError):
+        # Possibly signed with a key Google rotated in after our cached copy.
+        claims = jwt.decode(id_token, JsonWebKey.import_key_set(keys.get(refresh=True)),
+                            claims_options=claims_options)
+    claims.validate(leeway=leeway)
+    return dict(claims)
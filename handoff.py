@@ -0,0 +1,117 @@
+"""Lead identity and compact prompt payloads for agent hand-offs.
+
+Every lead gets a stable ID when the Scout's table is parsed (``lead_id``);
+the agents are asked to echo it, the pipeline stamps it on everything they
+return, and stages join on it through ``index_by_id`` instead of by list
+position or company-name scans.
+
+Each agent declares the lead and strategy fields it reads (``AGENT_FIELDS``).
+``handoff_table`` joins every lead with its strategy by a stable lead ID and
+renders one ``|``-separated row per lead under a single header line, so a
+company or contact name appears once per prompt and nothing is spent on JSON
+quotes, repeated keys or indentation. ``benchmarks/prompts.py`` reports the
+saving against the indented JSON the agents used to receive.
+"""
+
+import hashlib
+import re
+
+# Fields each agent reads, from the Scout's lead and from the Strategist's analysis.
+AGENT_FIELDS = {
+    "strategist": {
+        "lead": ["company", "first_name", "last_name", "decision_maker_role", "sector", "why_need", "deal_size",
+                 "person_linkedin"],
+        "strategy": [],
+    },
+    "communicator": {
+        "lead": ["company", "first_name", "last_name", "decision_maker_role", "phone", "person_linkedin"],
+        "strategy": ["priority", "our_value_prop", "pain_points", "opening_hook", "objection_handling",
+                     "urgency_signal", "recommended_approach"],
+    },
+    "rag_insights": {
+        "lead": ["company", "decision_maker_role", "sector", "why_need", "deal_size"],
+        "strategy": ["priority", "deal_score", "pain_points", "estimated_value", "urgency_signal"],
+    },
+}
+
+# Short column headers; the header line is repeated in every sharded call.
+LABELS = {
+    "first_name": "first", "last_name": "last", "decision_maker_role": "role", "person_linkedin": "linkedin",
+    "why_need": "need", "deal_size": "deal", "our_value_prop": "value_prop", "objection_handling": "objection",
+    "urgency_signal": "urgency", "recommended_approach": "approach", "estimated_value": "value",
+    "deal_score": "score",
+}
+FIELDS_BY_LABEL = {label: name for name, label in LABELS.items()}
+
+TABLE_NOTE = "| separated, header row first"
+
+# The header or a row of a hand-off table.
+HANDOFF_ROW = re.compile(r"^(?:id|L[0-9a-f]{6}) \| ")
+
+
+def normalize_company(name):
+    return " ".join(str(name or "").lower().split())
+
+
+def company_id(company):
+    """The lead ID a company name maps to: ``L`` and six hex digits of its normalised hash."""
+    return "L" + hashlib.sha1(normalize_company(company).encode("utf-8")).hexdigest()[:6]
+
+
+def lead_id(record):
+    """The ID ``parse_leads_table`` gave a lead and the agents carry on, or one derived from the company."""
+    return record.get("id") or company_id(record.get("company"))
+
+
+def index_by_id(records):
+    """``{lead ID: record}`` for joining stages; the first record with an ID wins."""
+    index = {}
+    for record in records:
+        index.setdefault(lead_id(record), record)
+    return index
+
+
+def cell(value):
+    """One field as a single dense line: lists joined with ``;``, pipes and newlines flattened."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        value = "; ".join(cell(item) for item in value)
+    elif isinstance(value, dict):
+        value = "; ".join(f"{key}: {cell(item)}" for key, item in value.items())
+    return " ".join(str(value).replace("|", "/").split())
+
+
+def handoff_table(agent, leads, strategy=()):
+    """The leads ``agent`` needs, joined with their strategy, as a compact table.
+
+    Leads are de-duplicated by ID (the first one wins); a strategy entry with
+    no matching lead gets a row of its own so nothing the Strategist said is lost.
+    """
+    fields = AGENT_FIELDS[agent]
+    strategy_by_id = index_by_id(strategy)
+    columns = ["id"] + fields["lead"] + [name for name in fields["strategy"] if name not in fields["lead"]]
+    rows, seen = [], set()
+    for lead in list(leads) + [entry for entry in strategy_by_id.values()]:
+        row_id = lead_id(lead)
+        if row_id in seen:
+            continue
+        seen.add(row_id)
+        merged = dict(strategy_by_id.get(row_id, {}), **{key: value for key, value in lead.items() if value})
+        rows.append(" | ".join([row_id] + [cell(merged.get(name)) for name in columns[1:]]))
+    return "\n".join([" | ".join(LABELS.get(name, name) for name in columns)] + rows)
+
+
+def parse_handoff_table(text):
+    """Rows of every hand-off table in ``text`` as dicts (the inverse of ``handoff_table``)."""
+    records, columns = [], None
+    for line in text.splitlines():
+        if not HANDOFF_ROW.match(line):
+            columns = None
+            continue
+        cells = [part.strip() for part in line.split(" | ")]
+        if cells[0] == "id":
+            columns = [FIELDS_BY_LABEL.get(label, label) for label in cells]
+        elif columns and len(cells) == len(columns):
+            records.append(dict(zip(columns, cells)))
+    return records
@@ -0,0 +1,20 @@
+"""One pooled ``requests.Session`` for every outbound HTTPS call in the process.
+
+Modules import once per Streamlit process, so the session and its keep-alive
+connections outlive reruns: a second Google sign-in or Hunter lookup reuses
+the TLS connection opened by the first.
+"""
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def shared_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
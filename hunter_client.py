@@ -0,0 +1,179 @@
+"""Hunter.io email lookups over one pooled, rate-limited, cached session.
+
+Every call goes through the process-wide keep-alive session and a token
+bucket sized to Hunter's published limits (15 requests/s, 500/min).
+Email-finder and domain-search replies are kept in a DiskCache with a TTL, so
+a domain seen in any earlier run costs no credits, and concurrent lookups of
+the same domain share a single request. Rate limits (429) and server errors
+(5xx) are retried with a growing delay. ``enrich_leads`` looks up only the
+leads that ``has_real_email`` says still need an address.
+"""
+
+import contextlib
+import json
+import threading
+import time
+
+from http_client import shared_session
+from lazy_imports import lazy_module
+from handoff import lead_id
+from llm_gateway import TokenBucket, fan_out
+from mail_queue import is_email_address
+from response_cache import make_key
+from telemetry import COUNT_BUCKETS, observe, span
+
+API_ROOT = "https://api.hunter.io/v2/"
+FOUND_TTL = 30 * 86400
+NOT_FOUND_TTL = 7 * 86400
+
+requests = lazy_module("requests")
+
+
+def has_real_email(lead):
+    """Whether a lead already has a usable address (not blank or a placeholder the UI shows)."""
+    return is_email_address(lead.get("email"))
+
+
+class HunterError(Exception):
+    """Raised when Hunter rejects a request, keeps failing it or answers with something other than JSON."""
+
+
+class HunterClient:
+    def __init__(self, api_key, cache=None, rate_per_minute=500, burst=15, timeout=15, max_retries=3,
+                 session=None):
+        self.api_key = api_key.strip()
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.session = session or shared_session()
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, callers holding or waiting]; only keys in flight
+        self.api_calls = 0
+
+    def _throttle(self):
+        while True:
+            wait = self.bucket.try_acquire()
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+    def _request(self, endpoint, params):
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            with span("hunter." + endpoint, attempt=attempt + 1) as call:
+                resp = self.session.get(API_ROOT + endpoint, params=dict(params, api_key=self.api_key),
+                                        timeout=self.timeout)
+                call["http_status"] = resp.status_code
+                retryable = resp.status_code == 429 or resp.status_code >= 500
+                if retryable:
+                    call["error"] = f"HTTP {resp.status_code}"
+            with self._lock:
+                self.api_calls += 1
+            if not retryable or attempt == self.max_retries:
+                break
+            try:
+                delay = float(resp.headers.get("Retry-After", 1))
+            except ValueError:
+                delay = 1.0
+            time.sleep(min(delay * (attempt + 1), 30))
+        observe("hunter_request_retries", attempt, COUNT_BUCKETS)
+        if resp.status_code == 429:
+            raise HunterError("Hunter rate limit — try again shortly")
+        if resp.status_code >= 500:
+            raise HunterError(f"Hunter server error (HTTP {resp.status_code}) — try again shortly")
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise HunterError(f"Hunter sent a reply that is not JSON (HTTP {resp.status_code})")
+        if resp.status_code >= 400:
+            errors = data.get("errors") or [{}]
+            raise HunterError(errors[0].get("details") or f"HTTP {resp.status_code}")
+        return data.get("data") or {}
+
+    @contextlib.contextmanager
+    def _key_lock(self, key):
+        """Hold the lock for one request key; it is dropped once nobody holds or awaits it."""
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _cached(self, endpoint, params, found):
+        """Return Hunter's ``data`` for a request, from cache when possible.
+
+        ``found(data)`` decides the TTL: misses are re-checked sooner than hits.
+        Callers asking for the same key at once wait for the first request.
+        """
+        key = make_key("hunter", endpoint, json.dumps(params, sort_keys=True))
+        with self._key_lock(key):
+            hit = self.cache.get(key) if self.cache else None
+            if hit is not None:
+                return json.loads(hit)
+            data = self._request(endpoint, params)
+            if self.cache:
+                self.cache.set(key, json.dumps(data), ttl=FOUND_TTL if found(data) else NOT_FOUND_TTL)
+            return data
+
+    def domain_search(self, domain, limit=10):
+        return self._cached("domain-search", {"domain": domain, "limit": limit},
+                            lambda data: bool(data.get("emails")))
+
+    def email_finder(self, domain, first_name, last_name):
+        params = {"domain": domain, "first_name": first_name.strip().lower(), "last_name": last_name.strip().lower()}
+        return self._cached("email-finder", params, lambda data: bool(data.get("email")))
+
+    def _cached_domain_match(self, domain, first_name, last_name):
+        """Find the person in a domain-search we already paid for, without an API call."""
+        if not self.cache:
+            return None
+        hit = self.cache.get(make_key("hunter", "domain-search", json.dumps({"domain": domain, "limit": 10},
+                                                                             sort_keys=True)))
+        if hit is None:
+            return None
+        first, last = first_name.strip().lower(), last_name.strip().lower()
+        for entry in json.loads(hit).get("emails") or []:
+            if (entry.get("first_name") or "").lower() == first and (entry.get("last_name") or "").lower() == last:
+                return entry
+        return None
+
+    def find_email(self, first_name, last_name, domain):
+        """Return ``(email, status)``: person match first, then any address on the domain."""
+        try:
+            entry = self._cached_domain_match(domain, first_name, last_name)
+            if entry and entry.get("value"):
+                return entry["value"], f"Found (confidence: {entry.get('confidence', 0)}%)"
+            data = self.email_finder(domain, first_name, last_name)
+            if data.get("email"):
+                return data["email"], f"Found (confidence: {data.get('score', 0)}%)"
+            emails = self.domain_search(domain).get("emails") or []
+            if emails:
+                return emails[0].get("value"), f"Domain match found on {domain}"
+            return None, f"No email found for {first_name} {last_name} at {domain}"
+        except requests.exceptions.Timeout:
+            return None, "Hunter API timeout — try again"
+        except Exception as e:
+            return None, f"Hunter API error: {str(e)}"
+
+    def enrich(self, people, max_workers=5):
+        """Look up ``(first_name, last_name, domain)`` tuples concurrently, in order."""
+        return fan_out(lambda person: self.find_email(*person), people, max_workers)
+
+    def enrich_leads(self, leads, domain_for, max_workers=5):
+        """``{lead ID: (email, status)}`` for every lead without a real email; ``domain_for(company)`` picks the domain."""
+        todo = [lead for lead in leads if not has_real_email(lead)]
+        people = [
+            (str(lead.get("first_name", "")), str(lead.get("last_name", "")), domain_for(str(lead.get("company", ""))))
+            for lead in todo
+        ]
+        results = self.enrich(people, max_workers)
+        return {lead_id(lead): result for lead, result in zip(todo, results) if not isinstance(result, Exception)}
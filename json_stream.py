@@ -0,0 +1,96 @@
+"""Incremental JSON parsing for streamed agent replies.
+
+Agents that answer with a JSON array of objects can be rendered while the
+model is still typing: ``JSONObjectStream`` is fed text pieces as they arrive
+and returns each element of the top-level array the moment its closing brace
+is seen. A reply that is a single object is returned once, when it closes.
+Prose or a code fence before the first bracket is ignored, and so is a
+trailing comma inside an element. ``structured_output`` parses whole replies
+with it too, so a reply cut short still yields its complete elements.
+"""
+
+import json
+import re
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class JSONObjectStream:
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._finished = False
+        self._element_depth = None
+        self.rejected = 0  # elements that closed but were not valid JSON objects
+
+    def feed(self, text):
+        """Consume ``text``; return the objects completed by it."""
+        done = []
+        for ch in text or "":
+            if self._finished:
+                break
+            if not self._started:
+                if ch not in "[{":
+                    continue
+                self._started = True
+                # Elements of a top-level array sit at depth 1; a bare object at depth 0.
+                self._element_depth = 1 if ch == "[" else 0
+            if self._depth > self._element_depth or (self._depth == self._element_depth and ch == "{"):
+                self._buffer.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == self._element_depth and self._buffer:
+                    obj = self._close()
+                    if obj is not None:
+                        done.append(obj)
+                # Anything after the top-level value (trailing prose, a second block) is ignored.
+                self._finished = self._depth == 0
+        return done
+
+    @property
+    def finished(self):
+        """Whether the top-level value has closed (a reply cut short never does)."""
+        return self._finished
+
+    def _close(self):
+        raw = "".join(self._buffer)
+        self._buffer = []
+        try:
+            obj = json.loads(raw)
+        except ValueError:
+            try:
+                obj = json.loads(_TRAILING_COMMA.sub(r"\1", raw))
+            except ValueError:
+                obj = None
+        if not isinstance(obj, dict):
+            self.rejected += 1
+            return None
+        return obj
+
+
+def stream_objects(on_object):
+    """Return an ``on_text`` callback that calls ``on_object`` per completed object."""
+    if on_object is None:
+        return None
+    parser = JSONObjectStream()
+
+    def on_text(piece):
+        for obj in parser.feed(piece):
+            on_object(obj)
+
+    return on_text
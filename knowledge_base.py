@@ -0,0 +1,328 @@
+"""Persistent cross-run knowledge base.
+
+Every pipeline run is stored in SQLite (runs plus one row per lead, strategy,
+message and auto-reply) and its chunks are appended to an on-disk FAISS index.
+The index is loaded once per process and grown with ``add_embeddings``; it is never
+rebuilt from scratch, and runs that were saved but not yet embedded are picked
+up by ``sync_index``. Uploaded documents share the same index (kind
+"document") and are tracked by content hash in the ``documents`` table.
+
+Searches never rank the whole index: the chunks of the asking owner (and,
+when scoped, of one run or kind) are picked from an in-memory map of index
+positions, and only their vectors are compared with the question. Another
+user's history can therefore not push a run's chunks out of the results.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX hosts fall back to the in-process lock only
+    fcntl = None
+
+from rag_index import nearest, pipeline_chunks, subset_vectors
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    region TEXT,
+    target_client TEXT,
+    product TEXT,
+    our_company TEXT,
+    rag_insights TEXT,
+    indexed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_owner ON runs(owner, created_at);
+CREATE TABLE IF NOT EXISTS records (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    kind TEXT NOT NULL,
+    company TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_run ON records(run_id, kind);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    pages INTEGER NOT NULL DEFAULT 0,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE(owner, sha256)
+);
+"""
+
+RECORD_KINDS = ("lead", "strategy", "message", "auto_reply")
+DOCUMENT_FIELDS = ("id", "owner", "sha256", "filename", "path", "status", "pages", "pages_done", "chunks", "error",
+                   "created_at")
+
+
+class KnowledgeBase:
+    def __init__(self, folder, embeddings, index_name="index"):
+        self.folder = folder
+        self.embeddings = embeddings
+        self.index_name = index_name
+        self.index_dir = os.path.join(folder, "faiss_" + _safe_name(getattr(embeddings, "model_name", "default")))
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.db_path = os.path.join(folder, "knowledge_base.sqlite3")
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_mtime = 0.0
+        self._by_owner = {}  # owner -> [(index position, chunk metadata)]
+        self._ids = set()  # docstore IDs in the index, for skipping chunks already added
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ----- runs -----
+    def save_run(self, owner, inputs, leads, strategy, messages=(), auto_replies=(), rag_insights=""):
+        """Store one pipeline run and return its id (not yet embedded)."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO runs(owner, created_at, region, target_client, product, our_company, rag_insights) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (owner, time.time(), inputs.get("region", ""), inputs.get("target_client", ""),
+                 inputs.get("my_product", ""), inputs.get("our_company", ""), rag_insights or ""),
+            )
+            run_id = cur.lastrowid
+            rows = []
+            for kind, items in zip(RECORD_KINDS, (leads, strategy, messages, auto_replies)):
+                for item in items or []:
+                    rows.append((run_id, kind, str(item.get("company", "")), json.dumps(item, default=str)))
+            conn.executemany("INSERT INTO records(run_id, kind, company, payload) VALUES (?, ?, ?, ?)", rows)
+        return run_id
+
+    def load_run(self, run_id):
+        """Return ``{kind: [records]}`` plus the run's ``rag_insights`` text."""
+        conn = self._conn()
+        grouped = {kind: [] for kind in RECORD_KINDS}
+        for kind, payload in conn.execute("SELECT kind, payload FROM records WHERE run_id = ? ORDER BY rowid", (run_id,)):
+            grouped.setdefault(kind, []).append(json.loads(payload))
+        row = conn.execute("SELECT rag_insights FROM runs WHERE id = ?", (run_id,)).fetchone()
+        grouped["rag_insights"] = row[0] if row else ""
+        return grouped
+
+    def list_runs(self, owner, limit=20):
+        rows = self._conn().execute(
+            "SELECT id, created_at, region, target_client, product, "
+            "(SELECT COUNT(*) FROM records r WHERE r.run_id = runs.id AND r.kind = 'lead') "
+            "FROM runs WHERE owner = ? ORDER BY created_at DESC LIMIT ?",
+            (owner, limit),
+        ).fetchall()
+        keys = ("id", "created_at", "region", "target_client", "product", "leads")
+        return [dict(zip(keys, row)) for row in rows]
+
+    # ----- documents -----
+    def register_document(self, owner, sha256, filename, path):
+        """Queue an uploaded file; returns ``(doc_id, is_new)``.
+
+        A file whose hash is already known for this owner is not queued again
+        unless its previous ingest failed.
+        """
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT id, status FROM documents WHERE owner = ? AND sha256 = ?",
+                               (owner, sha256)).fetchone()
+            if row is None:
+                cur = conn.execute(
+                    "INSERT INTO documents(owner, sha256, filename, path, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (owner, sha256, filename, path, time.time()),
+                )
+                return cur.lastrowid, True
+            if row[1] == "failed":
+                conn.execute("UPDATE documents SET status = 'queued', path = ?, error = NULL WHERE id = ?",
+                             (path, row[0]))
+                return row[0], True
+        return row[0], False
+
+    def update_document(self, doc_id, **fields):
+        unknown = set(fields) - set(DOCUMENT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown document fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._conn() as conn:
+            conn.execute(f"UPDATE documents SET {assignments} WHERE id = ?", (*fields.values(), doc_id))
+
+    def get_document(self, doc_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(DOCUMENT_FIELDS)} FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return dict(zip(DOCUMENT_FIELDS, row)) if row else None
+
+    def list_documents(self, owner=None, statuses=None):
+        sql = f"SELECT {', '.join(DOCUMENT_FIELDS)} FROM documents WHERE 1 = 1"
+        params = []
+        if owner is not None:
+            sql += " AND owner = ?"
+            params.append(owner)
+        if statuses:
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        rows = self._conn().execute(sql + " ORDER BY created_at DESC", params).fetchall()
+        return [dict(zip(DOCUMENT_FIELDS, row)) for row in rows]
+
+    # ----- vector index -----
+    def _index_file(self):
+        return os.path.join(self.index_dir, self.index_name + ".faiss")
+
+    def _load_index(self):
+        """Return the in-memory index, reloading only if another process grew it."""
+        path = self._index_file()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+        if self._index is None or mtime > self._index_mtime:
+            if mtime:
+                from langchain_community.vectorstores import FAISS
+                # The pickle is written by this module only, never by users.
+                self._index = FAISS.load_local(self.index_dir, self.embeddings, self.index_name,
+                                               allow_dangerous_deserialization=True)
+                self._by_owner, self._ids = {}, set()
+                for position, doc_id in sorted(self._index.index_to_docstore_id.items()):
+                    self._track(position, doc_id)
+            self._index_mtime = mtime
+        return self._index
+
+    def _track(self, position, doc_id):
+        metadata = self._index.docstore.search(doc_id).metadata
+        self._by_owner.setdefault(metadata.get("owner"), []).append((position, metadata))
+        self._ids.add(doc_id)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Serialise index writes across Streamlit processes on the same host."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.index_dir, ".lock"), "w") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _known_ids(self):
+        self._load_index()
+        return self._ids
+
+    def add_chunks(self, texts, metadatas, ids=None):
+        """Append chunks to the on-disk index without rebuilding it; returns how many were added.
+
+        Chunks whose ``ids`` are already in the index are skipped, so a batch
+        repeated after a crash is not indexed twice. Embedding happens before
+        the lock is taken, so searches are only held up for the append and the save.
+        """
+        if ids is not None:
+            with self._lock:
+                known = self._known_ids()
+            ids, texts, metadatas = _drop_known(known, ids, texts, metadatas)
+        if not texts:
+            return 0
+        vectors = self.embeddings.embed_documents(texts)
+        with self._lock, self._file_lock():
+            if ids is not None:  # another process may have added some meanwhile
+                ids, texts, metadatas, vectors = _drop_known(self._known_ids(), ids, texts, metadatas, vectors)
+                if not texts:
+                    return 0
+            pairs = list(zip(texts, vectors))
+            index = self._load_index()
+            if index is None:
+                from langchain_community.vectorstores import FAISS
+                index = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=ids)
+                start = 0
+            else:
+                start = index.index.ntotal
+                index.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            self._index = index
+            for position in range(start, start + len(pairs)):
+                self._track(position, index.index_to_docstore_id[position])
+            index.save_local(self.index_dir, self.index_name)
+            self._index_mtime = os.path.getmtime(self._index_file())
+        return len(texts)
+
+    def index_run(self, run_id):
+        """Embed one stored run into the shared index."""
+        row = self._conn().execute("SELECT owner, created_at, indexed FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if not row or row[2]:
+            return 0
+        owner, created_at, _ = row
+        run = self.load_run(run_id)
+        texts, metadatas = pipeline_chunks(
+            run["lead"], run["strategy"], run["message"], run["auto_reply"],
+            base_metadata={"owner": owner, "run_id": run_id,
+                           "run_date": time.strftime("%Y-%m-%d", time.localtime(created_at))},
+        )
+        ids = [f"run-{run_id}-{n}" for n in range(len(texts))]
+        added = self.add_chunks(texts, metadatas, ids=ids)
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET indexed = 1 WHERE id = ?", (run_id,))
+        return added
+
+    def sync_index(self):
+        """Embed any runs that were saved but never indexed (e.g. after a crash)."""
+        pending = [r[0] for r in self._conn().execute("SELECT id FROM runs WHERE indexed = 0 ORDER BY id")]
+        return sum(self.index_run(run_id) for run_id in pending)
+
+    def search(self, question, owner, k=6, run_id=None, exclude_run_id=None, kinds=RECORD_KINDS):
+        """Top-k chunks for ``owner``; pass ``kinds=("document",)`` for uploaded files.
+
+        Ranks exactly the chunks in scope, whatever else the index holds. The
+        vectors are copied under the lock, so a concurrent ``add_chunks`` never
+        changes them mid-search.
+        """
+        if not question:
+            return []
+        query = self.embeddings.embed_query(question)
+
+        def allowed(meta):
+            if meta.get("kind") not in kinds:
+                return False
+            if run_id is not None and meta.get("run_id") != run_id:
+                return False
+            return exclude_run_id is None or meta.get("run_id") != exclude_run_id
+
+        with self._lock:
+            index = self._load_index()
+            if index is None:
+                return []
+            positions = [position for position, meta in self._by_owner.get(owner, ()) if allowed(meta)]
+            if not positions:
+                return []
+            vectors = subset_vectors(index, positions)
+            normalize = index._normalize_L2
+            inner_product = index.distance_strategy == "MAX_INNER_PRODUCT"
+        if normalize:
+            import numpy as np
+            query = np.asarray(query, dtype="float32")
+            query = query / (np.linalg.norm(query) or 1.0)
+        best = [positions[row] for row in nearest(vectors, query, k, inner_product)]
+        with self._lock:
+            return [index.docstore.search(index.index_to_docstore_id[position]) for position in best]
+
+
+def _drop_known(known, ids, *columns):
+    """``ids`` and the parallel ``columns`` without the entries whose ID is in ``known``."""
+    keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in known]
+    return [[column[i] for i in keep] for column in (ids, *columns)]
+
+
+def _safe_name(value):
+    return "".join(ch if ch.isalnum() else "_" for ch in str(value)).strip("_") or "default"
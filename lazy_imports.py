@@ -0,0 +1,53 @@
+"""Deferred imports for the heavy SDKs, so the login page renders on Streamlit alone.
+
+``pd = lazy_module("pandas")`` binds a stand-in that imports the real module
+the first time an attribute is read; after that every access goes straight to
+the module. How long each deferred import took is kept for the startup
+benchmark.
+"""
+
+import importlib
+import threading
+import time
+import types
+
+_lock = threading.Lock()
+_load_times = {}
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_target"]
+        if module is None:
+            with _lock:
+                module = self.__dict__["_lazy_target"]
+                if module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    _load_times[self.__name__] = time.perf_counter() - started
+                    self.__dict__["_lazy_target"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_target"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def load_times():
+    """Seconds spent on each deferred import so far, keyed by module name."""
+    with _lock:
+        return dict(_load_times)
@@ -0,0 +1,321 @@
+"""Shared Gemini gateway.
+
+One process-wide pool of (API key, model) lanes. Each lane caches its own
+client, so nothing calls the process-global ``genai.configure`` any more, and
+has its own token bucket and cooldown. Requests go to the least-loaded key that
+has capacity; failures back off with jitter, honouring retry-after hints.
+``generate_stream`` hands text to a callback as it arrives.
+"""
+
+import contextvars
+import functools
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from telemetry import COUNT_BUCKETS, inc, observe, span
+
+_RETRY_IN_RE = re.compile(r"retry in\s+(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+_RETRY_DELAY_RE = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit")
+_BAD_KEY_MARKERS = ("api_key_invalid", "api key not valid", "permission_denied", "403")
+
+
+class GatewayError(Exception):
+    """Raised when no key/model lane could serve a request in time."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = max(float(rate_per_minute), 0.001) / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute) // 4))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token. Returns 0.0 on success, else seconds until one is free."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+
+@functools.lru_cache(maxsize=None)
+def _service_client(api_key):
+    import google.ai.generativelanguage as glm
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+
+def gemini_client_factory(api_key, model_name):
+    """Build a ``GenerativeModel`` bound to its own per-key service client."""
+    import google.generativeai as genai
+    model = genai.GenerativeModel(model_name)
+    # GenerativeModel falls back to the global client only when _client is unset.
+    model._client = _service_client(api_key)
+    return model
+
+
+def retry_after_hint(exc):
+    """Seconds the server asked us to wait, if the error carries a hint."""
+    for attr in ("retry_after", "retry_delay"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        header = headers.get("retry-after") or headers.get("Retry-After")
+        if header:
+            return float(header)
+    except (TypeError, ValueError):
+        pass
+    text = str(exc)
+    for pattern in (_RETRY_IN_RE, _RETRY_DELAY_RE):
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def classify_error(exc):
+    """Return "rate_limit", "bad_key" or "transient" for a failed call."""
+    code = getattr(exc, "code", None)
+    if not isinstance(code, int):
+        code = getattr(exc, "status_code", None)  # anthropic / openai SDK errors
+    text = (type(exc).__name__ + " " + str(exc)).lower()
+    if code == 429 or "toomanyrequests" in text or "resourceexhausted" in text or "ratelimit" in text:
+        return "rate_limit"
+    if any(marker in text for marker in _RATE_LIMIT_MARKERS):
+        return "rate_limit"
+    if code in (401, 403) or any(marker in text for marker in _BAD_KEY_MARKERS):
+        return "bad_key"
+    return "transient"
+
+
+class _Lane:
+    """One (api key, model) pair with its cached client and limiter."""
+
+    def __init__(self, key_index, api_key, model_name, model_rank, rpm, client_factory):
+        self.key_index = key_index
+        self.api_key = api_key
+        self.model_name = model_name
+        self.model_rank = model_rank
+        self.bucket = TokenBucket(rpm)
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self._client = None
+        self._client_factory = client_factory
+
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory(self.api_key, self.model_name)
+        return self._client
+
+
+class GeminiGateway:
+    """Routes prompts across every configured key and model."""
+
+    def __init__(self, api_keys, models, rpm=15, per_key_concurrency=2, max_attempts=6,
+                 base_delay=1.0, max_delay=20.0, max_wait=90.0, bad_key_cooldown=300.0,
+                 client_factory=None):
+        self.keys = [k.strip() for k in api_keys if k and k.strip()]
+        self.models = list(models)
+        self.per_key_concurrency = max(1, int(per_key_concurrency))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.bad_key_cooldown = bad_key_cooldown
+        factory = client_factory or gemini_client_factory
+        self._lock = threading.Lock()
+        self._in_flight = [0] * len(self.keys)
+        self._lanes = [
+            _Lane(k_idx, key, model, m_idx, rpm, factory)
+            for k_idx, key in enumerate(self.keys)
+            for m_idx, model in enumerate(self.models)
+        ]
+
+    @property
+    def concurrency(self):
+        """How many calls the pool can usefully run at once."""
+        return max(1, len(self.keys) * self.per_key_concurrency)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "keys": len(self.keys),
+                "in_flight": sum(self._in_flight),
+                "cooling": sum(1 for lane in self._lanes if lane.cooldown_until > now),
+            }
+
+    def _acquire(self):
+        """Pick the least-loaded ready lane; returns (lane, 0) or (None, wait)."""
+        with self._lock:
+            now = time.monotonic()
+            waits = [lane.cooldown_until - now for lane in self._lanes if lane.cooldown_until > now]
+            usable = [lane for lane in self._lanes if lane.cooldown_until <= now]
+            ready = [lane for lane in usable if self._in_flight[lane.key_index] < self.per_key_concurrency]
+            if len(ready) < len(usable):
+                # A saturated key frees up as soon as one of its calls returns.
+                waits.append(0.05)
+            ready.sort(key=lambda lane: (self._in_flight[lane.key_index], lane.model_rank, lane.key_index))
+            for lane in ready:
+                wait = lane.bucket.try_acquire()
+                if wait == 0.0:
+                    self._in_flight[lane.key_index] += 1
+                    return lane, 0.0
+                waits.append(wait)
+            return None, min(waits) if waits else 0.25
+
+    def _backoff(self, failures):
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, failures - 1)))
+        return random.uniform(delay / 2.0, delay)
+
+    def _release(self, lane, exc=None):
+        with self._lock:
+            self._in_flight[lane.key_index] -= 1
+            if exc is None:
+                lane.failures = 0
+                return
+            lane.failures += 1
+            kind = classify_error(exc)
+            now = time.monotonic()
+            if kind == "bad_key":
+                for other in self._lanes:
+                    if other.key_index == lane.key_index:
+                        other.cooldown_until = now + self.bad_key_cooldown
+                return
+            hint = retry_after_hint(exc) if kind == "rate_limit" else None
+            delay = hint if hint is not None else self._backoff(lane.failures)
+            lane.cooldown_until = now + delay + random.uniform(0, 0.25)
+
+    def _call(self, fn):
+        """Run ``fn(lane)`` on the best available lane, retrying on other lanes.
+
+        Returns ``(result, model_name)``; raises GatewayError once
+        ``max_attempts`` calls failed or ``max_wait`` seconds have passed.
+        """
+        if not self.keys:
+            raise GatewayError("No valid API Key detected.")
+        errors = []
+        attempts = 0
+        keys_tried = []
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while attempts < self.max_attempts:
+                lane, wait = self._acquire()
+                if lane is None:
+                    if time.monotonic() + wait > deadline:
+                        break
+                    time.sleep(wait + random.uniform(0, 0.1))
+                    continue
+                attempts += 1
+                if not keys_tried or keys_tried[-1] != lane.key_index:
+                    keys_tried.append(lane.key_index)
+                try:
+                    with span("gemini.request", key=lane.key_index, model=lane.model_name, attempt=attempts):
+                        result = fn(lane)
+                except _StreamInterrupted as exc:
+                    self._release(lane, exc.cause)
+                    raise GatewayError(f"Key_{lane.key_index}/{lane.model_name}: {exc}") from exc.cause
+                except Exception as exc:
+                    inc("gemini_errors_total", kind=classify_error(exc))
+                    errors.append(f"Key_{lane.key_index}/{lane.model_name}: {exc}")
+                    self._release(lane, exc)
+                    continue
+                self._release(lane)
+                return result, lane.model_name
+            raise GatewayError(f"All keys exhausted. Errors: {errors}")
+        finally:
+            observe("gemini_call_retries", max(0, attempts - 1), COUNT_BUCKETS)
+            observe("gemini_call_key_failovers", max(0, len(keys_tried) - 1), COUNT_BUCKETS)
+
+    def generate(self, prompt, **kwargs):
+        """Run ``generate_content`` on the best available lane; returns ``(response, model_name)``."""
+        return self._call(lambda lane: lane.client().generate_content(prompt, **kwargs))
+
+    def generate_stream(self, prompt, on_text, **kwargs):
+        """Stream ``generate_content``, calling ``on_text(piece)`` as text arrives.
+
+        A call that fails before its first piece is retried like ``generate``;
+        once text has been handed to ``on_text`` it cannot be taken back, so a
+        stream that breaks part-way raises GatewayError instead.
+        Returns ``(full_text, model_name)``.
+        """
+        def call(lane):
+            parts = []
+            try:
+                for chunk in lane.client().generate_content(prompt, stream=True, **kwargs):
+                    piece = _chunk_text(chunk)
+                    if piece:
+                        parts.append(piece)
+                        on_text(piece)
+            except Exception as exc:
+                if parts:
+                    raise _StreamInterrupted(f"stream broke after {len(parts)} chunks: {exc}", exc) from exc
+                raise
+            return "".join(parts)
+
+        return self._call(call)
+
+
+class _StreamInterrupted(Exception):
+    def __init__(self, message, cause):
+        super().__init__(message)
+        self.cause = cause
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        return ""  # chunks carrying only safety ratings or a finish reason have no text
+
+
+def _safe_call(fn, item):
+    try:
+        return fn(item)
+    except Exception as exc:
+        return exc
+
+
+def fan_out(fn, items, max_workers):
+    """Call ``fn`` on every item concurrently, returning results in input order.
+
+    A failing item yields its exception in place of a result, so one bad call
+    does not throw away the others. Workers inherit the caller's contextvars.
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(int(max_workers), len(items)))
+    if workers == 1:
+        return [_safe_call(fn, item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _safe_call, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def fan_out_iter(fn, items, max_workers):
+    """Like ``fan_out`` but yields ``(index, result)`` as each call finishes."""
+    items = list(items)
+    if not items:
+        return
+    workers = max(1, min(int(max_workers), len(items)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent") as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, _safe_call, fn, item): idx
+            for idx, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
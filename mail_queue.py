@@ -0,0 +1,190 @@
+"""Background outbound email over a reused SMTP connection.
+
+``SMTPConnection`` logs in once and keeps the session open, reconnecting when
+the server has dropped it or it has sat idle past ``idle_timeout``.
+``OutboundQueue`` runs one worker thread per pooled connection: messages are
+sent in submission order, throttled by a token bucket, retried with backoff on
+transient failures, and each one's status is readable at any time, so the UI
+only ever enqueues and polls.
+"""
+
+import itertools
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import parseaddr
+
+from llm_gateway import TokenBucket
+from telemetry import span
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def is_email_address(value):
+    """Whether ``value`` is one plain address (``name@domain.tld``), not a placeholder or a display name."""
+    text = str(value or "").strip()
+    address = parseaddr(text)[1]
+    local, _, domain = address.rpartition("@")
+    return address == text and bool(local) and "." in domain.strip(".")
+
+
+def build_message(sender, to, subject, body, sender_name=None, bcc=None):
+    message = EmailMessage()
+    message["From"] = f"{sender_name} <{sender}>" if sender_name else sender
+    message["To"] = to
+    if bcc:
+        message["Bcc"] = bcc  # send_message strips it from the copy that goes out
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+class SMTPConnection:
+    """One authenticated SMTP_SSL session, reopened on demand."""
+
+    def __init__(self, host, port, user, password, idle_timeout=60.0, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        # Span names say which provider: smtp.gmail.send, smtp.hostinger.send.
+        self.service = host.split(".")[-2] if "." in host else host
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self.close()
+        with span(f"smtp.{self.service}.connect", host=self.host):
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+            server.login(self.user, self.password)
+        self._server = server
+
+    def _alive(self):
+        if self._server is None:
+            return False
+        if time.monotonic() - self._last_used < self.idle_timeout:
+            return True
+        # Servers drop idle sessions; probe before trusting an old one.
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message):
+        with self._lock:
+            if not self._alive():
+                self._connect()
+            with span(f"smtp.{self.service}.send", host=self.host):
+                try:
+                    self._server.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    self._connect()
+                    self._server.send_message(message)
+            self._last_used = time.monotonic()
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+
+def is_transient(exc):
+    """Network trouble and 4xx replies are worth retrying; 5xx and bad logins are not."""
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class OutboundQueue:
+    """Sends queued messages over ``connections``, one worker thread each."""
+
+    def __init__(self, connections, rate_per_minute=30, max_retries=3, base_delay=2.0, keep_jobs=1000):
+        self.connections = list(connections)
+        self.keep_jobs = keep_jobs
+        self.bucket = TokenBucket(rate_per_minute, burst=5)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._run, args=(connection,), name=f"mail-queue-{i}", daemon=True)
+            for i, connection in enumerate(self.connections)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, message, label=""):
+        """Queue one message; returns its job id."""
+        job_id = next(self._ids)
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "label": label, "to": message["To"], "status": QUEUED,
+                                  "attempts": 0, "error": None}
+            finished = [i for i, job in self._jobs.items() if job["status"] in (SENT, FAILED)]
+            for old_id in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+                del self._jobs[old_id]
+        self._queue.put((job_id, message))
+        return job_id
+
+    def submit_batch(self, messages):
+        """Queue ``(message, label)`` pairs; they go out over the same connection."""
+        return [self.submit(message, label) for message, label in messages]
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def status(self, job_ids=None):
+        with self._lock:
+            ids = self._jobs if job_ids is None else [i for i in job_ids if i in self._jobs]
+            return [dict(self._jobs[i]) for i in ids]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, connection):
+        while True:
+            job_id, message = self._queue.get()
+            try:
+                self._send(connection, job_id, message)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, connection, job_id, message):
+        for attempt in range(1, self.max_retries + 2):
+            wait = self.bucket.try_acquire()
+            while wait:
+                time.sleep(wait)
+                wait = self.bucket.try_acquire()
+            self._update(job_id, status=SENDING, attempts=attempt)
+            try:
+                connection.send(message)
+            except Exception as exc:
+                if attempt > self.max_retries or not is_transient(exc):
+                    self._update(job_id, status=FAILED, error=str(exc))
+                    return
+                connection.close()
+                delay = self.base_delay * (2 ** (attempt - 1))
+                time.sleep(random.uniform(delay / 2.0, delay))
+                continue
+            self._update(job_id, status=SENT, error=None)
+            return
@@ -0,0 +1,373 @@
+"""Route each agent's prompts across LLM providers (Gemini, Claude, OpenAI).
+
+Every provider has the same small surface, ``generate(prompt, on_text=None,
+json_mode=None)`` returning ``(text, model_name)``, so Gemini's key-pooled gateway, the Anthropic
+and OpenAI SDKs and a local stub are interchangeable. The router keeps a rolling
+latency window per provider and, for each call, orders the agent's healthy
+providers by observed latency, estimated cost or configured preference. A
+provider that is rate-limited or failing cools down (for as long as the server
+asked, when it says) while the call fails over to the next one.
+"""
+
+import threading
+import time
+from collections import deque
+
+from llm_gateway import GatewayError, TokenBucket, classify_error, retry_after_hint
+from telemetry import COUNT_BUCKETS, LatencyWindow, inc, observe, span
+
+STRATEGIES = ("latency", "cost", "ordered")
+
+# List prices in USD per million (input, output) tokens; override with ``prices=``.
+DEFAULT_PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+DEFAULT_CLAUDE_MODEL = "claude-3-5-haiku-latest"
+DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+
+
+def estimate_tokens(text):
+    return max(1, len(text or "") // 4)
+
+
+class ProviderBusy(Exception):
+    """A provider's own rate limiter is empty; carries how long until it refills."""
+
+    code = 429
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} rate limit: retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class GeminiProvider:
+    """Gemini through the shared GeminiGateway, which already pools keys and models."""
+
+    name = "gemini"
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.models = list(gateway.models)
+        self.model = self.models[0] if self.models else ""
+
+    @property
+    def concurrency(self):
+        return self.gateway.concurrency
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        kwargs = {"generation_config": {"response_mime_type": "application/json"}} if json_mode else {}
+        if on_text:
+            return self.gateway.generate_stream(prompt, on_text, **kwargs)
+        response, model_name = self.gateway.generate(prompt, **kwargs)
+        return response.text, model_name
+
+
+class _SDKProvider:
+    """One API key and model behind a vendor SDK client, with its own token bucket.
+
+    SDK-level retries are off: when this provider is busy the router moves the
+    call to another one instead of sleeping here. ``json_mode`` (``"array"`` or
+    ``"object"``) asks for JSON output in whatever way the vendor supports.
+    """
+
+    name = ""
+
+    def __init__(self, api_key, model, rpm=50, concurrency=4, max_tokens=4096, timeout=120.0):
+        self.api_key = api_key.strip()
+        self.model = model
+        self.models = [model]
+        self.concurrency = max(1, int(concurrency))
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.bucket = TokenBucket(rpm)
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._make_client()
+            return self._client
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        wait = self.bucket.try_acquire()
+        if wait:
+            raise ProviderBusy(self.name, wait)
+        if on_text:
+            parts = []
+            for piece in self._stream(prompt, json_mode):
+                if piece:
+                    parts.append(piece)
+                    on_text(piece)
+            return "".join(parts), self.model
+        return self._complete(prompt, json_mode), self.model
+
+
+class AnthropicProvider(_SDKProvider):
+    name = "claude"
+
+    def _make_client(self):
+        import anthropic
+        return anthropic.Anthropic(api_key=self.api_key, max_retries=0, timeout=self.timeout)
+
+    @staticmethod
+    def _prefill(json_mode):
+        # Claude has no JSON switch; starting its reply with the opening bracket holds it to JSON.
+        return {"array": "[", "object": "{"}.get(json_mode, "")
+
+    def _messages(self, prompt, json_mode):
+        messages = [{"role": "user", "content": prompt}]
+        if self._prefill(json_mode):
+            messages.append({"role": "assistant", "content": self._prefill(json_mode)})
+        return {"model": self.model, "max_tokens": self.max_tokens, "messages": messages}
+
+    def _complete(self, prompt, json_mode):
+        message = self.client().messages.create(**self._messages(prompt, json_mode))
+        return self._prefill(json_mode) + "".join(
+            block.text for block in message.content if getattr(block, "type", "") == "text")
+
+    def _stream(self, prompt, json_mode):
+        # The prefill goes out with the first real text, so a stream that fails
+        # to open has emitted nothing and the router can still fail over.
+        prefill = self._prefill(json_mode)
+        with self.client().messages.stream(**self._messages(prompt, json_mode)) as stream:
+            for text in stream.text_stream:
+                if text:
+                    yield prefill + text
+                    prefill = ""
+        yield prefill
+
+
+class OpenAIProvider(_SDKProvider):
+    name = "openai"
+
+    def _make_client(self):
+        import openai
+        return openai.OpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout)
+
+    def _request(self, prompt, **kwargs):
+        return self.client().chat.completions.create(
+            model=self.model, max_tokens=self.max_tokens, messages=[{"role": "user", "content": prompt}], **kwargs)
+
+    @staticmethod
+    def _format(json_mode):
+        # JSON mode only guarantees an object; array replies stay as prompted.
+        return {"response_format": {"type": "json_object"}} if json_mode == "object" else {}
+
+    def _complete(self, prompt, json_mode):
+        return self._request(prompt, **self._format(json_mode)).choices[0].message.content or ""
+
+    def _stream(self, prompt, json_mode):
+        for chunk in self._request(prompt, stream=True, **self._format(json_mode)):
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+
+
+class StubProvider:
+    """Local provider for tests and offline runs: no network, deterministic replies.
+
+    ``reply`` is a string or ``reply(prompt) -> str``. ``errors`` are raised by
+    the first calls, one per call, before replies start, which is how failover
+    is exercised. Streaming hands the reply over in ``chunk_size`` pieces.
+    """
+
+    def __init__(self, name="stub", reply="", model="stub-model", latency=0.0, errors=(), chunk_size=40,
+                 concurrency=4):
+        self.name = name
+        self.model = model
+        self.models = [model]
+        self.reply = reply
+        self.latency = latency
+        self.chunk_size = max(1, int(chunk_size))
+        self.concurrency = concurrency
+        self.calls = 0
+        self._errors = deque(errors)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        with self._lock:
+            self.calls += 1
+            error = self._errors.popleft() if self._errors else None
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise error
+        text = self.reply(prompt) if callable(self.reply) else str(self.reply)
+        if on_text:
+            for start in range(0, len(text), self.chunk_size):
+                on_text(text[start:start + self.chunk_size])
+        return text, self.model
+
+
+class _Health:
+    def __init__(self, window):
+        self.latency = LatencyWindow(window)
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+
+
+class ModelRouter:
+    """Picks a provider per call and fails over between them.
+
+    ``routes`` maps an agent name (or ``"default"``) to the providers it may
+    use, in order of preference; agents without a route may use every provider.
+    ``strategy`` is "latency" (fastest rolling p50 first; providers with no
+    samples yet are tried first so they get measured), "cost" (cheapest
+    estimated call first) or "ordered" (the route's order, failover only).
+    """
+
+    def __init__(self, providers, routes=None, strategy="latency", prices=None, window=100,
+                 rate_limit_cooldown=30.0, error_cooldown=5.0, max_error_cooldown=120.0, bad_key_cooldown=300.0,
+                 max_wait=60.0, expected_output_tokens=800):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, not {strategy!r}")
+        self.providers = {provider.name: provider for provider in providers}
+        self.routes = {
+            agent: [name for name in ([names] if isinstance(names, str) else names) if name in self.providers]
+            for agent, names in (routes or {}).items()
+        }
+        self.strategy = strategy
+        self.prices = dict(DEFAULT_PRICES, **(prices or {}))
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.error_cooldown = error_cooldown
+        self.max_error_cooldown = max_error_cooldown
+        self.bad_key_cooldown = bad_key_cooldown
+        self.max_wait = max_wait
+        self.expected_output_tokens = expected_output_tokens
+        self._health = {name: _Health(window) for name in self.providers}
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        return max(1, sum(int(getattr(provider, "concurrency", 1)) for provider in self.providers.values()))
+
+    def route(self, agent=None):
+        return self.routes.get(agent) or self.routes.get("default") or list(self.providers)
+
+    def cache_labels(self, agent=None):
+        """``(provider, model)`` pairs whose stored answers may serve this agent."""
+        return [(name, model) for name in self.route(agent) for model in self.providers[name].models]
+
+    def estimated_cost(self, name, prompt):
+        provider = self.providers[name]
+        price_in, price_out = self.prices.get(getattr(provider, "model", ""), (0.0, 0.0))
+        return (estimate_tokens(prompt) * price_in + self.expected_output_tokens * price_out) / 1e6
+
+    def candidates(self, agent=None, prompt=""):
+        """The agent's providers that are not cooling down, best first."""
+        now = time.monotonic()
+        with self._lock:
+            names = [name for name in self.route(agent) if self._health[name].cooldown_until <= now]
+            busy = {name: self._health[name].in_flight >= getattr(self.providers[name], "concurrency", 1)
+                    for name in names}
+        if self.strategy == "ordered":
+            return names
+
+        def p50(name):
+            return self._health[name].latency.percentile(0.5) or 0.0
+
+        if self.strategy == "cost":
+            key = lambda name: (busy[name], self.estimated_cost(name, prompt), p50(name))
+        else:
+            key = lambda name: (busy[name], p50(name), self.estimated_cost(name, prompt))
+        return sorted(names, key=key)  # stable: ties keep the route's preference order
+
+    def _begin(self, name):
+        with self._lock:
+            health = self._health[name]
+            health.calls += 1
+            health.in_flight += 1
+
+    def _succeed(self, name, seconds):
+        with self._lock:
+            health = self._health[name]
+            health.in_flight -= 1
+            health.failures = 0
+        health.latency.add(seconds)
+
+    def _fail(self, name, exc):
+        with self._lock:
+            health = self._health[name]
+            health.in_flight -= 1
+            health.errors += 1
+            health.failures += 1
+            kind = classify_error(exc)
+            inc("llm_provider_errors_total", provider=name, kind=kind)
+            if kind == "bad_key":
+                delay = self.bad_key_cooldown
+            elif kind == "rate_limit":
+                delay = retry_after_hint(exc) or self.rate_limit_cooldown
+            else:
+                delay = min(self.max_error_cooldown, self.error_cooldown * (2 ** (health.failures - 1)))
+            health.cooldown_until = time.monotonic() + delay
+
+    def generate(self, prompt, agent=None, on_text=None, json_mode=None):
+        """Run ``prompt`` on the best provider for ``agent``; returns ``(text, provider, model)``.
+
+        ``json_mode`` (``"array"`` or ``"object"``) is passed on so providers
+        can switch on their native JSON output.
+
+        A streamed call that already handed text to ``on_text`` is not failed
+        over, since that text cannot be taken back; it raises GatewayError.
+        """
+        if not self.providers:
+            raise GatewayError("No model provider is configured.")
+        errors = []
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            for name in self.candidates(agent, prompt):
+                emitted = []
+
+                def relay(piece):
+                    emitted.append(True)
+                    on_text(piece)
+
+                self._begin(name)
+                started = time.monotonic()
+                try:
+                    with span("llm." + name, agent=agent, model=getattr(self.providers[name], "model", "")):
+                        text, model = self.providers[name].generate(
+                            prompt, on_text=relay if on_text else None, json_mode=json_mode)
+                except Exception as exc:
+                    self._fail(name, exc)
+                    if emitted:
+                        raise GatewayError(f"{name}: stream broke part-way: {exc}") from exc
+                    errors.append(f"{name}: {exc}")
+                    continue
+                self._succeed(name, time.monotonic() - started)
+                observe("llm_call_failed_attempts", len(errors), COUNT_BUCKETS, agent=agent or "default")
+                return text, name, model
+            wait = self._next_ready(agent)
+            if wait is None or time.monotonic() + wait > deadline:
+                raise GatewayError(f"All providers failed. Errors: {errors[-6:]}")
+            time.sleep(wait)
+
+    def _next_ready(self, agent):
+        now = time.monotonic()
+        with self._lock:
+            waits = [max(0.0, self._health[name].cooldown_until - now) for name in self.route(agent)]
+        return min(waits) if waits else None
+
+    def stats(self):
+        """Per-provider call counts, health and rolling p50/p95 latency in seconds."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "model": getattr(self.providers[name], "model", ""),
+                    "calls": health.calls,
+                    "errors": health.errors,
+                    "in_flight": health.in_flight,
+                    "cooling": max(0.0, health.cooldown_until - now),
+                    "p50": health.latency.percentile(0.5),
+                    "p95": health.latency.percentile(0.95),
+                }
+                for name, health in self._health.items()
+            }
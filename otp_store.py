@@ -0,0 +1,185 @@
+"""Process-wide one-time-password store with expiry and send throttles.
+
+Codes are kept as salted hashes keyed by email, expire after ``ttl`` seconds
+and are burned after ``max_attempts`` wrong guesses; verification is a single
+lookup plus ``hmac.compare_digest``. Sends are limited per email and per client
+IP with fixed-window counters. Everything lives in bounded in-memory maps by
+default; pass ``db_path`` to share the store between Streamlit processes
+through SQLite instead.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _hash_code(salt, email, code):
+    return hashlib.sha256(salt + email.encode("utf-8") + b"\x1f" + str(code).encode("utf-8")).hexdigest()
+
+
+def normalize_email(email):
+    return str(email or "").strip().lower()
+
+
+class _MemoryBackend:
+    """Insertion-ordered maps trimmed from the oldest end, so memory stays bounded."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.codes = OrderedDict()
+        self.windows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put_code(self, email, record):
+        with self.lock:
+            self.codes.pop(email, None)
+            self.codes[email] = record
+            self._trim(self.codes, lambda rec: rec["expires_at"])
+
+    def get_code(self, email):
+        with self.lock:
+            record = self.codes.get(email)
+            return dict(record) if record else None
+
+    def add_attempt(self, email):
+        with self.lock:
+            if email in self.codes:
+                self.codes[email]["attempts"] += 1
+
+    def delete_code(self, email):
+        with self.lock:
+            self.codes.pop(email, None)
+
+    def hit(self, key, window, now):
+        with self.lock:
+            start, count, _ = self.windows.pop(key, (now, 0, now))
+            if now - start >= window:
+                start, count = now, 0
+            # Each entry keeps its own expiry: email and IP windows differ in length.
+            self.windows[key] = (start, count + 1, start + window)
+            self._trim(self.windows, lambda entry: entry[2])
+            return count + 1, start + window
+
+    def _trim(self, table, expires):
+        now = time.time()
+        while table:
+            key, value = next(iter(table.items()))
+            if len(table) <= self.max_entries and expires(value) > now:
+                break
+            del table[key]
+
+
+class _SQLiteBackend:
+    """Rows expire by timestamp, so the tables only hold live codes and recent windows."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS otp_codes (
+                email TEXT PRIMARY KEY, salt BLOB NOT NULL, code_hash TEXT NOT NULL,
+                expires_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS otp_codes_expiry ON otp_codes(expires_at);
+            CREATE TABLE IF NOT EXISTS otp_windows (
+                key TEXT PRIMARY KEY, started_at REAL NOT NULL, count INTEGER NOT NULL
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put_code(self, email, record):
+        conn = self._conn()
+        conn.execute("DELETE FROM otp_codes WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "INSERT OR REPLACE INTO otp_codes(email, salt, code_hash, expires_at, attempts) VALUES (?, ?, ?, ?, ?)",
+            (email, record["salt"], record["code_hash"], record["expires_at"], record["attempts"]),
+        )
+
+    def get_code(self, email):
+        row = self._conn().execute(
+            "SELECT salt, code_hash, expires_at, attempts FROM otp_codes WHERE email = ?", (email,)).fetchone()
+        return dict(zip(("salt", "code_hash", "expires_at", "attempts"), row)) if row else None
+
+    def add_attempt(self, email):
+        self._conn().execute("UPDATE otp_codes SET attempts = attempts + 1 WHERE email = ?", (email,))
+
+    def delete_code(self, email):
+        self._conn().execute("DELETE FROM otp_codes WHERE email = ?", (email,))
+
+    def hit(self, key, window, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT started_at, count FROM otp_windows WHERE key = ?", (key,)).fetchone()
+            start, count = row if row and now - row[0] < window else (now, 0)
+            conn.execute("INSERT OR REPLACE INTO otp_windows(key, started_at, count) VALUES (?, ?, ?)",
+                         (key, start, count + 1))
+            conn.execute("DELETE FROM otp_windows WHERE started_at <= ?", (now - 86400,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return count + 1, start + window
+
+
+class OTPStore:
+    def __init__(self, ttl=600, max_attempts=5, email_limit=(3, 600), ip_limit=(10, 3600), max_entries=10000,
+                 db_path=None):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.email_limit = email_limit
+        self.ip_limit = ip_limit
+        self._backend = _SQLiteBackend(db_path) if db_path else _MemoryBackend(max_entries)
+
+    def _throttle(self, key, limit, now):
+        count, reset_at = self._backend.hit(key, limit[1], now)
+        if count > limit[0]:
+            minutes = max(1, int((reset_at - now + 59) // 60))
+            return f"Too many codes requested. Please try again in {minutes} minute{'s' if minutes > 1 else ''}."
+        return None
+
+    def issue(self, email, ip=None):
+        """Create a fresh code for ``email``; returns ``(code, None)`` or ``(None, reason)``."""
+        email = normalize_email(email)
+        now = time.time()
+        reason = self._throttle("email:" + email, self.email_limit, now)
+        if reason is None and ip:
+            reason = self._throttle("ip:" + ip, self.ip_limit, now)
+        if reason:
+            return None, reason
+        code = str(100000 + secrets.randbelow(900000))
+        salt = secrets.token_bytes(16)
+        self._backend.put_code(email, {"salt": salt, "code_hash": _hash_code(salt, email, code),
+                                       "expires_at": now + self.ttl, "attempts": 0})
+        return code, None
+
+    def verify(self, email, code):
+        """Check a code in constant time; returns ``(ok, message)``. A correct code is single-use."""
+        email = normalize_email(email)
+        record = self._backend.get_code(email)
+        if record is None:
+            return False, "No active code for this email. Please request a new one."
+        if record["expires_at"] <= time.time():
+            self._backend.delete_code(email)
+            return False, "This code has expired. Please request a new one."
+        if record["attempts"] >= self.max_attempts:
+            self._backend.delete_code(email)
+            return False, "Too many incorrect attempts. Please request a new code."
+        if hmac.compare_digest(record["code_hash"], _hash_code(record["salt"], email, str(code or "").strip())):
+            self._backend.delete_code(email)
+            return True, None
+        self._backend.add_attempt(email)
+        return False, "Incorrect code. Please check your inbox and try again."
@@ -0,0 +1,169 @@
+"""Small DAG scheduler for the agent pipeline.
+
+Each Stage declares the data keys it reads and writes. ``Pipeline.run`` starts
+every stage whose inputs are available, so independent stages overlap, and
+records per-stage status and wall time. Stage functions run on worker threads;
+anything they ``emit`` is queued and handed to ``on_event`` on the calling
+thread, which is the only one allowed to touch Streamlit.
+"""
+
+import contextvars
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from telemetry import span
+
+IDLE = "idle"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class PipelineError(Exception):
+    """Raised for an invalid stage graph or a stage that broke its contract."""
+
+
+class Stage:
+    """One unit of work: ``fn(inputs, emit) -> {output_key: value}``.
+
+    ``optional`` keys are waited for while some stage may still produce them,
+    but a skipped or failed producer does not block this stage.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), optional=(), enabled=True):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.optional = tuple(optional)
+        self.enabled = enabled
+
+
+class StageState:
+    def __init__(self, name):
+        self.name = name
+        self.status = IDLE
+        self.started = None
+        self.elapsed = None
+        self.error = None
+
+    def as_dict(self):
+        return {"status": self.status, "elapsed": self.elapsed, "error": self.error}
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+        seen_names, seen_outputs = set(), {}
+        for stage in self.stages:
+            if stage.name in seen_names:
+                raise PipelineError(f"Duplicate stage name: {stage.name}")
+            seen_names.add(stage.name)
+            for key in stage.outputs:
+                if key in seen_outputs:
+                    raise PipelineError(f"'{key}' is produced by both {seen_outputs[key]} and {stage.name}")
+                seen_outputs[key] = stage.name
+
+    def run(self, initial=None, max_workers=4, on_event=None):
+        """Run every enabled stage as soon as its inputs exist.
+
+        ``on_event(kind, stage_name, payload)`` receives ``"status"`` events
+        (payload is the StageState) plus anything stages emit themselves.
+        Returns ``(data, states)``.
+        """
+        data = dict(initial or {})
+        states = {stage.name: StageState(stage.name) for stage in self.stages}
+        events = queue.Queue()
+        pending = {}
+        for stage in self.stages:
+            if stage.enabled:
+                pending[stage.name] = stage
+            else:
+                self._finish(states[stage.name], SKIPPED, events)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage") as pool:
+            while pending or running:
+                launched = self._launch_ready(pool, data, pending, running, states, events)
+                if not running and not launched and pending:
+                    for name in list(pending):
+                        self._finish(states[name], SKIPPED, events, "Inputs never became available")
+                        del pending[name]
+                if running:
+                    done, _ = wait(list(running), timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future, running.pop(future), data, states, events)
+                self._drain(events, on_event)
+        self._drain(events, on_event)
+        return data, states
+
+    def _launch_ready(self, pool, data, pending, running, states, events):
+        launched = False
+        reachable = set(data)
+        for stage in list(pending.values()) + list(running.values()):
+            reachable.update(stage.outputs)
+        for name, stage in list(pending.items()):
+            if any(key not in reachable for key in stage.inputs):
+                self._finish(states[name], SKIPPED, events, "Upstream stage did not produce its inputs")
+                del pending[name]
+                continue
+            if any(key not in data for key in stage.inputs):
+                continue
+            if any(key not in data and key in reachable for key in stage.optional):
+                continue
+            state = states[name]
+            state.status = RUNNING
+            state.started = time.perf_counter()
+            events.put(("status", name, state))
+            inputs = {key: data[key] for key in stage.inputs + stage.optional if key in data}
+            emit = self._emitter(events, name)
+            ctx = contextvars.copy_context()
+            running[pool.submit(ctx.run, self._run_stage, stage, inputs, emit)] = stage
+            del pending[name]
+            launched = True
+        return launched
+
+    @staticmethod
+    def _run_stage(stage, inputs, emit):
+        with span("stage." + stage.name):
+            return stage.fn(inputs, emit)
+
+    @staticmethod
+    def _emitter(events, stage_name):
+        def emit(kind, payload=None):
+            events.put((kind, stage_name, payload))
+        return emit
+
+    def _collect(self, future, stage, data, states, events):
+        state = states[stage.name]
+        try:
+            result = future.result() or {}
+            missing = [key for key in stage.outputs if key not in result]
+            if missing:
+                raise PipelineError(f"{stage.name} did not return {', '.join(missing)}")
+        except Exception as exc:
+            self._finish(state, FAILED, events, str(exc))
+            return
+        for key in stage.outputs:
+            data[key] = result[key]
+        self._finish(state, DONE, events)
+
+    @staticmethod
+    def _finish(state, status, events, error=None):
+        state.status = status
+        state.error = error
+        if state.started is not None:
+            state.elapsed = round(time.perf_counter() - state.started, 3)
+        events.put(("status", state.name, state))
+
+    @staticmethod
+    def _drain(events, on_event):
+        while True:
+            try:
+                kind, stage_name, payload = events.get_nowait()
+            except queue.Empty:
+                return
+            if on_event:
+                on_event(kind, stage_name, payload)
@@ -0,0 +1,191 @@
+"""Vector retrieval for the "Ask AI About Your Leads" Q&A.
+
+Pipeline output is cut into small chunks (one per lead / strategy / message
+field), embedded and put in a FAISS index, so a question only pays for the
+top-k chunks that match it instead of the whole run. Searches scoped to one
+owner or run pick that scope's vectors first and rank only those
+(``subset_vectors`` and ``nearest``), so other users' history cannot crowd
+them out.
+"""
+
+import functools
+import json
+
+from response_cache import make_key
+
+DEFAULT_EMBEDDING_MODEL = "models/gemini-embedding-001"
+EMBEDDING_TTL = 30 * 86400
+
+_LEAD_FIELDS = [
+    ("why_need", "Why they need us"),
+]
+_STRATEGY_FIELDS = [
+    ("our_value_prop", "Value proposition"),
+    ("pain_points", "Pain points"),
+    ("opening_hook", "Opening hook"),
+    ("objection_handling", "Objection handling"),
+    ("recommended_approach", "Recommended approach"),
+    ("linkedin_connection_note", "LinkedIn note"),
+]
+
+_MESSAGE_FIELDS = [
+    ("email_subject", "Email subject"),
+    ("whatsapp_message", "WhatsApp message"),
+    ("linkedin_note", "LinkedIn note"),
+    ("best_time_to_contact", "Best time to contact"),
+]
+_AUTO_REPLY_FIELDS = [
+    ("reply_scenario", "Reply scenario"),
+    ("simulated_client_reply", "Simulated client reply"),
+    ("next_action", "Next action"),
+    ("escalation_reason", "Escalation reason"),
+]
+
+
+def _splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=60)
+
+
+def _as_text(value):
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(v) for v in value)
+    return str(value or "").strip()
+
+
+def pipeline_chunks(leads_data, strategy_data, messages=(), auto_replies=(), base_metadata=None):
+    """Return ``(texts, metadatas)`` with one chunk per lead / strategy / message field."""
+    splitter = _splitter()
+    base = dict(base_metadata or {})
+    texts, metadatas = [], []
+
+    def add(text, company, kind, field):
+        for piece in splitter.split_text(text):
+            texts.append(piece)
+            metadatas.append(dict(base, company=company, kind=kind, field=field))
+
+    def add_fields(record, kind, fields):
+        company = record.get("company", "")
+        for field, label in fields:
+            value = _as_text(record.get(field))
+            if value:
+                add(f"{company} — {label}: {value}", company, kind, field)
+
+    for lead in leads_data:
+        company = lead.get("company", "")
+        add(
+            f"Lead {company}: contact {lead.get('first_name', '')} {lead.get('last_name', '')} "
+            f"({lead.get('decision_maker_role', '')}), phone {lead.get('phone', '')}, "
+            f"email {lead.get('email', '')}, address {lead.get('address', '')}, "
+            f"sector {lead.get('sector', '')}, deal size {lead.get('deal_size', '')}",
+            company, "lead", "profile",
+        )
+        add_fields(lead, "lead", _LEAD_FIELDS)
+
+    for strategy in strategy_data:
+        company = strategy.get("company", "")
+        add(
+            f"{company} — priority {strategy.get('priority', '')}, deal score {strategy.get('deal_score', '')}, "
+            f"estimated value {strategy.get('estimated_value', '')}, urgency {strategy.get('urgency_signal', '')}",
+            company, "strategy", "summary",
+        )
+        add_fields(strategy, "strategy", _STRATEGY_FIELDS)
+
+    for message in messages:
+        add_fields(message, "message", _MESSAGE_FIELDS)
+    for reply in auto_replies:
+        add_fields(reply, "auto_reply", _AUTO_REPLY_FIELDS)
+    return texts, metadatas
+
+
+def document_chunks(text, source, page, base_metadata=None):
+    """Return ``(texts, metadatas)`` for one page of an uploaded document."""
+    base = dict(base_metadata or {}, kind="document", source=source, page=page, field=f"page {page}")
+    texts = _splitter().split_text(text or "")
+    return texts, [dict(base) for _ in texts]
+
+
+@functools.lru_cache(maxsize=None)
+def _register_embeddings():
+    from langchain_core.embeddings import Embeddings
+    Embeddings.register(CachedEmbeddings)
+
+
+class CachedEmbeddings:
+    """Wraps an embedder so vectors for unchanged text come from the DiskCache.
+
+    Registered as a LangChain ``Embeddings`` when first constructed rather than
+    subclassing it, so importing this module does not pull in LangChain.
+    """
+
+    def __init__(self, inner, cache, model_name):
+        _register_embeddings()
+        self.inner = inner
+        self.cache = cache
+        self.model_name = model_name
+
+    def _embed(self, texts, kind, compute):
+        keys = [make_key("embed", self.model_name, kind, text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = []
+        for i, key in enumerate(keys):
+            hit = self.cache.get(key) if self.cache else None
+            if hit:
+                vectors[i] = json.loads(hit)
+            else:
+                missing.append(i)
+        if missing:
+            fresh = compute([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = list(vector)
+                if self.cache:
+                    self.cache.set(keys[i], json.dumps(vectors[i]), ttl=EMBEDDING_TTL)
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), "doc", self.inner.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda batch: [self.inner.embed_query(batch[0])])[0]
+
+
+def make_embeddings(api_key, cache=None, model_name=DEFAULT_EMBEDDING_MODEL):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    inner = GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=api_key)
+    return CachedEmbeddings(inner, cache, model_name)
+
+
+def build_index(texts, metadatas, embeddings):
+    """Build a FAISS index from chunks; returns None when there is nothing to index."""
+    if not texts:
+        return None
+    from langchain_community.vectorstores import FAISS
+    return FAISS.from_texts(texts, embeddings, metadatas=metadatas)
+
+
+def subset_vectors(index, positions):
+    """Copies of the stored vectors at ``positions`` of a FAISS index."""
+    import numpy as np
+    return index.index.reconstruct_batch(np.asarray(positions, dtype="int64"))
+
+
+def nearest(vectors, query, k, inner_product=False):
+    """Row numbers of the ``k`` ``vectors`` closest to ``query``, best first (exact search)."""
+    import numpy as np
+    query = np.asarray(query, dtype="float32")
+    if inner_product:
+        scores = -(vectors @ query)
+    else:
+        scores = ((vectors - query) ** 2).sum(axis=1)
+    k = min(k, len(scores))
+    top = np.argpartition(scores, k - 1)[:k]
+    return [int(i) for i in top[np.argsort(scores[top], kind="stable")]]
+
+
+def format_retrieved(docs):
+    lines = []
+    for doc in docs:
+        meta = doc.metadata or {}
+        label = " · ".join(str(v) for v in (meta.get("company") or meta.get("source"), meta.get("field")) if v)
+        lines.append(f"[{label}] {doc.page_content}" if label else doc.page_content)
+    return "\n".join(lines)
@@ -0,0 +1,368 @@
+"""Offline stand-in for the model providers: recorded or synthesised replies.
+
+ReplayProvider has the provider surface ModelRouter expects,
+``generate(prompt, on_text=None) -> (text, model_name)``, so the whole app
+(router, response cache, pipeline) runs without API keys. Each prompt is
+recognised by agent (``agents.classify_prompt``) and answered from a recording
+when there is one, otherwise with a deterministic synthetic reply shaped like
+that agent's real output, sized to however many leads the prompt asks for.
+
+Latency, server errors and rate limits are injected on demand. Whether a
+given attempt fails depends only on the seed, the prompt and the attempt
+number, so a run replays the same way however its threads interleave.
+
+RecordingProvider wraps a live provider and appends every reply to a JSONL
+file that ReplayProvider can load later.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from agents import classify_prompt
+from handoff import HANDOFF_ROW, parse_handoff_table
+from model_router import estimate_tokens
+
+AGENTS = ("scout", "strategist", "communicator", "autoresponder", "rag_insights", "rag_qa", "manual_reply")
+
+_FIRST_NAMES = ["Anil", "Deepa", "Farhan", "Kavya", "Manoj", "Nisha", "Prakash", "Rekha", "Suresh", "Vidya"]
+_LAST_NAMES = ["Patil", "Rao", "Shaikh", "Kulkarni", "Reddy", "Hegde", "Joshi", "Naik", "Menon", "Desai"]
+_SECTORS = ["FMCG", "Pharma", "Agri Processing", "E-commerce", "Cold Chain", "Textiles", "Auto Parts"]
+_PRIORITIES = ["HOT", "WARM", "COLD"]
+_SCENARIOS = ["interested", "price_inquiry", "objection", "not_now", "meeting_request"]
+
+
+def prompt_digest(prompt):
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def _pick(options, *salt):
+    digest = hashlib.sha1("|".join(str(s) for s in salt).encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+def _fraction(*salt):
+    """A stable pseudo-random number in [0, 1) for ``salt``."""
+    digest = hashlib.sha1("|".join(str(s) for s in salt).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def prompt_companies(prompt):
+    """Company names a prompt mentions, in order: hand-off tables, pipe-table rows or JSON ``company`` fields."""
+    names = re.findall(r'"company":\s*"([^"]+)"', prompt)
+    names += [row.get("company", "") for row in parse_handoff_table(prompt)]
+    for line in prompt.splitlines():
+        if line.count("|") >= 7 and not line.startswith("Company Name") and not HANDOFF_ROW.match(line):
+            names.append(line.split("|")[0].strip())
+    lead = re.search(r"^LEAD: (.+?) - ", prompt, re.M)
+    if lead:
+        names.append(lead.group(1))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def prompt_ids(prompt):
+    """``{company: lead ID}`` for the hand-off table rows in a prompt."""
+    return {row.get("company", ""): row["id"] for row in parse_handoff_table(prompt)}
+
+
+# ---------------------------------------------
+# SYNTHETIC REPLIES
+# ---------------------------------------------
+def synth_scout(prompt):
+    count_match = re.search(r"Find (\d+)", prompt)
+    region_match = re.search(r" businesses in (.+?)\.\n", prompt)
+    count = int(count_match.group(1)) if count_match else 5
+    region = region_match.group(1) if region_match else "Gulbarga"
+    rows = []
+    for i in range(1, count + 1):
+        first, last = _FIRST_NAMES[i % len(_FIRST_NAMES)], _LAST_NAMES[(i * 3) % len(_LAST_NAMES)]
+        rows.append(" | ".join([
+            f"Replay Traders {i:02d} Pvt Ltd", f"Plot {i * 7}, Industrial Area, {region}", first, last,
+            f"+91 98{i:08d}", "Head of Operations", "Needs overflow storage near the highway",
+            _SECTORS[i % len(_SECTORS)], f"INR {10 + i * 3} L/yr", "SEARCH",
+        ]))
+    return "\n".join(rows)
+
+
+def synth_strategist(prompt):
+    items = []
+    ids = prompt_ids(prompt)
+    for i, company in enumerate(prompt_companies(prompt)):
+        items.append({
+            "id": ids.get(company, ""), "company": company, "first_name": _FIRST_NAMES[i % len(_FIRST_NAMES)],
+            "last_name": _LAST_NAMES[i % len(_LAST_NAMES)], "person_linkedin": "SEARCH",
+            "deal_score": 40 + int(_fraction(company, "score") * 60), "priority": _pick(_PRIORITIES, company),
+            "our_value_prop": f"Secure, dock-ready space close to {company}'s distribution routes.",
+            "pain_points": ["Seasonal storage overflow", "Rising rental costs", "Slow last-mile dispatch"],
+            "opening_hook": "Noticed your recent expansion in the region.",
+            "linkedin_connection_note": "Would love to connect about warehousing in the region.",
+            "objection_handling": "Flexible lease terms remove the long commitment.",
+            "estimated_value": "INR 18 L/yr", "urgency_signal": "Peak season in 8 weeks",
+            "recommended_approach": "Site visit followed by a tailored quote.",
+        })
+    return json.dumps(items)
+
+
+def synth_communicator(prompt):
+    items = []
+    ids = prompt_ids(prompt)
+    for i, company in enumerate(prompt_companies(prompt)):
+        first = _FIRST_NAMES[i % len(_FIRST_NAMES)]
+        items.append({
+            "id": ids.get(company, ""), "company": company, "first_name": first,
+            "last_name": _LAST_NAMES[i % len(_LAST_NAMES)], "phone": f"+91 98{i + 1:08d}", "email": "", "person_linkedin": "SEARCH",
+            "whatsapp_message": f"Hi {first}, we have ready warehouse space that could suit {company}. "
+                                "Could we set up a quick call this week?",
+            "email_subject": f"Warehouse space for {company}",
+            "email_body": f"Dear {first},\n\nWe run a secure 21,000 sq ft warehouse with loading docks and "
+                          "power backup. I would be glad to share a quote.\n\nRegards",
+            "linkedin_note": "Would love to connect about storage capacity in the region.",
+            "best_time_to_contact": "Tuesday 11am", "follow_up_day": "Day 3",
+        })
+    return json.dumps(items)
+
+
+def synth_autoresponder(prompt):
+    companies = prompt_companies(prompt)
+    company = companies[0] if companies else "the client"
+    scenario = _pick(_SCENARIOS, company)
+    return json.dumps({
+        "simulated_client_reply": f"Thanks for reaching out. Please share pricing for {company}.",
+        "reply_scenario": scenario,
+        "auto_response_whatsapp": "Happy to help. Sharing our rate card and available slots now.",
+        "auto_response_email": "Please find our rate card attached. Could we schedule a site visit?",
+        "next_action": "Send rate card and propose a visit", "escalate_to_human": scenario == "objection",
+        "escalation_reason": "Pricing objection" if scenario == "objection" else "",
+    })
+
+
+def synth_rag_insights(prompt):
+    companies = prompt_companies(prompt)[:3] or ["the top leads"]
+    return (
+        "1. TOP TARGETS\n" + "\n".join(f"- {name}: strong storage need and budget" for name in companies) + "\n\n"
+        "2. MARKET OPPORTUNITY\nRegional demand for dock-ready space is growing steadily.\n\n"
+        "3. COMMON PAIN POINTS\n- Seasonal overflow\n- Rising rents\n\n"
+        "4. OUTREACH STRATEGY\nLead with site visits and flexible terms.\n\n"
+        "5. RISKS\n- Long procurement cycles\n\n"
+        "6. REVENUE FORECAST\n20% conversion of the pipeline.\n\n"
+        "7. FOLLOW-UP\nDay 1 call, Day 3 email, Day 7 visit, Day 14 proposal."
+    )
+
+
+def synth_rag_qa(prompt):
+    companies = prompt_companies(prompt)
+    return "- Based on the knowledge base, " + (companies[0] if companies else "the top lead") + " is the best fit."
+
+
+def synth_manual_reply(prompt):
+    return json.dumps({
+        "whatsapp_reply": "Thanks! Sharing our pricing and available slots now.",
+        "email_reply": "Please find our rate card attached. Would a site visit this week suit you?",
+        "next_step": "Schedule a site visit",
+    })
+
+
+SYNTHESISERS = {
+    "scout": synth_scout,
+    "strategist": synth_strategist,
+    "communicator": synth_communicator,
+    "autoresponder": synth_autoresponder,
+    "rag_insights": synth_rag_insights,
+    "rag_qa": synth_rag_qa,
+    "manual_reply": synth_manual_reply,
+}
+
+
+# ---------------------------------------------
+# RECORDINGS
+# ---------------------------------------------
+class Recordings:
+    """Recorded replies: an exact prompt match first, else the agent's replies in turn.
+
+    Loads the JSONL written by RecordingProvider (``{"agent", "prompt_sha1",
+    "text"}`` per line) or a JSON object mapping agent names to lists of replies.
+    """
+
+    def __init__(self, by_prompt=None, by_agent=None):
+        self.by_prompt = dict(by_prompt or {})
+        self.by_agent = {agent: list(texts) for agent, texts in (by_agent or {}).items()}
+        self._turns = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as handle:
+            content = handle.read()
+        if path.endswith(".jsonl"):
+            by_prompt, by_agent = {}, defaultdict(list)
+            for line in content.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    by_prompt[record["prompt_sha1"]] = record["text"]
+                    by_agent[record.get("agent") or "unknown"].append(record["text"])
+            return cls(by_prompt, by_agent)
+        return cls(by_agent=json.loads(content))
+
+    def reply(self, agent, prompt):
+        text = self.by_prompt.get(prompt_digest(prompt))
+        if text is not None:
+            return text
+        texts = self.by_agent.get(agent)
+        if not texts:
+            return None
+        with self._lock:
+            turn = self._turns[agent]
+            self._turns[agent] += 1
+        return texts[turn % len(texts)]
+
+
+# ---------------------------------------------
+# PROVIDERS
+# ---------------------------------------------
+class ReplayRateLimited(Exception):
+    code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"429 replay rate limit: retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class ReplayServerError(Exception):
+    code = 503
+
+
+class ReplayProvider:
+    """Answers every prompt locally; see the module docstring.
+
+    ``latency`` is seconds per call, or a dict of seconds per agent (key
+    ``"default"`` for the rest); ``jitter`` adds up to that fraction on top.
+    ``tokens_per_second`` adds generation time for the reply's estimated
+    tokens, so bigger replies take longer as they do live.
+    ``error_rate`` and ``rate_limit_rate`` are per-attempt probabilities; a
+    rate-limited attempt fails at once and asks for ``retry_after`` seconds.
+    ``malformed_rate`` is the share of replies wrapped in markdown or chatter,
+    or cut short, the way models sometimes break their JSON.
+    """
+
+    def __init__(self, name="replay", recordings=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, seed=0, chunk_size=40, concurrency=8, model="replay-model",
+                 tokens_per_second=0.0, malformed_rate=0.0):
+        self.name = name
+        self.model = model
+        self.models = [model]
+        self.recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.tokens_per_second = tokens_per_second
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.chunk_size = max(1, int(chunk_size))
+        self.concurrency = max(1, int(concurrency))
+        self._attempts = Counter()
+        self._lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = Counter()
+            self.prompt_chars = Counter()
+            self.reply_chars = Counter()
+            self.injected = Counter()
+
+    def _latency_for(self, agent, attempt_salt, text):
+        base = self.latency.get(agent, self.latency.get("default", 0.0)) if isinstance(self.latency, dict) \
+            else self.latency
+        if self.tokens_per_second:
+            base += estimate_tokens(text) / self.tokens_per_second
+        return base * (1 + self.jitter * _fraction(attempt_salt, "jitter"))
+
+    def _malform(self, text, salt):
+        if not text or _fraction(*salt, "malformed") >= self.malformed_rate:
+            return text
+        with self._lock:
+            self.injected["malformed"] += 1
+        return _pick([
+            lambda: "```json\n" + text + "\n```",
+            lambda: "Sure, here is the JSON you asked for:\n" + text + "\nLet me know if you need changes.",
+            lambda: text[:max(1, len(text) * 3 // 5)],
+        ], *salt, "malformed-kind")()
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        agent = classify_prompt(prompt) or "unknown"
+        digest = prompt_digest(prompt)
+        with self._lock:
+            attempt = self._attempts[digest]
+            self._attempts[digest] += 1
+            self.calls[agent] += 1
+            self.prompt_chars[agent] += len(prompt)
+        salt = (self.seed, self.name, digest, attempt)
+        if _fraction(*salt, "rate_limit") < self.rate_limit_rate:
+            with self._lock:
+                self.injected["rate_limit"] += 1
+            raise ReplayRateLimited(self.retry_after)
+        text = self.recordings.reply(agent, prompt) if self.recordings else None
+        if text is None:
+            text = SYNTHESISERS.get(agent, lambda _prompt: "")(prompt)
+        delay = self._latency_for(agent, salt, text)
+        if delay:
+            time.sleep(delay)
+        if _fraction(*salt, "error") < self.error_rate:
+            with self._lock:
+                self.injected["error"] += 1
+            raise ReplayServerError(f"503 replay server error ({agent})")
+        text = self._malform(text, salt)
+        with self._lock:
+            self.reply_chars[agent] += len(text)
+        if on_text:
+            for start in range(0, len(text), self.chunk_size):
+                on_text(text[start:start + self.chunk_size])
+        return text, self.model
+
+
+class RecordingProvider:
+    """Passes calls to ``inner`` and appends each reply to a JSONL file for later replay."""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __getattr__(self, attr):
+        return getattr(self.inner, attr)
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        text, model_name = self.inner.generate(prompt, on_text=on_text, json_mode=json_mode)
+        record = {"agent": classify_prompt(prompt), "prompt_sha1": prompt_digest(prompt), "provider": self.inner.name,
+                  "model": model_name, "text": text}
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+        return text, model_name
+
+
+class HashEmbeddings:
+    """Deterministic offline embeddings, so the knowledge base works without a key."""
+
+    def __init__(self, size=64):
+        self.size = size
+
+    def _vector(self, text):
+        digest = b""
+        counter = 0
+        while len(digest) < self.size:
+            digest += hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            counter += 1
+        return [byte / 255.0 for byte in digest[:self.size]]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
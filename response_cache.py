@@ -0,0 +1,141 @@
+"""Content-addressed response cache on local SQLite.
+
+Entries are keyed by a SHA-256 of their parts (e.g. provider, model name and
+normalised prompt), expire after a TTL and are evicted least-recently-used once
+the entry or byte budget is exceeded. The database runs in WAL mode, so every
+session and every Streamlit process on the host shares one cache file.
+"""
+
+import contextvars
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Per-session bypass switch; worker pools copy the caller's context.
+cache_enabled = contextvars.ContextVar("cache_enabled", default=True)
+
+CachedResponse = namedtuple("CachedResponse", ["text"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters(name, value) VALUES ('hits', 0), ('misses', 0);
+"""
+
+
+def normalize_prompt(prompt):
+    """Collapse insignificant whitespace so cosmetic edits still hit."""
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in str(prompt or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, path, ttl=86400.0, max_entries=5000, max_bytes=64 * 1024 * 1024, evict_every=50):
+        self.path = path
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.evict_every = max(1, int(evict_every))
+        self._local = threading.local()
+        self._writes = 0
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_first(self, keys, accept=None):
+        """Return ``(key, value)`` for the first live key in ``keys``, or None.
+
+        With ``accept(value)``, values it rejects are skipped, and only an
+        accepted value counts as a hit.
+        """
+        keys = list(keys)
+        if not keys:
+            return None
+        now = time.time()
+        conn = self._conn()
+        marks = ",".join("?" * len(keys))
+        rows = dict(conn.execute(
+            f"SELECT key, value FROM entries WHERE key IN ({marks}) AND expires_at > ?", (*keys, now)
+        ).fetchall())
+        for key in keys:
+            if key in rows and (accept is None or accept(rows[key])):
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+                return key, rows[key]
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+        return None
+
+    def get(self, key):
+        hit = self.get_first([key])
+        return hit[1] if hit else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        value = str(value)
+        expires = now + (self.ttl if ttl is None else float(ttl))
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries(key, value, size, created_at, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, expires, now),
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then least-recently-used rows over either budget."""
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS running FROM entries) "
+            "WHERE running > ?)",
+            (self.max_bytes,),
+        )
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("UPDATE counters SET value = 0")
+
+    def stats(self):
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0),
+                "entries": entries, "bytes": size}
@@ -0,0 +1,198 @@
+"""Process-wide settings and shared services for the Streamlit app.
+
+Streamlit re-executes ``app.py`` on every rerun, and each ``st.cache_resource``
+decorator written there re-hashes its function's source to find its cache.
+Defined here, the decorators and the secrets lookups run once per process, and
+every rerun is a plain cache hit.
+"""
+
+import os
+
+import streamlit as st
+
+from document_ingest import DocumentIngestor
+from hunter_client import HunterClient
+from knowledge_base import KnowledgeBase
+from llm_gateway import GeminiGateway
+from mail_queue import OutboundQueue, SMTPConnection
+from model_router import (
+    DEFAULT_CLAUDE_MODEL, DEFAULT_OPENAI_MODEL, AnthropicProvider, GeminiProvider, ModelRouter, OpenAIProvider,
+)
+from rag_index import DEFAULT_EMBEDDING_MODEL, CachedEmbeddings, make_embeddings
+from replay_llm import HashEmbeddings, RecordingProvider, ReplayProvider, Recordings
+from response_cache import DiskCache
+from telemetry import log_spans_to, serve_metrics
+
+MODEL_PRIORITY = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash-lite",
+    "gemini-2.5-flash"
+]
+
+
+def get_streamlit_secret(key, default=""):
+    try:
+        return st.secrets.get(key, default)
+    except Exception:
+        return default
+
+
+@st.cache_resource(show_spinner=False)
+def load_settings():
+    """Secrets the app reads on every rerun, resolved once per process."""
+    all_keys = [
+        get_streamlit_secret("GOOGLE_API_KEY", ""),
+        get_streamlit_secret("GOOGLE_API_KEY2", ""),
+        get_streamlit_secret("GOOGLE_API_KEY3", ""),
+    ]
+    return {
+        "gemini_keys": tuple(k for k in all_keys if k and k.strip()),
+        "hunter_key": get_streamlit_secret("HUNTER_API_KEY", ""),
+        "anthropic_key": get_streamlit_secret("ANTHROPIC_API_KEY", "").strip(),
+        "openai_key": get_streamlit_secret("OPENAI_API_KEY", "").strip(),
+        "data_dir": get_streamlit_secret("SAMKETAN_DATA_DIR", ".samketan_data"),
+        "llm_backend": str(get_streamlit_secret("LLM_BACKEND", "live") or "live").lower(),
+    }
+
+
+def data_dir():
+    return load_settings()["data_dir"]
+
+
+def replay_mode():
+    return load_settings()["llm_backend"] == "replay"
+
+
+@st.cache_resource(show_spinner=False)
+def init_telemetry():
+    """Attach the telemetry exporters configured in secrets, once per process.
+
+    ``TELEMETRY_JSONL`` appends every finished span to that file;
+    ``TELEMETRY_PORT`` serves Prometheus metrics on
+    ``http://TELEMETRY_HOST:TELEMETRY_PORT/metrics`` (host 127.0.0.1 unless set).
+    """
+    path = get_streamlit_secret("TELEMETRY_JSONL", "")
+    if path:
+        log_spans_to(path)
+    port = int(get_streamlit_secret("TELEMETRY_PORT", 0) or 0)
+    if port:
+        try:
+            serve_metrics(port, get_streamlit_secret("TELEMETRY_HOST", "127.0.0.1") or "127.0.0.1")
+        except OSError:
+            pass  # port already taken, e.g. by another Streamlit process on this host
+    return True
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_gateway(api_keys):
+    """One gateway per process, so every session shares the same key pool."""
+    return GeminiGateway(
+        api_keys,
+        MODEL_PRIORITY,
+        rpm=int(get_streamlit_secret("GEMINI_RPM", 15) or 15),
+        per_key_concurrency=int(get_streamlit_secret("GEMINI_PER_KEY_CONCURRENCY", 2) or 2),
+    )
+
+
+def _secret_table(key):
+    try:
+        return {name: value for name, value in (get_streamlit_secret(key, {}) or {}).items()}
+    except AttributeError:
+        return {}
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_router(gemini_keys):
+    """Every configured provider behind one router, shared by all sessions.
+
+    Secrets: ``ANTHROPIC_API_KEY`` / ``CLAUDE_MODEL``, ``OPENAI_API_KEY`` /
+    ``OPENAI_MODEL``, ``ROUTING_STRATEGY`` (latency, cost or ordered), a
+    ``[MODEL_ROUTES]`` table mapping agent names (scout, strategist,
+    communicator, autoresponder, rag_insights, rag_qa, manual_reply or default)
+    to provider lists such as ``["claude", "gemini"]``, and a ``[MODEL_PRICES]``
+    table of per-model USD per million ``[input, output]`` tokens.
+
+    ``LLM_BACKEND = "replay"`` swaps every provider for the offline
+    ReplayProvider (``REPLAY_RECORDINGS``, ``REPLAY_LATENCY``,
+    ``REPLAY_JITTER``, ``REPLAY_ERROR_RATE``, ``REPLAY_RATE_LIMIT_RATE``), for
+    load tests without keys. ``LLM_RECORD_PATH`` appends every live reply to a
+    JSONL file that replay can load.
+    """
+    settings = load_settings()
+    if replay_mode():
+        recordings = get_streamlit_secret("REPLAY_RECORDINGS", "")
+        return ModelRouter([ReplayProvider(
+            recordings=Recordings.load(recordings) if recordings else None,
+            latency=float(get_streamlit_secret("REPLAY_LATENCY", 0.5) or 0),
+            jitter=float(get_streamlit_secret("REPLAY_JITTER", 0.5) or 0),
+            error_rate=float(get_streamlit_secret("REPLAY_ERROR_RATE", 0) or 0),
+            rate_limit_rate=float(get_streamlit_secret("REPLAY_RATE_LIMIT_RATE", 0) or 0),
+        )])
+    providers = []
+    if gemini_keys:
+        providers.append(GeminiProvider(get_gemini_gateway(gemini_keys)))
+    if settings["anthropic_key"]:
+        providers.append(AnthropicProvider(
+            settings["anthropic_key"], get_streamlit_secret("CLAUDE_MODEL", DEFAULT_CLAUDE_MODEL),
+            rpm=int(get_streamlit_secret("CLAUDE_RPM", 50) or 50)))
+    if settings["openai_key"]:
+        providers.append(OpenAIProvider(
+            settings["openai_key"], get_streamlit_secret("OPENAI_MODEL", DEFAULT_OPENAI_MODEL),
+            rpm=int(get_streamlit_secret("OPENAI_RPM", 60) or 60)))
+    record_path = get_streamlit_secret("LLM_RECORD_PATH", "")
+    if record_path:
+        providers = [RecordingProvider(provider, record_path) for provider in providers]
+    prices = {model: tuple(float(p) for p in price) for model, price in _secret_table("MODEL_PRICES").items()}
+    return ModelRouter(providers, _secret_table("MODEL_ROUTES"),
+                       strategy=get_streamlit_secret("ROUTING_STRATEGY", "latency") or "latency", prices=prices)
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    return DiskCache(
+        os.path.join(data_dir(), "response_cache.sqlite3"),
+        ttl=float(get_streamlit_secret("CACHE_TTL_HOURS", 24) or 24) * 3600,
+        max_entries=int(get_streamlit_secret("CACHE_MAX_ENTRIES", 5000) or 5000),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_hunter_client(api_key):
+    """One pooled session and one rate limit per process; lookups cached on disk."""
+    cache = DiskCache(
+        os.path.join(data_dir(), "hunter_cache.sqlite3"),
+        ttl=float(get_streamlit_secret("HUNTER_CACHE_DAYS", 30) or 30) * 86400,
+    )
+    return HunterClient(api_key, cache)
+
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings(api_key):
+    if replay_mode():
+        return CachedEmbeddings(HashEmbeddings(), None, "replay-hash")
+    return make_embeddings(
+        api_key, get_response_cache(), get_streamlit_secret("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL))
+
+
+@st.cache_resource(show_spinner=False)
+def get_knowledge_base(api_key):
+    kb = KnowledgeBase(data_dir(), get_embeddings(api_key))
+    try:
+        kb.sync_index()
+    except Exception:
+        pass  # retried on the next process start
+    return kb
+
+
+@st.cache_resource(show_spinner=False)
+def get_document_ingestor(api_key):
+    ingestor = DocumentIngestor(get_knowledge_base(api_key), os.path.join(data_dir(), "uploads"))
+    ingestor.resume_pending()
+    return ingestor
+
+
+@st.cache_resource(show_spinner=False)
+def get_outbound_queue(sender_email, sender_password):
+    """One logged-in SMTP session and one sender thread per process."""
+    connection = SMTPConnection("smtp.hostinger.com", 465, sender_email, sender_password)
+    return OutboundQueue([connection], rate_per_minute=int(get_streamlit_secret("EMAIL_RATE_PER_MINUTE", 30) or 30))
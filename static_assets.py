@@ -0,0 +1,35 @@
+"""Stylesheets and images the pages embed, read from disk once per process.
+
+Streamlit re-runs the page script on every interaction; these loaders are
+memoised at module level, so a rerun re-sends the prepared markup without
+touching the filesystem or re-encoding anything.
+"""
+
+import base64
+import functools
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+STATIC_DIR = ROOT / "static"
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};])\s*", r"\1", css).strip()
+
+
+@functools.lru_cache(maxsize=None)
+def style_tag(name):
+    """``<style>`` block for ``static/<name>``, minified — it is re-sent on every rerun."""
+    return "<style>" + minify_css((STATIC_DIR / name).read_text(encoding="utf-8")) + "</style>"
+
+
+@functools.lru_cache(maxsize=None)
+def file_base64(name):
+    """Base64 of a file next to the app, or None when it is missing."""
+    path = ROOT / name
+    if not path.exists():
+        return None
+    return base64.b64encode(path.read_bytes()).decode()
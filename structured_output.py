@@ -0,0 +1,158 @@
+"""Declared output schemas for the JSON agents, tolerant parsing and targeted re-asks.
+
+Each JSON agent has a ``Schema``: whether it answers with an array of objects
+or one object, the fields that must be filled in, and light coercions for the
+ways models drift (a score as ``"85"``, a bare string where a list belongs,
+``"hot"`` for ``HOT``). ``parse_structured`` recovers every complete object
+from a reply, even one that is cut short or wrapped in prose, and sorts them
+into valid items and problems; ``repair_note`` turns the problems into a short
+instruction for re-asking about just the items that were lost. ModelClient
+uses ``json_mode`` to switch on a provider's native JSON output.
+"""
+
+import re
+
+from json_stream import JSONObjectStream
+
+ARRAY = "array"
+OBJECT = "object"
+
+
+class Schema:
+    """One agent's reply: an ``ARRAY`` of objects or a single ``OBJECT``.
+
+    ``required`` fields must be present and non-empty; they are the ones the
+    pipeline and the cards cannot do without, the rest degrade to blanks.
+    ``types`` coerces a field to ``int``, ``list``, ``bool`` or ``str`` where
+    the value allows it, ``bounds`` clamps an ``int`` field and ``choices``
+    limits a field to fixed upper-case values.
+    """
+
+    def __init__(self, kind, required, types=None, choices=None, bounds=None):
+        self.kind = kind
+        self.required = tuple(required)
+        self.types = dict(types or {})
+        self.choices = dict(choices or {})
+        self.bounds = dict(bounds or {})
+
+    def check(self, item):
+        """``(item, problems)``: a coerced copy of ``item`` and what is still wrong with it."""
+        item = dict(item)
+        problems = []
+        for name, kind in self.types.items():
+            if name in item:
+                value = _coerce(item[name], kind)
+                if value is None:
+                    problems.append(f"{name} is not a {kind.__name__}")
+                else:
+                    item[name] = value
+        for name, (low, high) in self.bounds.items():
+            if isinstance(item.get(name), int):
+                item[name] = min(high, max(low, item[name]))
+        for name, allowed in self.choices.items():
+            if name in item:
+                value = str(item[name]).strip().upper()
+                if value in allowed:
+                    item[name] = value
+                else:
+                    problems.append(f"{name} must be one of {'/'.join(allowed)}")
+        problems += [f"missing {name}" for name in self.required if item.get(name) in (None, "", [], {})]
+        return item, problems
+
+
+def _coerce(value, kind):
+    if isinstance(value, kind) and not (kind is int and isinstance(value, bool)):
+        return value
+    if kind is int:
+        if isinstance(value, float):
+            return int(round(value))
+        match = re.match(r"\s*(\d+)", str(value))
+        return int(match.group(1)) if match else None
+    if kind is list:
+        return [value] if isinstance(value, str) and value.strip() else None
+    if kind is bool:
+        text = str(value).strip().lower()
+        return True if text in ("true", "yes", "1") else False if text in ("false", "no", "0", "") else None
+    if kind is str:
+        return None if isinstance(value, (dict, list)) else str(value)
+    return None
+
+
+SCHEMAS = {
+    "strategist": Schema(
+        ARRAY,
+        required=["company", "priority", "deal_score"],
+        types={"deal_score": int, "pain_points": list, "company": str},
+        choices={"priority": ("HOT", "WARM", "COLD")},
+        bounds={"deal_score": (1, 100)},
+    ),
+    "communicator": Schema(
+        ARRAY,
+        required=["company", "whatsapp_message", "email_subject", "email_body"],
+        types={"company": str, "whatsapp_message": str, "email_body": str},
+    ),
+    "autoresponder": Schema(
+        OBJECT,
+        required=["simulated_client_reply", "auto_response_whatsapp"],
+        types={"escalate_to_human": bool},
+    ),
+    "manual_reply": Schema(OBJECT, required=["whatsapp_reply", "email_reply"]),
+}
+
+
+def json_mode(agent):
+    """``"array"``, ``"object"`` or None: the JSON shape ``agent`` must answer with."""
+    schema = SCHEMAS.get(agent)
+    return schema.kind if schema else None
+
+
+def parse_items(text):
+    """``(objects, complete)``: every readable object in ``text`` and whether nothing was lost.
+
+    Objects are returned even when the array is cut short or one element is
+    broken; ``complete`` is False then, so callers know items may be missing.
+    """
+    parser = JSONObjectStream()
+    items = parser.feed(text)
+    return items, parser.finished and not parser.rejected
+
+
+def parse_structured(agent, text):
+    """``(valid, problems)``: the objects in ``text`` that match ``agent``'s schema, and what was wrong."""
+    schema = SCHEMAS[agent]
+    items, complete = parse_items(text)
+    valid, problems = [], []
+    for item in items:
+        checked, wrong = schema.check(item)
+        if wrong:
+            problems.append(f"{checked.get('company') or 'an item'}: {', '.join(wrong)}")
+        else:
+            valid.append(checked)
+    if not complete:
+        problems.append("the reply was cut short or was not valid JSON")
+    return valid, problems
+
+
+def parse_object(agent, text):
+    """``(object or None, problems)`` for an agent that answers with a single JSON object."""
+    valid, problems = parse_structured(agent, text)
+    return (valid[0] if valid else None), problems
+
+
+def repair_note(agent, problems):
+    """The line added to a re-ask: what went wrong last time and what every object needs."""
+    schema = SCHEMAS[agent]
+    shown = "; ".join(problems[:4]) or "no usable JSON"
+    return ("Your previous reply could not be used (" + shown + "). "
+            "Every object must have non-empty: " + ", ".join(schema.required) + ".")
+
+
+def request_object(agent, call):
+    """``call(note) -> reply text``, parsed against ``agent``'s schema and re-asked once with a note if unusable.
+
+    Returns the object, or ``{}`` when both attempts fail.
+    """
+    obj, problems = parse_object(agent, call(""))
+    if obj is None:
+        obj, _ = parse_object(agent, call(repair_note(agent, problems)))
+    return obj or {}
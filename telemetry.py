@@ -0,0 +1,294 @@
+"""Spans, counters and histograms for every external call and pipeline stage.
+
+``with span("hunter.email-finder"):`` times a block, records it in the
+``samketan_span_seconds`` histogram (labelled by span name and ok/error) and
+keeps a rolling window of recent latencies for p50/p95. Spans carry the
+current trace ID, which ``trace()`` sets per pipeline run; worker threads
+started with ``contextvars.copy_context`` (the pipeline, ``fan_out``) inherit
+it.
+
+Everything is in memory until exported: ``serve_metrics(port)`` serves the
+Prometheus text format on ``/metrics``, and ``log_spans_to(path)`` appends
+each finished span to a JSONL file. Only the standard library is used, so
+instrumented modules stay cheap to import.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+PREFIX = "samketan_"
+SPAN_METRIC = "span_seconds"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8)
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+def current_trace():
+    return _trace_id.get()
+
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """Give every span inside the block (and threads it starts) one trace ID."""
+    token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+class LatencyWindow:
+    """The last ``size`` call latencies, with nearest-rank percentiles."""
+
+    def __init__(self, size=100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def samples(self):
+        with self._lock:
+            return list(self._samples)
+
+    def percentile(self, q):
+        return percentile(self.samples(), q)
+
+    def __len__(self):
+        return len(self._samples)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values``, or None when there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _series(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Process-wide counters and histograms, plus the sinks finished spans go to."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._counters = {}
+        self._histograms = {}
+        self._windows = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._windows[key] = LatencyWindow(self.window)
+            histogram.observe(value)
+        self._windows[key].add(value)
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def record_span(self, event):
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(event)
+            except Exception:
+                pass  # telemetry must never break the call it measures
+
+    def counter_totals(self, name):
+        """``{labels: value}`` for every series of counter ``name``."""
+        with self._lock:
+            return {labels: value for (series, labels), value in self._counters.items() if series == name}
+
+    def summary(self, name, by):
+        """Count, error count and rolling p50/p95 of histogram ``name``, grouped by label ``by``."""
+        with self._lock:
+            series = [(dict(key[1]), histogram, self._windows[key])
+                      for key, histogram in self._histograms.items() if key[0] == name]
+        groups = {}
+        for labels, histogram, window in series:
+            group = groups.setdefault(labels.get(by, ""), {"count": 0, "errors": 0, "samples": []})
+            group["count"] += histogram.count
+            if labels.get("status") == "error":
+                group["errors"] += histogram.count
+            group["samples"].extend(window.samples())
+        return {
+            key: {"count": group["count"], "errors": group["errors"],
+                  "p50": percentile(group["samples"], 0.5), "p95": percentile(group["samples"], 0.95)}
+            for key, group in sorted(groups.items())
+        }
+
+    def prometheus_text(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                                for key, histogram in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_label_text(labels)} {_number(value)}")
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {_number(float(total))}")
+            lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    REGISTRY.observe(name, value, buckets, **labels)
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time the block as span ``name`` of the current trace.
+
+    Yields a dict of attributes the block may add to; they go to the JSONL
+    log, not to metric labels. An exception marks the span as an error and
+    propagates unchanged; so does the block setting ``fields["error"]``, for
+    failures reported without one (an HTTP 429 that is retried).
+    """
+    fields = dict(attrs)
+    started_at = time.time()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException as exc:
+        status = "error"
+        fields.setdefault("error", f"{type(exc).__name__}: {exc}"[:300])
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if fields.get("error"):
+            status = "error"
+        REGISTRY.observe(SPAN_METRIC, seconds, span=name, status=status)
+        REGISTRY.record_span({
+            "ts": round(started_at, 3), "trace_id": current_trace(), "span": name, "status": status,
+            "seconds": round(seconds, 4), "thread": threading.current_thread().name, **fields,
+        })
+
+
+# ---------------------------------------------
+# EXPORT
+# ---------------------------------------------
+class JsonlSink:
+    """Appends each finished span to ``path`` as one JSON line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line)
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def log_spans_to(path):
+    """Start appending spans to a JSONL file; calling again with the same path is a no-op."""
+    with _exporters_lock:
+        key = ("jsonl", os.path.abspath(path))
+        if key not in _exporters:
+            _exporters[key] = JsonlSink(path)
+            REGISTRY.add_sink(_exporters[key])
+        return _exporters[key]
+
+
+def serve_metrics(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve ``/metrics`` in Prometheus text format from a daemon thread; idempotent per port."""
+    with _exporters_lock:
+        key = ("http", host, int(port))
+        if key in _exporters:
+            return _exporters[key]
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        _exporters[key] = server
+        return server
@@ -0,0 +1,110 @@
+"""HunterClient against a fake session: retries, bad replies, and Scout output through enrichment."""
+
+import pytest
+
+from agents import parse_leads_table
+from handoff import lead_id
+from hunter_client import HunterClient, HunterError, has_real_email
+
+SCOUT_TABLE = """| Company | Address | First | Last | Phone | Role | Why | Sector | Deal | LinkedIn |
+|---|---|---|---|---|---|---|---|---|---|
+| Acme Cold Chain | Peenya, Bengaluru | Asha | Rao | +91 9800000001 | Head of Logistics | Seasonal stock | FMCG | ₹12L | SEARCH |
+| Brightline Pharma | Hosur Road | Vikram | Shah | +91 9800000002 | COO | Expanding | Pharma | ₹30L | SEARCH |
+"""
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        if isinstance(self.payload, str):
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return self.payload
+
+
+class FakeSession:
+    """Answers every email-finder request with ``first@domain`` and records the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params, timeout):
+        self.calls.append(params)
+        return FakeResponse({"data": {"email": f"{params['first_name']}@{params['domain']}", "score": 91}})
+
+
+class ScriptedSession:
+    """Replies with ``responses`` in turn."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params, timeout):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def client(session):
+    return HunterClient("test-key", session=session, rate_per_minute=6000, burst=100)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("hunter_client.time.sleep", lambda seconds: None)
+
+
+def test_server_errors_are_retried():
+    session = ScriptedSession(FakeResponse("<html>Bad gateway</html>", 502), FakeResponse({}, 503),
+                              FakeResponse({"data": {"email": "asha@acme.com"}}))
+    assert client(session).email_finder("acme.com", "Asha", "Rao") == {"email": "asha@acme.com"}
+    assert session.calls == 3
+
+
+def test_persistent_server_error_gives_up_with_a_hunter_error():
+    session = ScriptedSession(*[FakeResponse("<html>Unavailable</html>", 503)] * 4)
+    with pytest.raises(HunterError, match="server error"):
+        client(session).email_finder("acme.com", "Asha", "Rao")
+    assert session.calls == 4
+
+
+def test_non_json_reply_is_a_hunter_error():
+    with pytest.raises(HunterError, match="not JSON"):
+        client(ScriptedSession(FakeResponse("<html>Login</html>", 200))).domain_search("acme.com")
+
+
+def test_request_key_locks_are_released():
+    hunter = client(FakeSession())
+    for first in ("asha", "vikram", "meera"):
+        hunter.email_finder("acme.com", first, "rao")
+    assert hunter._key_locks == {}
+
+
+def test_parsed_leads_need_an_email():
+    leads = parse_leads_table(SCOUT_TABLE)
+    assert len(leads) == 2
+    assert not any(has_real_email(lead) for lead in leads)
+
+
+def test_parsed_scout_output_is_enriched():
+    session = FakeSession()
+    leads = parse_leads_table(SCOUT_TABLE)
+    found = client(session).enrich_leads(leads, lambda company: company.split()[0].lower() + ".com")
+    assert found == {
+        lead_id(leads[0]): ("asha@acme.com", "Found (confidence: 91%)"),
+        lead_id(leads[1]): ("vikram@brightline.com", "Found (confidence: 91%)"),
+    }
+    assert len(session.calls) == 2
+
+
+def test_only_leads_without_a_real_email_are_looked_up():
+    session = FakeSession()
+    leads = parse_leads_table(SCOUT_TABLE)
+    leads[0]["email"] = "asha@acme.com"
+    leads[1]["email"] = "Pending extraction"  # runs archived before emails were stored blank
+    found = client(session).enrich_leads(leads, lambda company: "example.com")
+    assert list(found) == [lead_id(leads[1])]
+    assert [call["first_name"] for call in session.calls] == ["vikram"]
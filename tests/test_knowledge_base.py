@@ -0,0 +1,53 @@
+"""KnowledgeBase chunk IDs and scoped search, with deterministic fake embeddings."""
+
+import hashlib
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from knowledge_base import KnowledgeBase  # noqa: E402
+from rag_index import CachedEmbeddings  # noqa: E402
+
+
+class HashEmbeddings:
+    def _vector(self, text):
+        return [byte / 255 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:16]]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def knowledge_base(folder):
+    return KnowledgeBase(str(folder), CachedEmbeddings(HashEmbeddings(), None, "hash"))
+
+
+def chunks(owner, count, page):
+    ids = [f"doc-1-{page}-{n}" for n in range(count)]
+    return [f"{owner} page {page} chunk {n}" for n in range(count)], [dict(owner=owner, kind="document")] * count, ids
+
+
+def test_repeated_batch_is_skipped_after_a_reload(tmp_path):
+    kb = knowledge_base(tmp_path)
+    texts, metadatas, ids = chunks("a", 3, 1)
+    assert kb.add_chunks(texts, metadatas, ids=ids) == 3
+    assert kb.add_chunks(texts, metadatas, ids=ids) == 0
+
+    resumed = knowledge_base(tmp_path)  # as after a crash: the ID set is rebuilt from the saved index
+    more_texts, more_metadatas, more_ids = chunks("a", 2, 2)
+    assert resumed.add_chunks(texts + more_texts, metadatas + more_metadatas, ids=ids + more_ids) == 2
+    assert resumed._index.index.ntotal == 5
+    assert resumed._ids == set(ids + more_ids)
+
+
+def test_scoped_search_is_not_crowded_out_by_other_owners(tmp_path):
+    kb = knowledge_base(tmp_path)
+    for page in range(20):
+        kb.add_chunks(*chunks("busy", 10, page))
+    kb.add_chunks(["quiet owner's only chunk"], [dict(owner="quiet", kind="document")])
+    found = kb.search("busy page 3 chunk 1", "quiet", kinds=("document",))
+    assert [doc.page_content for doc in found] == ["quiet owner's only chunk"]
@@ -0,0 +1,113 @@
+"""ModelRouter routing and failover, with StubProvider and a fake Anthropic SDK client."""
+
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from llm_gateway import GatewayError
+from model_router import AnthropicProvider, ModelRouter, StubProvider
+
+
+class FakeMessages:
+    """``client.messages`` of the Anthropic SDK: ``stream()`` fails to connect or yields ``pieces``."""
+
+    def __init__(self, pieces=(), error=None):
+        self.pieces = pieces
+        self.error = error
+        self.requests = []
+
+    @contextlib.contextmanager
+    def stream(self, **request):
+        self.requests.append(request)
+        if self.error is not None:
+            raise self.error
+        yield SimpleNamespace(text_stream=iter(self.pieces))
+
+
+def claude(messages):
+    provider = AnthropicProvider("test-key", "claude-3-5-haiku-latest")
+    provider._client = SimpleNamespace(messages=messages)
+    return provider
+
+
+def test_claude_prefill_is_sent_with_the_first_chunk():
+    messages = FakeMessages(["", '{"company": "Acme"}', ', {"company": "Bolt"}]'])
+    seen = []
+    text, model = claude(messages).generate("prompt", on_text=seen.append, json_mode="array")
+    assert text == '[{"company": "Acme"}, {"company": "Bolt"}]'
+    assert seen[0] == '[{"company": "Acme"}'
+    assert messages.requests[0]["messages"][-1] == {"role": "assistant", "content": "["}
+
+
+def test_claude_failing_to_connect_fails_over_without_emitting_the_prefill():
+    backup = StubProvider("backup", reply='[{"company": "Acme"}]', chunk_size=5)
+    router = ModelRouter([claude(FakeMessages(error=ConnectionError("refused"))), backup], strategy="ordered")
+    seen = []
+    text, provider, _ = router.generate("prompt", on_text=seen.append, json_mode="array")
+    assert (text, provider) == ('[{"company": "Acme"}]', "backup")
+    assert "".join(seen) == text
+
+
+def test_ordered_strategy_follows_the_route():
+    first, second = StubProvider("first", reply="1"), StubProvider("second", reply="2")
+    router = ModelRouter([first, second], routes={"default": ["second", "first"]}, strategy="ordered")
+    assert [router.generate("prompt")[1] for _ in range(3)] == ["second"] * 3
+    assert first.calls == 0
+
+
+def test_cost_strategy_prefers_the_cheaper_model():
+    dear = StubProvider("dear", reply="d", model="dear-model")
+    cheap = StubProvider("cheap", reply="c", model="cheap-model")
+    router = ModelRouter([dear, cheap], strategy="cost",
+                         prices={"dear-model": (5.0, 15.0), "cheap-model": (0.1, 0.4)})
+    assert router.candidates(prompt="prompt") == ["cheap", "dear"]
+    assert router.generate("prompt")[1] == "cheap"
+
+
+def test_latency_strategy_measures_each_provider_then_prefers_the_faster():
+    slow = StubProvider("slow", reply="s", latency=0.05)
+    fast = StubProvider("fast", reply="f")
+    router = ModelRouter([slow, fast], strategy="latency")
+    assert [router.generate("prompt")[1] for _ in range(3)] == ["slow", "fast", "fast"]
+
+
+def test_error_before_the_first_chunk_fails_over_and_cools_the_provider_down():
+    flaky = StubProvider("flaky", reply="x", errors=[RuntimeError("boom")])
+    backup = StubProvider("backup", reply="hello world", chunk_size=3)
+    router = ModelRouter([flaky, backup], strategy="ordered")
+    seen = []
+    assert router.generate("prompt", on_text=seen.append)[:2] == ("hello world", "backup")
+    assert "".join(seen) == "hello world"
+    stats = router.stats()
+    assert stats["flaky"]["errors"] == 1 and stats["flaky"]["cooling"] > 0
+    assert router.generate("prompt")[1] == "backup"
+    assert flaky.calls == 1
+
+
+class BreaksMidStream(StubProvider):
+    """Streams the first chunk of its reply, then fails."""
+
+    def generate(self, prompt, on_text=None, json_mode=None):
+        self.calls += 1
+        if on_text:
+            on_text(self.reply[:self.chunk_size])
+        raise ConnectionError("connection reset")
+
+
+def test_error_after_text_was_emitted_is_not_failed_over():
+    broken = BreaksMidStream("broken", reply='[{"company": "Acme"}]', chunk_size=4)
+    backup = StubProvider("backup", reply="[]")
+    router = ModelRouter([broken, backup], strategy="ordered")
+    seen = []
+    with pytest.raises(GatewayError, match="part-way"):
+        router.generate("prompt", on_text=seen.append)
+    assert seen == ['[{"c']
+    assert backup.calls == 0
+
+
+def test_error_without_streaming_still_fails_over():
+    broken = BreaksMidStream("broken", reply="x")
+    backup = StubProvider("backup", reply="ok")
+    router = ModelRouter([broken, backup], strategy="ordered")
+    assert router.generate("prompt")[:2] == ("ok", "backup")
@@ -0,0 +1,49 @@
+"""OTPStore send limits: email and IP windows of different lengths, in memory and in SQLite."""
+
+import pytest
+
+import otp_store
+from otp_store import OTPStore
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(otp_store.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def db_path(request, tmp_path):
+    return str(tmp_path / "otp.sqlite3") if request.param == "sqlite" else None
+
+
+def test_email_hits_do_not_reset_an_ip_window(clock, db_path):
+    store = OTPStore(email_limit=(3, 600), ip_limit=(10, 3600), db_path=db_path)
+    for n in range(10):
+        assert store.issue(f"user{n}@example.com", ip="1.2.3.4")[1] is None
+    assert store.issue("user10@example.com", ip="1.2.3.4")[1] is not None
+
+    clock.now += 700  # past the email window, well inside the IP window
+    assert store.issue("someone@example.com", ip="5.6.7.8")[1] is None
+    assert store.issue("user11@example.com", ip="1.2.3.4")[1] is not None
+
+    clock.now += 3600
+    assert store.issue("user12@example.com", ip="1.2.3.4")[1] is None
+
+
+def test_email_window_resets_after_its_own_length(clock, db_path):
+    store = OTPStore(email_limit=(3, 600), ip_limit=(10, 3600), db_path=db_path)
+    for _ in range(3):
+        assert store.issue("a@example.com")[1] is None
+    assert store.issue("a@example.com")[1] is not None
+    clock.now += 601
+    assert store.issue("a@example.com")[1] is None
@@ -0,0 +1,13 @@
+"""DiskCache hit accounting when the caller rejects a cached value."""
+
+from response_cache import DiskCache
+
+
+def test_rejected_value_counts_as_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("broken", "[{\"company\": ")
+    cache.set("good", "[]")
+    assert cache.get_first(["broken"], accept=lambda text: text == "[]") is None
+    assert cache.get_first(["broken", "good"], accept=lambda text: text == "[]") == ("good", "[]")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,94 @@
+"""run_sharded_agent: replies are joined to leads by ID or company, never by position."""
+
+import json
+
+from agents import parse_leads_table, run_sharded_agent
+from handoff import lead_id
+from json_stream import stream_objects
+
+SCOUT_TABLE = """| Company | Address | First | Last | Phone | Role | Why | Sector | Deal | LinkedIn |
+| Alpha Foods | Peenya | Asha | Rao | +91 9800000001 | COO | Cold storage | FMCG | ₹12L | SEARCH |
+| Beta Pharma | Hosur Road | Vikram | Shah | +91 9800000002 | Head of Ops | Expanding | Pharma | ₹30L | SEARCH |
+"""
+
+
+def strategy(company, id=None):
+    item = {"company": company, "priority": "HOT", "deal_score": 80}
+    return dict(item, id=id) if id else item
+
+
+class ScriptedAgent:
+    """``agent_call(shard, note)``: the first reply for every call, then the re-ask reply."""
+
+    def __init__(self, first, reask):
+        self.first = first
+        self.reask = reask
+        self.calls = []
+
+    def __call__(self, shard, note, on_item=None):
+        self.calls.append(([lead_id(lead) for lead in shard], note))
+        reply = json.dumps(self.reask(shard) if note else self.first)
+        if on_item:
+            stream_objects(on_item)(reply)
+        return reply
+
+
+def test_reworded_reordered_reply_is_not_joined_by_position():
+    alpha, beta = parse_leads_table(SCOUT_TABLE)
+    agent = ScriptedAgent(
+        first=[strategy("Beta Pharma Pvt Ltd"), strategy("Alpha Foods Limited")],
+        reask=lambda shard: [strategy(lead["company"], id=lead_id(lead)) for lead in reversed(shard)],
+    )
+    items, failed = run_sharded_agent("strategist", agent, [[alpha, beta]], max_workers=2)
+    assert failed == []
+    assert [(item["id"], item["company"]) for item in items] == [
+        (lead_id(alpha), "Alpha Foods"), (lead_id(beta), "Beta Pharma")]
+    assert agent.calls[1][0] == [lead_id(alpha), lead_id(beta)]  # the re-ask names both leads by ID
+
+
+def test_unmatched_items_are_kept_unassigned_when_the_reask_fails_too():
+    alpha, beta = parse_leads_table(SCOUT_TABLE)
+    reworded = [strategy("Beta Pharma Pvt Ltd"), strategy("Alpha Foods Limited")]
+    agent = ScriptedAgent(first=reworded, reask=lambda shard: reworded)
+    items, failed = run_sharded_agent("strategist", agent, [[alpha, beta]], max_workers=2)
+    assert failed == ["Alpha Foods", "Beta Pharma"]
+    assert all("id" not in item for item in items)
+    assert [item["company"] for item in items] == ["Beta Pharma Pvt Ltd", "Alpha Foods Limited"]
+
+
+def test_only_items_that_will_be_kept_are_streamed():
+    alpha, beta = parse_leads_table(SCOUT_TABLE)
+    first = [strategy("Beta Pharma Pvt Ltd"), dict(strategy("Alpha Foods"), priority="SOMEDAY"),
+             strategy("Alpha Foods", id=lead_id(alpha))]
+    agent = ScriptedAgent(first=first, reask=lambda shard: [strategy(lead["company"], id=lead_id(lead)) for lead in shard])
+    drawn = []
+    items, failed = run_sharded_agent("strategist", agent, [[alpha, beta]], max_workers=2, on_item=drawn.append)
+    assert failed == []
+    assert [(item["id"], item["company"]) for item in drawn] == [
+        (lead_id(alpha), "Alpha Foods"), (lead_id(beta), "Beta Pharma")]
+    assert [item["id"] for item in items] == [lead_id(alpha), lead_id(beta)]
+
+
+class BreaksAfterFirstItem(ScriptedAgent):
+    """Streams the first object of its reply, then the call fails."""
+
+    def __call__(self, shard, note, on_item=None):
+        if note:
+            return super().__call__(shard, note, on_item)
+        self.calls.append(([lead_id(lead) for lead in shard], note))
+        stream_objects(on_item)(json.dumps(self.first)[:-30])
+        raise ConnectionError("stream broke part-way")
+
+
+def test_items_streamed_before_a_failure_are_kept_and_not_asked_again():
+    alpha, beta = parse_leads_table(SCOUT_TABLE)
+    agent = BreaksAfterFirstItem(
+        first=[strategy("Alpha Foods", id=lead_id(alpha)), strategy("Beta Pharma", id=lead_id(beta))],
+        reask=lambda shard: [strategy(lead["company"], id=lead_id(lead)) for lead in shard],
+    )
+    drawn = []
+    items, failed = run_sharded_agent("strategist", agent, [[alpha, beta]], max_workers=2, on_item=drawn.append)
+    assert failed == []
+    assert [item["company"] for item in drawn] == ["Alpha Foods", "Beta Pharma"]
+    assert agent.calls[1][0] == [lead_id(beta)]
+    assert [item["id"] for item in items] == [lead_id(alpha), lead_id(beta)]